@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Tool for measuring the throughput of sample augmentations on a sample collection without training
+Use "python3 benchmark_augmentations.py -h" for help
+"""
+
+import sys
+import json
+import time
+import argparse
+import progressbar
+
+from deepspeech_training.util.downloader import SIMPLE_BAR
+from deepspeech_training.util.profiling import Timings, format_summary
+from deepspeech_training.util.sample_collections import samples_from_sources
+from deepspeech_training.util.augmentations import parse_augmentations, apply_sample_augmentations, SampleAugmentation
+
+
+def benchmark_augmentations():
+    augmentations = parse_augmentations(CLI_ARGS.augment)
+    if any(not isinstance(a, SampleAugmentation) for a in augmentations):
+        print('Warning: Some of the specified augmentations will not get applied, as this tool only supports '
+              'overlay, codec, reverb, resample and volume.')
+    samples = samples_from_sources(CLI_ARGS.sources, buffering=CLI_ARGS.read_buffer, labeled=False)
+    num_samples = len(samples) if CLI_ARGS.limit <= 0 else min(CLI_ARGS.limit, len(samples))
+    timings = Timings()
+    start = time.perf_counter()
+    audio_duration = 0.0
+    bar = progressbar.ProgressBar(max_value=num_samples, widgets=SIMPLE_BAR)
+    augmented = apply_sample_augmentations(samples,
+                                           augmentations,
+                                           buffering=CLI_ARGS.read_buffer,
+                                           process_ahead=CLI_ARGS.process_ahead,
+                                           clock=CLI_ARGS.clock,
+                                           timings=timings)
+    for sample_index, sample in enumerate(bar(augmented)):
+        audio_duration += len(sample.audio) / sample.audio_format.rate
+        if sample_index + 1 >= num_samples:
+            break
+    wall_time = time.perf_counter() - start
+    report = {
+        'samples': num_samples,
+        'wall_time': wall_time,
+        'samples_per_second': num_samples / wall_time,
+        'audio_seconds_per_second': audio_duration / wall_time,
+        'operations': timings.summary()
+    }
+    if CLI_ARGS.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print('Processed {} samples ({:.1f} s of audio) in {:.2f} s: {:.1f} samples/s, {:.1f}x real-time'.format(
+            num_samples, audio_duration, wall_time, report['samples_per_second'], report['audio_seconds_per_second']))
+        print(format_summary(report['operations']))
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Tool for measuring the throughput of sample augmentations on a sample collection without training'
+    )
+    parser.add_argument('sources', nargs='+', help='Sample DB (SDB) or CSV files to read samples from')
+    parser.add_argument('--augment', action='append', help='Add an augmentation operation')
+    parser.add_argument('--limit', type=int, default=0, help='Maximum number of samples to process (0 for all)')
+    parser.add_argument('--clock', type=float, default=0.5,
+                        help='Simulates clock value used for augmentations during training. '
+                        'Ranges from 0.0 (representing parameter start values) to '
+                        '1.0 (representing parameter end values)')
+    parser.add_argument('--process_ahead', type=int, default=None,
+                        help='Number of samples to pre-process ahead of time - 0 for processing in a single process')
+    parser.add_argument('--read_buffer', type=int, default=1024 * 1024, help='Buffer size for reading sample files')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    CLI_ARGS = handle_args()
+    if not CLI_ARGS.augment:
+        print('No augmentations specified - measuring loading and conversion only')
+    try:
+        benchmark_augmentations()
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -16,44 +16,58 @@ from deepspeech_training.util.audio import (
 )
 from deepspeech_training.util.downloader import SIMPLE_BAR
 from deepspeech_training.util.sample_collections import (
+    EPOCH_PLACEHOLDER,
     CSVWriter,
     DirectSDBWriter,
     TarWriter,
+    TFRecordWriter,
     samples_from_sources,
 )
 from deepspeech_training.util.augmentations import (
     parse_augmentations,
     apply_sample_augmentations,
+    Overlay,
     SampleAugmentation
 )
 
 AUDIO_TYPE_LOOKUP = {'wav': AUDIO_TYPE_WAV, 'opus': AUDIO_TYPE_OPUS}
 
 
-def build_data_set():
+def create_writer(target, audio_type, labeled):
+    extension = Path(target).suffix.lower()
+    if extension == '.csv':
+        return CSVWriter(target, absolute_paths=CLI_ARGS.absolute_paths, labeled=labeled)
+    if extension == '.sdb':
+        return DirectSDBWriter(target, audio_type=audio_type, labeled=labeled)
+    if extension == '.tar':
+        return TarWriter(target, labeled=labeled, gz=False, include=CLI_ARGS.include)
+    if extension == '.tgz' or target.lower().endswith('.tar.gz'):
+        return TarWriter(target, labeled=labeled, gz=True, include=CLI_ARGS.include)
+    if extension == '.tfrecord':
+        return TFRecordWriter(target, num_shards=CLI_ARGS.shards, labeled=labeled)
+    print('Unknown extension of target file - has to be either .csv, .sdb, .tar, .tar.gz, .tgz or .tfrecord')
+    sys.exit(1)
+
+
+def build_data_set(target, augmentations, epoch=None):
     audio_type = AUDIO_TYPE_LOOKUP[CLI_ARGS.audio_type]
-    augmentations = parse_augmentations(CLI_ARGS.augment)
-    if any(not isinstance(a, SampleAugmentation) for a in augmentations):
-        print('Warning: Some of the specified augmentations will not get applied, as this tool only supports '
-              'overlay, codec, reverb, resample and volume.')
-    extension = Path(CLI_ARGS.target).suffix.lower()
     labeled = not CLI_ARGS.unlabeled
-    if extension == '.csv':
-        writer = CSVWriter(CLI_ARGS.target, absolute_paths=CLI_ARGS.absolute_paths, labeled=labeled)
-    elif extension == '.sdb':
-        writer = DirectSDBWriter(CLI_ARGS.target, audio_type=audio_type, labeled=labeled)
-    elif extension == '.tar':
-        writer = TarWriter(CLI_ARGS.target, labeled=labeled, gz=False, include=CLI_ARGS.include)
-    elif extension == '.tgz' or CLI_ARGS.target.lower().endswith('.tar.gz'):
-        writer = TarWriter(CLI_ARGS.target, labeled=labeled, gz=True, include=CLI_ARGS.include)
-    else:
-        print('Unknown extension of target file - has to be either .csv, .sdb, .tar, .tar.gz or .tgz')
-        sys.exit(1)
-    with writer:
-        samples = samples_from_sources(CLI_ARGS.sources, labeled=not CLI_ARGS.unlabeled)
+    with create_writer(target, audio_type, labeled) as writer:
+        samples = samples_from_sources(CLI_ARGS.sources, labeled=labeled)
         num_samples = len(samples)
         if augmentations:
-            samples = apply_sample_augmentations(samples, audio_type=AUDIO_TYPE_PCM, augmentations=augmentations)
+            clock, final_clock = 0.0, None
+            if epoch is not None:
+                # Same clock values as the training epoch would use
+                clock, final_clock = epoch / CLI_ARGS.total_epochs, (epoch + 1) / CLI_ARGS.total_epochs
+            samples = apply_sample_augmentations(samples,
+                                                 audio_type=AUDIO_TYPE_PCM,
+                                                 augmentations=augmentations,
+                                                 process_ahead=CLI_ARGS.process_ahead,
+                                                 clock=clock,
+                                                 final_clock=final_clock,
+                                                 seed=CLI_ARGS.seed,
+                                                 epoch=0 if epoch is None else epoch)
         bar = progressbar.ProgressBar(max_value=num_samples, widgets=SIMPLE_BAR)
         for sample in bar(change_audio_types(
                 samples,
@@ -63,6 +77,27 @@ def build_data_set():
             writer.add(sample)
 
 
+def build_data_sets():
+    augmentations = parse_augmentations(CLI_ARGS.augment)
+    if any(not isinstance(a, SampleAugmentation) for a in augmentations):
+        print('Warning: Some of the specified augmentations will not get applied, as this tool only supports '
+              'overlay, codec, reverb, resample and volume.')
+    if CLI_ARGS.epochs is None:
+        build_data_set(CLI_ARGS.target, augmentations)
+        return
+    if EPOCH_PLACEHOLDER not in CLI_ARGS.target:
+        print('Target has to contain placeholder "{}" for writing multiple epochs'.format(EPOCH_PLACEHOLDER))
+        sys.exit(1)
+    if CLI_ARGS.total_epochs is None:
+        CLI_ARGS.total_epochs = CLI_ARGS.first_epoch + CLI_ARGS.epochs
+    if any(isinstance(a, Overlay) and a.mode != 'random' for a in augmentations):
+        print('Warning: Overlay augmentations are only reproducible in mode "random".')
+    for epoch in range(CLI_ARGS.first_epoch, CLI_ARGS.first_epoch + CLI_ARGS.epochs):
+        target = CLI_ARGS.target.replace(EPOCH_PLACEHOLDER, str(epoch))
+        print('Writing epoch {} to "{}"...'.format(epoch, target))
+        build_data_set(target, augmentations, epoch=epoch)
+
+
 def handle_args():
     parser = argparse.ArgumentParser(
         description='Tool for building a combined SDB or CSV sample-set from other sets'
@@ -76,7 +111,8 @@ def handle_args():
     )
     parser.add_argument(
         'target',
-        help='SDB, CSV or TAR(.gz) file to create'
+        help='SDB, CSV, TAR(.gz) or TFRecord file to create - '
+        'has to contain placeholder {epoch} (e.g. "train-{epoch}.sdb") if --epochs is used'
     )
     parser.add_argument(
         '--audio-type',
@@ -108,6 +144,46 @@ def handle_args():
         action='append',
         help='Add an augmentation operation',
     )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=1,
+        help='Number of files to distribute the samples of .tfrecord targets to - '
+        'files are named <target-name>-<index>-of-<shards>.tfrecord, but get referenced by the target name',
+    )
+    parser.add_argument(
+        '--epochs',
+        type=int,
+        default=None,
+        help='Number of augmented epochs to write - one target per epoch, each one using the augmentation clock '
+        'values of the respective training epoch. Training can then use the target name (including placeholder '
+        '{epoch}) as --train_files.',
+    )
+    parser.add_argument(
+        '--first_epoch',
+        type=int,
+        default=0,
+        help='Index of the first epoch to write (e.g. for distributing epochs to several machines)',
+    )
+    parser.add_argument(
+        '--total_epochs',
+        type=int,
+        default=None,
+        help='Total number of training epochs for computing augmentation clock values - '
+        'defaults to --first_epoch + --epochs',
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='Seed for reproducible augmentations - same as --augmentation_seed of training',
+    )
+    parser.add_argument(
+        '--process_ahead',
+        type=int,
+        default=None,
+        help='Number of samples to augment ahead of time in parallel',
+    )
     parser.add_argument(
         '--include',
         action='append',
@@ -118,4 +194,4 @@ def handle_args():
 
 if __name__ == '__main__':
     CLI_ARGS = handle_args()
-    build_data_set()
+    build_data_sets()
@@ -8,7 +8,6 @@ Use "python3 import_cv2.py -h" for help
 """
 import csv
 import os
-import subprocess
 import unicodedata
 from multiprocessing import Pool
 
@@ -23,12 +22,14 @@ from deepspeech_training.util.importers import (
     get_validate_label,
     print_import_report,
 )
+from deepspeech_training.util.probing import probe_audio_files
 from ds_ctcdecoder import Alphabet
 
 FIELDNAMES = ["wav_filename", "wav_filesize", "transcript"]
 SAMPLE_RATE = 16000
 CHANNELS = 1
 MAX_SECS = 10
+PROBE_CACHE_FILENAME = "probe_cache.sqlite"
 PARAMS = None
 FILTER_OBJ = None
 
@@ -55,23 +56,29 @@ def init_worker(params):
     FILTER_OBJ = LabelFilter(params.normalize, alphabet, validate_label)
 
 
-def one_sample(sample):
-    """ Take an audio file, and optionally convert it to 16kHz WAV """
-    mp3_filename = sample[0]
+def get_wav_filename(mp3_filename):
     if not os.path.splitext(mp3_filename.lower())[1] == ".mp3":
         mp3_filename += ".mp3"
     # Storing wav files next to the mp3 ones - just with a different suffix
-    wav_filename = os.path.splitext(mp3_filename)[0] + ".wav"
+    return mp3_filename, os.path.splitext(mp3_filename)[0] + ".wav"
+
+
+def convert_sample(sample):
+    """ Take an audio file, and optionally convert it to 16kHz WAV """
+    mp3_filename, wav_filename = get_wav_filename(sample[0])
     _maybe_convert_wav(mp3_filename, wav_filename)
+    return wav_filename
+
+
+def one_sample(sample):
+    """ Filter a converted sample by its probed duration and its label """
+    probe = sample[3]
+    wav_filename = probe.path
     file_size = -1
     frames = 0
-    if os.path.exists(wav_filename):
-        file_size = os.path.getsize(wav_filename)
-        frames = int(
-            subprocess.check_output(
-                ["soxi", "-s", wav_filename], stderr=subprocess.STDOUT
-            )
-        )
+    if probe.audio_format is not None:
+        file_size = probe.size
+        frames = probe.num_samples
     label = FILTER_OBJ.filter(sample[1])
     rows = []
     counter = get_counter()
@@ -121,9 +128,21 @@ def _maybe_convert_set(dataset, tsv_dir, audio_dir, filter_obj, space_after_ever
         counter = get_counter()
         num_samples = len(samples)
 
-        print("Importing mp3 files...")
+        print("Converting mp3 files...")
         pool = Pool(initializer=init_worker, initargs=(PARAMS,))
         bar = progressbar.ProgressBar(max_value=num_samples, widgets=SIMPLE_BAR)
+        wav_filenames = []
+        for i, wav_filename in enumerate(pool.imap(convert_sample, samples), start=1):
+            wav_filenames.append(wav_filename)
+            bar.update(i)
+        bar.update(num_samples)
+
+        print("Probing wav files...")
+        probes = probe_audio_files(wav_filenames, cache_path=os.path.join(audio_dir, PROBE_CACHE_FILENAME))
+        samples = [sample + (probe,) for sample, probe in zip(samples, probes)]
+
+        print("Importing samples...")
+        bar = progressbar.ProgressBar(max_value=num_samples, widgets=SIMPLE_BAR)
         for i, processed in enumerate(pool.imap_unordered(one_sample, samples), start=1):
             counter += processed[0]
             rows += processed[1]
@@ -17,10 +17,15 @@ if platform.system().lower() == "windows":
         # directory for the dynamic linker
         os.environ['PATH'] = dslib_path + ';' + os.environ['PATH']
 
+from timeit import default_timer as timer
+
+import numpy as np
+
 import deepspeech
 
 # rename for backwards compatibility
 from deepspeech.impl import Version as version
+from deepspeech.vad import GatedStream
 
 class Model(object):
     """
@@ -32,6 +37,7 @@ class Model(object):
     def __init__(self, model_path):
         # make sure the attribute is there if CreateModel fails
         self._impl = None
+        self._scorer_path = None
 
         status, impl = deepspeech.impl.CreateModel(model_path)
         if status != 0:
@@ -86,6 +92,7 @@ class Model(object):
         status = deepspeech.impl.EnableExternalScorer(self._impl, scorer_path)
         if status != 0:
             raise RuntimeError("EnableExternalScorer failed with '{}' (0x{:X})".format(deepspeech.impl.ErrorCodeToErrorMessage(status),status))
+        self._scorer_path = scorer_path
 
     def disableExternalScorer(self):
         """
@@ -93,6 +100,7 @@ class Model(object):
 
         :return: Zero on success, non-zero on failure.
         """
+        self._scorer_path = None
         return deepspeech.impl.DisableExternalScorer(self._impl)
 
     def addHotWord(self, word, boost):
@@ -156,7 +164,10 @@ class Model(object):
         Use the DeepSpeech model to perform Speech-To-Text.
 
         :param audio_buffer: A 16-bit, mono raw audio signal at the appropriate sample rate (matching what the model was trained on).
-        :type audio_buffer: numpy.int16 array
+                             Any C-contiguous buffer is accepted without copying: bytes, bytearray, memoryview or array.array
+                             holding 16-bit samples or a NumPy int16 array. Float32 samples in [-1.0, 1.0] get converted natively.
+                             Other array-likes (like lists or non-contiguous and byte-swapped arrays) get converted by NumPy.
+        :type audio_buffer: buffer
 
         :return: The STT result.
         :type: str
@@ -168,7 +179,10 @@ class Model(object):
         Use the DeepSpeech model to perform Speech-To-Text and return results including metadata.
 
         :param audio_buffer: A 16-bit, mono raw audio signal at the appropriate sample rate (matching what the model was trained on).
-        :type audio_buffer: numpy.int16 array
+                             Any C-contiguous buffer is accepted without copying: bytes, bytearray, memoryview or array.array
+                             holding 16-bit samples or a NumPy int16 array. Float32 samples in [-1.0, 1.0] get converted natively.
+                             Other array-likes (like lists or non-contiguous and byte-swapped arrays) get converted by NumPy.
+        :type audio_buffer: buffer
 
         :param num_results: Maximum number of candidate transcripts to return. Returned list might be smaller than this.
         :type num_results: int
@@ -178,6 +192,44 @@ class Model(object):
         """
         return deepspeech.impl.SpeechToTextWithMetadata(self._impl, audio_buffer, num_results)
 
+    def warmup(self, duration=1.0, chunk_duration=0.32, seed=0):
+        """
+        Run synthetic audio through the complete inference pipeline (streaming feed, intermediate and final decoding,
+        batch inference) so that first-inference allocations happen before serving real requests.
+        If an external scorer is enabled, its file gets read once to page in the lazily memory-mapped language model.
+
+        :param duration: Duration of the synthetic audio in seconds
+        :type duration: float
+
+        :param chunk_duration: Duration of the chunks fed to the warm-up stream in seconds
+        :type chunk_duration: float
+
+        :param seed: Seed of the noise added to the synthetic audio
+        :type seed: int
+
+        :return: Time the warm-up took in seconds.
+        :type: float
+        """
+        start = timer()
+        if self._scorer_path is not None:
+            chunk = bytearray(1 << 22)
+            with open(self._scorer_path, 'rb') as scorer_file:
+                while scorer_file.readinto(chunk):
+                    pass
+        sample_rate = self.sampleRate()
+        num_samples = int(duration * sample_rate)
+        chunk_size = max(1, int(chunk_duration * sample_rate))
+        time = np.arange(num_samples) / sample_rate
+        audio = 3000 * np.sin(2 * np.pi * 220 * time) + np.random.RandomState(seed).normal(0, 300, num_samples)
+        audio = np.clip(audio, -(1 << 15), (1 << 15) - 1).astype(np.int16)
+        stream = self.createStream()
+        for offset in range(0, num_samples, chunk_size):
+            stream.feedAudioContent(audio[offset:offset + chunk_size])
+            stream.intermediateDecode()
+        stream.finishStreamWithMetadata()
+        self.stt(audio)
+        return timer() - start
+
     def createStream(self):
         """
         Create a new streaming inference state. The streaming state returned by
@@ -193,6 +245,50 @@ class Model(object):
             raise RuntimeError("CreateStream failed with '{}' (0x{:X})".format(deepspeech.impl.ErrorCodeToErrorMessage(status),status))
         return Stream(ctx)
 
+    def createGatedStream(self, aggressiveness=3, frame_duration_ms=30, num_padding_frames=10, threshold=0.5,
+                          silence_timeout_ms=None, on_silence='finish', energy_threshold_dbfs=None):
+        """
+        Create a new streaming inference state that only passes voiced audio on to the acoustic model.
+        Incoming audio is cut into frames and classified by WebRTC VAD (package `webrtcvad`) or, if
+        that is not installed or `energy_threshold_dbfs` is given, by a frame energy detector.
+        Unvoiced frames are held back, keeping `num_padding_frames` frames of context around voiced
+        regions (same logic as the training code's VAD splitting).
+
+        :param aggressiveness: WebRTC VAD aggressiveness (0 to 3).
+        :type aggressiveness: int
+
+        :param frame_duration_ms: VAD frame duration in milliseconds (10, 20 or 30).
+        :type frame_duration_ms: int
+
+        :param num_padding_frames: Number of frames of padding context kept around voiced regions.
+        :type num_padding_frames: int
+
+        :param threshold: Fraction of voiced (unvoiced) padding frames that starts (ends) a voiced region.
+        :type threshold: float
+
+        :param silence_timeout_ms: If set, a silence of at least this duration after voiced audio automatically finishes or resets the underlying stream.
+        :type silence_timeout_ms: int
+
+        :param on_silence: What to do on a silence timeout: "finish" decodes the segment and appends its transcript to :func:`GatedStream.segments`, "reset" discards it.
+        :type on_silence: str
+
+        :param energy_threshold_dbfs: Use the energy detector with this threshold (RMS dBFS) instead of WebRTC VAD.
+        :type energy_threshold_dbfs: float
+
+        :return: Stream object representing the newly created stream
+        :type: :func:`GatedStream`
+
+        :throws: RuntimeError on error
+        """
+        return GatedStream(self,
+                           aggressiveness=aggressiveness,
+                           frame_duration_ms=frame_duration_ms,
+                           num_padding_frames=num_padding_frames,
+                           threshold=threshold,
+                           silence_timeout_ms=silence_timeout_ms,
+                           on_silence=on_silence,
+                           energy_threshold_dbfs=energy_threshold_dbfs)
+
 
 class Stream(object):
     """
@@ -211,7 +307,10 @@ class Stream(object):
         Feed audio samples to an ongoing streaming inference.
 
         :param audio_buffer: A 16-bit, mono raw audio signal at the appropriate sample rate (matching what the model was trained on).
-        :type audio_buffer: numpy.int16 array
+                             Any C-contiguous buffer is accepted without copying: bytes, bytearray, memoryview or array.array
+                             holding 16-bit samples or a NumPy int16 array. Float32 samples in [-1.0, 1.0] get converted natively.
+                             Other array-likes (like lists or non-contiguous and byte-swapped arrays) get converted by NumPy.
+        :type audio_buffer: buffer
 
         :throws: RuntimeError if the stream object is not valid
         """
@@ -20,6 +20,10 @@ except ImportError:
 
 
 def convert_samplerate(audio_path, desired_sample_rate):
+    try:
+        return resample_wav(audio_path, desired_sample_rate)
+    except (ImportError, ValueError):
+        pass
     sox_cmd = 'sox {} --type raw --bits 16 --channels 1 --rate {} --encoding signed-integer --endian little --compression 0.0 --no-dither - '.format(quote(audio_path), desired_sample_rate)
     try:
         output = subprocess.check_output(shlex.split(sox_cmd), stderr=subprocess.PIPE)
@@ -31,6 +35,17 @@ def convert_samplerate(audio_path, desired_sample_rate):
     return desired_sample_rate, np.frombuffer(output, np.int16)
 
 
+def resample_wav(audio_path, desired_sample_rate):
+    import resampy  # pylint: disable=import-outside-toplevel
+    with wave.open(audio_path, 'rb') as fin:
+        if fin.getsampwidth() != 2:
+            raise ValueError('In-process resampling requires 16 bit samples')
+        audio = np.frombuffer(fin.readframes(fin.getnframes()), np.int16)
+        audio = audio.reshape((-1, fin.getnchannels())).mean(axis=1, dtype=np.float32)
+        audio = resampy.resample(audio, fin.getframerate(), desired_sample_rate, filter='kaiser_fast')
+    return desired_sample_rate, np.clip(np.round(audio), -(1 << 15), (1 << 15) - 1).astype(np.int16)
+
+
 def metadata_to_string(metadata):
     return ''.join(token.text for token in metadata.tokens)
 
@@ -78,6 +93,86 @@ def metadata_json_output(metadata):
 
 
 
+def read_audio(audio_path, desired_sample_rate):
+    fin = wave.open(audio_path, 'rb')
+    fs_orig = fin.getframerate()
+    if fs_orig != desired_sample_rate:
+        print('Warning: original sample rate ({}) is different than {}hz. Resampling might produce erratic speech recognition.'.format(fs_orig, desired_sample_rate), file=sys.stderr)
+        fs_new, audio = convert_samplerate(audio_path, desired_sample_rate)
+    else:
+        audio = np.frombuffer(fin.readframes(fin.getnframes()), np.int16)
+
+    audio_length = fin.getnframes() * (1/fs_orig)
+    fin.close()
+    return audio, audio_length
+
+
+def load_model(args):
+    ds = Model(args.model)
+    if args.beam_width:
+        ds.setBeamWidth(args.beam_width)
+    if args.scorer:
+        ds.enableExternalScorer(args.scorer)
+        if args.lm_alpha and args.lm_beta:
+            ds.setScorerAlphaBeta(args.lm_alpha, args.lm_beta)
+    return ds
+
+
+def benchmark_run(args):
+    """Measures one cold start. Has to run in a fresh process, see benchmark()."""
+    result = {}
+    load_start = timer()
+    ds = load_model(args)
+    result['cold_load'] = timer() - load_start
+
+    audio, audio_length = read_audio(args.audio, ds.sampleRate())
+    inference_start = timer()
+    ds.stt(audio)
+    result['first_inference'] = timer() - inference_start
+
+    rtfs = []
+    for _ in range(args.benchmark_iterations):
+        inference_start = timer()
+        ds.stt(audio)
+        rtfs.append((timer() - inference_start) / audio_length)
+    result['steady_state_rtf'] = float(np.median(rtfs))
+    del ds
+
+    load_start = timer()
+    ds = load_model(args)
+    result['warm_load'] = timer() - load_start
+    result['warmup'] = ds.warmup()
+    inference_start = timer()
+    ds.stt(audio)
+    result['first_inference_after_warmup'] = timer() - inference_start
+    result['audio_length'] = audio_length
+    return result
+
+
+def benchmark(args):
+    """Runs benchmark_run() in args.benchmark fresh processes and reports percentiles as JSON"""
+    command = [sys.executable, '-m', 'deepspeech.client', '--benchmark_run',
+               '--benchmark_iterations', str(args.benchmark_iterations)]
+    for name in ['model', 'scorer', 'audio', 'beam_width', 'lm_alpha', 'lm_beta']:
+        value = getattr(args, name)
+        if value is not None:
+            command.extend(['--' + name, str(value)])
+    runs = []
+    for run in range(args.benchmark):
+        print('Benchmark run {} of {}'.format(run + 1, args.benchmark), file=sys.stderr)
+        runs.append(json.loads(subprocess.check_output(command).decode('utf-8')))
+    report = {'runs': len(runs), 'audio_length': runs[0]['audio_length'], 'metrics': {}}
+    for metric in ['cold_load', 'warm_load', 'first_inference', 'warmup', 'first_inference_after_warmup',
+                   'steady_state_rtf']:
+        values = [run[metric] for run in runs]
+        report['metrics'][metric] = {
+            'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)),
+            'mean': float(np.mean(values))
+        }
+    return report
+
+
 class VersionAction(argparse.Action):
     def __init__(self, *args, **kwargs):
         super(VersionAction, self).__init__(nargs=0, *args, **kwargs)
@@ -111,8 +206,21 @@ def main():
                         help='Number of candidate transcripts to include in JSON output')
     parser.add_argument('--hot_words', type=str,
                         help='Hot-words and their boosts.')
+    parser.add_argument('--benchmark', type=int,
+                        help='Instead of transcribing, benchmark cold-load, warm-load, first-inference and steady-state '
+                             'real-time factor over the given number of fresh processes and print percentiles as JSON')
+    parser.add_argument('--benchmark_iterations', type=int, default=3,
+                        help='Number of inferences per benchmark run for measuring the steady-state real-time factor')
+    parser.add_argument('--benchmark_run', action='store_true', help=argparse.SUPPRESS)
     args = parser.parse_args()
 
+    if args.benchmark_run:
+        print(json.dumps(benchmark_run(args)))
+        return
+    if args.benchmark:
+        print(json.dumps(benchmark(args), indent=2))
+        return
+
     print('Loading model from file {}'.format(args.model), file=sys.stderr)
     model_load_start = timer()
     # sphinx-doc: python_ref_model_start
@@ -142,16 +250,7 @@ def main():
             word,boost = word_boost.split(':')
             ds.addHotWord(word,float(boost))
 
-    fin = wave.open(args.audio, 'rb')
-    fs_orig = fin.getframerate()
-    if fs_orig != desired_sample_rate:
-        print('Warning: original sample rate ({}) is different than {}hz. Resampling might produce erratic speech recognition.'.format(fs_orig, desired_sample_rate), file=sys.stderr)
-        fs_new, audio = convert_samplerate(args.audio, desired_sample_rate)
-    else:
-        audio = np.frombuffer(fin.readframes(fin.getnframes()), np.int16)
-
-    audio_length = fin.getnframes() * (1/fs_orig)
-    fin.close()
+    audio, audio_length = read_audio(args.audio, desired_sample_rate)
 
     print('Running inference.', file=sys.stderr)
     inference_start = timer()
@@ -10,8 +10,73 @@
 import_array();
 %}
 
-// apply NumPy conversion typemap to DS_FeedAudioContent and DS_SpeechToText
-%apply (short* IN_ARRAY1, int DIM1) {(const short* aBuffer, unsigned int aBufferSize)};
+// DS_FeedAudioContent and DS_SpeechToText accept any C-contiguous buffer-protocol object
+// (bytes, bytearray, memoryview, array.array, NumPy arrays). 16-bit samples and raw bytes are
+// passed through without copying, float32 samples in [-1.0, 1.0] are converted to 16-bit here.
+// Everything else (sequences, non-contiguous or byte-swapped arrays, ...) takes the former NumPy
+// conversion path of numpy.i's IN_ARRAY1 typemap.
+%typemap(in, fragment="NumPy_Fragments") (const short* aBuffer, unsigned int aBufferSize)
+  (Py_buffer view, int view_acquired = 0, short* converted = NULL, PyArrayObject* array = NULL, int is_new_object = 0) {
+  int fast_path = 0;
+  if (PyObject_CheckBuffer($input) && PyObject_GetBuffer($input, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) == 0) {
+    view_acquired = 1;
+    const char* format = view.format ? view.format : "B";
+    if (*format == '@' || *format == '=' || *format == '<') {
+      ++format;
+    }
+    if (strcmp(format, "h") == 0 && view.itemsize == 2) {
+      $1 = (short*) view.buf;
+      $2 = (unsigned int) (view.len / 2);
+      fast_path = 1;
+    } else if ((strcmp(format, "B") == 0 || strcmp(format, "b") == 0 || strcmp(format, "c") == 0) && view.itemsize == 1) {
+      if (view.len % 2 != 0) {
+        PyErr_SetString(PyExc_ValueError, "Raw audio buffer has to contain 16-bit samples (even number of bytes)");
+        SWIG_fail;
+      }
+      $1 = (short*) view.buf;
+      $2 = (unsigned int) (view.len / 2);
+      fast_path = 1;
+    } else if (strcmp(format, "f") == 0 && view.itemsize == 4) {
+      Py_ssize_t num_samples = view.len / 4;
+      const float* samples = (const float*) view.buf;
+      converted = (short*) malloc(num_samples * sizeof(short));
+      if (!converted) {
+        PyErr_NoMemory();
+        SWIG_fail;
+      }
+      for (Py_ssize_t i = 0; i < num_samples; ++i) {
+        float value = samples[i] * 32767.0f;
+        converted[i] = (short) (value > 32767.0f ? 32767.0f : (value < -32768.0f ? -32768.0f : value));
+      }
+      $1 = converted;
+      $2 = (unsigned int) num_samples;
+      fast_path = 1;
+    } else {
+      PyBuffer_Release(&view);
+      view_acquired = 0;
+    }
+  } else {
+    PyErr_Clear();
+  }
+  if (!fast_path) {
+    array = obj_to_array_contiguous_allow_conversion($input, NPY_SHORT, &is_new_object);
+    if (!array || !require_dimensions(array, 1)) {
+      SWIG_fail;
+    }
+    $1 = (short*) array_data(array);
+    $2 = (unsigned int) array_size(array, 0);
+  }
+}
+
+%typemap(freearg) (const short* aBuffer, unsigned int aBufferSize) {
+  if (view_acquired$argnum) {
+    PyBuffer_Release(&view$argnum);
+  }
+  free(converted$argnum);
+  if (is_new_object$argnum && array$argnum) {
+    Py_DECREF(array$argnum);
+  }
+}
 
 %typemap(in, numinputs=0) ModelState **retval (ModelState *ret) {
   ret = NULL;
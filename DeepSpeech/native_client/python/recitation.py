@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+
+from collections import deque, namedtuple
+
+INF = float('inf')
+
+Mismatch = namedtuple('Mismatch', 'kind word expected position')
+Mismatch.__doc__ = """
+Deviation of the recitation from the expected text.
+kind is one of "substitution" (word instead of expected), "insertion" (word not in the expected text)
+or "deletion" (expected word was skipped). position is the index of the concerned word in the expected text.
+"""
+
+TrackingState = namedtuple('TrackingState', 'position num_words transcript mismatches settled')
+TrackingState.__doc__ = """
+Result of a tracking update: position is the number of expected words recited so far,
+mismatches the :func:`Mismatch` instances of the still changing (live) part of the alignment and
+settled the :func:`Mismatch` instances that got settled by this update. Settled mismatches are only reported once,
+all of them are available through :func:`RecitationTracker.all_mismatches()`.
+"""
+
+
+def read_verses(quran_path, strip_basmala=True):
+    """
+    Reads a Tanzil text file like data/quran/quran-uthmani.txt (lines of the form "surah|ayah|text").
+
+    :param quran_path: Path to the text file
+    :type quran_path: str
+
+    :param strip_basmala: If to remove the Basmala that prefixes the first ayah of all surahs except 1 and 9
+    :type strip_basmala: bool
+
+    :return: Dictionary from (surah, ayah) to verse text
+    :type: dict
+    """
+    verses = {}
+    with open(quran_path, encoding='utf8') as quran_file:
+        for line in quran_file:
+            tokens = line.strip().split('|')
+            if len(tokens) != 3:
+                continue
+            surah, ayah, text = int(tokens[0]), int(tokens[1]), tokens[2]
+            if strip_basmala and ayah == 1 and surah not in (1, 9):
+                text = text.split(' ', 4)[4]
+            verses[(surah, ayah)] = text
+    return verses
+
+
+class _Column(object):
+    """
+    One column of the banded edit-distance matrix: costs of aligning the first n hypothesis words
+    with the first j expected words for j in [start, start + len(costs)).
+    """
+    __slots__ = ['start', 'costs', 'best']
+
+    def __init__(self, start, costs):
+        self.start = start
+        self.costs = costs
+        self.best = start + min(range(len(costs)), key=costs.__getitem__)
+
+    def cost(self, j):
+        index = j - self.start
+        return self.costs[index] if 0 <= index < len(self.costs) else INF
+
+
+class RecitationTracker(object):
+    """
+    Follows a recitation of a known text on top of a :func:`Stream`.
+
+    The tracker keeps an incremental, banded word alignment between the stream's intermediate
+    transcripts and the expected text. On each update only the hypothesis words that changed since
+    the previous update get re-aligned, and only within `band` words around the current position.
+    Hypothesis words that are more than `lookback` words behind the end of the transcript are
+    considered settled: their mismatches get fixed and their alignment state is discarded.
+    Per-update cost is thereby bounded by the number of changed words times `band`
+    and independent of the session length.
+
+    If the recitation does not start with the first expected word, its start has to be passed as `start`
+    or located by passing `start=None`: then the first `anchor_words` recited words get aligned against the
+    whole expected text and expected words before the located start are not reported as deletions.
+
+    :param stream: Stream (or GatedStream) the recitation is fed to
+    :param expected_text: Text that is expected to be recited
+    :type expected_text: str
+    :param band: Half-width of the alignment band in words
+    :type band: int
+    :param lookback: Number of trailing hypothesis words that may still change between updates
+    :type lookback: int
+    :param normalize: Optional function applied to expected and recognized words before comparison
+    :param start: Index of the expected word the recitation starts with or None for locating it
+    :type start: int
+    :param anchor_words: Number of recited words used for locating the start (if start is None)
+    :type anchor_words: int
+    """
+    def __init__(self, stream, expected_text, band=8, lookback=4, normalize=None, start=0, anchor_words=3):
+        self.stream = stream
+        self.normalize = normalize if normalize is not None else (lambda word: word)
+        self.expected = [self.normalize(word) for word in expected_text.split()]
+        self.band = band
+        self.lookback = lookback
+        self.start = start
+        self.anchor_words = anchor_words
+        self.words = []
+        if start is None:
+            # Free start: no costs for skipping expected words before the first recited one
+            first_column = _Column(0, [0] * (len(self.expected) + 1))
+        else:
+            start = min(start, len(self.expected))
+            first_column = _Column(start, list(range(min(band, len(self.expected) - start) + 1)))
+        self.columns = deque([first_column])
+        self.offset = 0  # number of settled hypothesis words whose columns got discarded
+        self.settled_mismatches = []
+
+    def _next_column(self, previous, word):
+        start = max(0, previous.best - self.band)
+        end = min(len(self.expected), previous.best + self.band)
+        if self.start is None and self.offset + len(self.columns) - 1 < self.anchor_words:
+            # Locating the start
+            start, end = 0, len(self.expected)
+        costs = []
+        for j in range(start, end + 1):
+            cost = previous.cost(j) + 1  # insertion of word
+            if j > start:
+                cost = min(cost, costs[-1] + 1)  # deletion of expected word j-1
+            if j > 0:
+                cost = min(cost, previous.cost(j - 1) + (0 if self.expected[j - 1] == word else 1))
+            costs.append(cost)
+        return _Column(start, costs)
+
+    def _traceback(self):
+        """
+        Follows the best alignment path back through the live columns.
+        Returns the mismatches of the path, grouped by the column that introduced them.
+        """
+        columns = self.columns
+        steps = [[] for _ in columns]
+        i, j = len(columns) - 1, columns[-1].best
+        while i > 0:
+            column, previous = columns[i], columns[i - 1]
+            word = self.normalize(self.words[self.offset + i - 1])
+            cost = column.cost(j)
+            if j > 0 and cost == previous.cost(j - 1) + (0 if self.expected[j - 1] == word else 1):
+                if self.expected[j - 1] != word:
+                    steps[i].append(Mismatch('substitution', self.words[self.offset + i - 1],
+                                             self.expected[j - 1], j - 1))
+                i, j = i - 1, j - 1
+            elif cost == previous.cost(j) + 1:
+                steps[i].append(Mismatch('insertion', self.words[self.offset + i - 1], None, j))
+                i -= 1
+            else:
+                steps[i].append(Mismatch('deletion', None, self.expected[j - 1], j - 1))
+                j -= 1
+        if self.offset == 0:
+            # Expected words skipped before the first recited word
+            first = j if self.start is None else min(self.start, j)
+            steps[0] = [Mismatch('deletion', None, self.expected[k], k) for k in reversed(range(first, j))]
+        return [list(reversed(step)) for step in steps]
+
+    def _rollback(self, num_words):
+        """Discards alignment columns of hypothesis words at index num_words and later"""
+        while len(self.columns) > 1 and self.offset + len(self.columns) - 1 > num_words:
+            self.columns.pop()
+        del self.words[num_words:]
+
+    def _settle(self):
+        settled = []
+        while len(self.columns) > self.lookback + 1:
+            steps = self._traceback()
+            settled.extend(steps[0] + steps[1])
+            self.columns.popleft()
+            self.offset += 1
+        self.settled_mismatches.extend(settled)
+        return settled
+
+    def _live_mismatches(self):
+        return [mismatch for step in self._traceback() for mismatch in step]
+
+    def all_mismatches(self):
+        """
+        :return: All mismatches of the session - settled ones followed by the live ones
+        :type: list
+        """
+        return self.settled_mismatches + self._live_mismatches()
+
+    def update_with(self, transcript):
+        """
+        Updates the alignment with an (intermediate) transcript of the recitation.
+
+        :param transcript: Full transcript so far
+        :type transcript: str
+
+        :return: Current tracking state
+        :type: :func:`TrackingState`
+        """
+        words = transcript.split()
+        # Words before the lookback window are settled and not compared again
+        first_changed = self.offset
+        while (first_changed < len(words) and first_changed < len(self.words)
+               and words[first_changed] == self.words[first_changed]):
+            first_changed += 1
+        first_changed = max(first_changed, self.offset)
+        self._rollback(first_changed)
+        for word in words[first_changed:]:
+            self.words.append(word)
+            self.columns.append(self._next_column(self.columns[-1], self.normalize(word)))
+        settled = self._settle()
+        return TrackingState(self.columns[-1].best, len(self.expected), transcript, self._live_mismatches(), settled)
+
+    def update(self):
+        """
+        Runs an intermediate decode of the stream and updates the alignment with it.
+
+        :return: Current tracking state
+        :type: :func:`TrackingState`
+        """
+        return self.update_with(self.stream.intermediateDecode())
+
+    def finish(self):
+        """
+        Finishes the stream and updates the alignment with the final transcript.
+        Missing words at the end of the expected text are reported as deletions.
+
+        :return: Final tracking state with all mismatches of the session
+        :type: :func:`TrackingState`
+        """
+        state = self.update_with(self.stream.finishStream())
+        missing = [Mismatch('deletion', None, self.expected[j], j) for j in range(state.position, len(self.expected))]
+        return state._replace(mismatches=self.all_mismatches() + missing)
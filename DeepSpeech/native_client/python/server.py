@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class LatencyStats(object):
+    """
+    Rolling window of latency observations (in seconds) for reporting percentiles
+    """
+    def __init__(self, window=1000):
+        self._values = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        with self._lock:
+            self._values.append(value)
+
+    def summary(self):
+        with self._lock:
+            values = np.array(self._values, dtype=np.float64)
+        if len(values) == 0:
+            return {'count': 0}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {'count': len(values), 'mean': float(values.mean()),
+                'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(values.max())}
+
+
+class ServerMetrics(object):
+    """
+    Counters exposed by the `/metrics` endpoint
+    """
+    def __init__(self):
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        self.streams_opened = 0
+        self.streams_finished = 0
+        self.chunks = 0
+        self.batches = 0
+        self.batched_chunks = 0
+        self.audio_seconds = 0.0
+        self.voiced_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.chunk_latency = LatencyStats()
+        self.batch_latency = LatencyStats()
+
+    def to_dict(self, active_streams):
+        with self.lock:
+            uptime = time.time() - self.start_time
+            return {
+                'uptime': uptime,
+                'streams': {'active': active_streams, 'opened': self.streams_opened,
+                            'finished': self.streams_finished},
+                'chunks': self.chunks,
+                'batches': self.batches,
+                'mean_batch_size': self.batched_chunks / self.batches if self.batches else 0.0,
+                'audio_seconds': self.audio_seconds,
+                'voiced_seconds': self.voiced_seconds,
+                # Seconds of audio processed per second of wall time
+                'throughput': self.audio_seconds / uptime if uptime > 0 else 0.0,
+                # Inference time per second of (gated) audio processed
+                'real_time_factor': self.busy_seconds / self.audio_seconds if self.audio_seconds else 0.0,
+                'chunk_latency': self.chunk_latency.summary(),
+                'batch_latency': self.batch_latency.summary(),
+            }
+
+
+class StreamSession(object):
+    """
+    Server side state of one client stream
+    """
+    def __init__(self, stream_id, stream):
+        self.id = stream_id
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.pending = []
+        self.transcript = ''
+        self.error = None
+        self.closed = False
+        self.last_activity = time.time()
+
+    def full_transcript(self, current):
+        segments = getattr(self.stream, 'segments', [])
+        return ' '.join([segment for segment in segments if segment] + ([current] if current else []))
+
+    def close(self, finish=False):
+        """
+        Finishes (returning the final transcript) or frees the native stream.
+        Waits for a micro-batch that is still feeding the stream, as all native stream operations hold the lock.
+        """
+        with self.lock:
+            self.closed = True
+            if finish:
+                return self.full_transcript(self.stream.finishStream())
+            self.stream.freeStream()
+            return None
+
+
+class MicroBatcher(object):
+    """
+    Collects audio chunks of many concurrent streams and processes them in micro-batches.
+
+    Every `batch_window_ms` (or as soon as `max_batch_size` streams have pending audio) one batch is
+    formed from all streams with pending chunks. The chunks of a stream get concatenated and fed with
+    a single `feedAudioContent` call, followed by one `intermediateDecode`. The streams of a batch are
+    processed concurrently by a pool of `workers` threads, as the native client releases the GIL.
+    """
+    def __init__(self, metrics, sample_rate, max_batch_size=16, batch_window_ms=20, workers=4):
+        self.metrics = metrics
+        self.sample_rate = sample_rate
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.ready = deque()
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, session, audio):
+        done = threading.Event()
+        # The session lock is taken first and on its own, as it is held while the stream is fed
+        with session.lock:
+            session.pending.append((audio, time.time(), done))
+            first = len(session.pending) == 1
+        if first:
+            with self.condition:
+                self.ready.append(session)
+                if len(self.ready) >= self.max_batch_size:
+                    self.condition.notify()
+        return done
+
+    def _take_batch(self):
+        with self.condition:
+            if len(self.ready) < self.max_batch_size:
+                self.condition.wait(self.batch_window)
+            batch = []
+            while self.ready and len(batch) < self.max_batch_size:
+                batch.append(self.ready.popleft())
+            return batch
+
+    def _process(self, session):
+        # The session lock is held while feeding, so that the stream cannot get finished or freed meanwhile
+        with session.lock:
+            chunks, session.pending = session.pending, []
+            if not chunks:
+                # Already processed with an earlier batch
+                return
+            audio = np.concatenate([chunk for chunk, _, _ in chunks])
+            duration = len(audio) / self.sample_rate
+            voiced = 0.0
+            try:
+                if session.closed:
+                    raise RuntimeError('stream got closed')
+                if hasattr(session.stream, 'voicedDuration'):
+                    voiced_before = session.stream.voicedDuration()
+                    session.stream.feedAudioContent(audio)
+                    voiced = session.stream.voicedDuration() - voiced_before
+                else:
+                    session.stream.feedAudioContent(audio)
+                    voiced = duration
+                session.transcript = session.full_transcript(session.stream.intermediateDecode())
+            except Exception as ex:  # pylint: disable=broad-except
+                session.error = ex
+        now = time.time()
+        with self.metrics.lock:
+            self.metrics.chunks += len(chunks)
+            self.metrics.audio_seconds += duration
+            self.metrics.voiced_seconds += voiced
+        for _, submitted, done in chunks:
+            self.metrics.chunk_latency.add(now - submitted)
+            done.set()
+
+    def _run(self):
+        while self.running:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            batch_start = time.time()
+            list(self.pool.map(self._process, batch))
+            batch_time = time.time() - batch_start
+            self.metrics.batch_latency.add(batch_time)
+            with self.metrics.lock:
+                self.metrics.batches += 1
+                self.metrics.batched_chunks += len(batch)
+                self.metrics.busy_seconds += batch_time
+
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify()
+        self.thread.join()
+        self.pool.shutdown()
+
+
+class StreamingServer(ThreadingHTTPServer):
+    """
+    HTTP server for concurrent streaming recognition on a single model.
+
+    Endpoints:
+        POST   /streams             -- creates a stream, returns {"id": ...}
+        POST   /streams/<id>        -- feeds raw 16-bit mono PCM (request body), returns the intermediate transcript
+        POST   /streams/<id>/finish -- finishes the stream, returns the final transcript
+        DELETE /streams/<id>        -- frees the stream without decoding
+        GET    /metrics             -- throughput and latency metrics
+    """
+    daemon_threads = True
+
+    def __init__(self, address, model, vad_aggressiveness=None, silence_timeout_ms=None, stream_timeout=600,
+                 **batcher_args):
+        super(StreamingServer, self).__init__(address, StreamingRequestHandler)
+        self.model = model
+        self.sample_rate = model.sampleRate()
+        self.vad_aggressiveness = vad_aggressiveness
+        self.silence_timeout_ms = silence_timeout_ms
+        self.stream_timeout = stream_timeout
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.metrics = ServerMetrics()
+        self.batcher = MicroBatcher(self.metrics, self.sample_rate, **batcher_args)
+
+    def create_session(self):
+        self.expire_sessions()
+        if self.vad_aggressiveness is not None:
+            stream = self.model.createGatedStream(aggressiveness=self.vad_aggressiveness,
+                                                  silence_timeout_ms=self.silence_timeout_ms)
+        else:
+            stream = self.model.createStream()
+        session = StreamSession(uuid.uuid4().hex, stream)
+        with self.sessions_lock:
+            self.sessions[session.id] = session
+        with self.metrics.lock:
+            self.metrics.streams_opened += 1
+        return session
+
+    def get_session(self, stream_id, remove=False):
+        with self.sessions_lock:
+            session = self.sessions.pop(stream_id, None) if remove else self.sessions.get(stream_id)
+        if session is not None:
+            session.last_activity = time.time()
+        return session
+
+    def expire_sessions(self):
+        deadline = time.time() - self.stream_timeout
+        with self.sessions_lock:
+            expired = [s for s in self.sessions.values() if s.last_activity < deadline]
+            for session in expired:
+                del self.sessions[session.id]
+        for session in expired:
+            session.close()
+
+    def active_sessions(self):
+        with self.sessions_lock:
+            return len(self.sessions)
+
+    def server_close(self):
+        self.batcher.stop()
+        super(StreamingServer, self).server_close()
+
+
+class StreamingRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length > 0 else b''
+
+    def _path_parts(self):
+        return [part for part in self.path.split('?')[0].split('/') if part]
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self._path_parts() == ['metrics']:
+            return self._send_json(self.server.metrics.to_dict(self.server.active_sessions()))
+        return self._send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        parts = self._path_parts()
+        body = self._read_body()
+        if parts == ['streams']:
+            return self._send_json({'id': self.server.create_session().id})
+        if len(parts) == 2 and parts[0] == 'streams':
+            session = self.server.get_session(parts[1])
+            if session is None:
+                return self._send_json({'error': 'unknown stream'}, status=404)
+            if len(body) % 2 != 0:
+                return self._send_json({'error': 'audio has to be 16 bit PCM'}, status=400)
+            self.server.batcher.submit(session, np.frombuffer(body, dtype=np.int16)).wait()
+            if session.error is not None:
+                return self._send_json({'error': str(session.error)}, status=500)
+            return self._send_json({'id': session.id, 'transcript': session.transcript})
+        if len(parts) == 3 and parts[0] == 'streams' and parts[2] == 'finish':
+            session = self.server.get_session(parts[1], remove=True)
+            if session is None:
+                return self._send_json({'error': 'unknown stream'}, status=404)
+            with self.server.metrics.lock:
+                self.server.metrics.streams_finished += 1
+            return self._send_json({'id': session.id, 'transcript': session.close(finish=True)})
+        return self._send_json({'error': 'not found'}, status=404)
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        parts = self._path_parts()
+        if len(parts) == 2 and parts[0] == 'streams':
+            session = self.server.get_session(parts[1], remove=True)
+            if session is None:
+                return self._send_json({'error': 'unknown stream'}, status=404)
+            session.close()
+            return self._send_json({'id': session.id})
+        return self._send_json({'error': 'not found'}, status=404)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Running a DeepSpeech streaming recognition server.')
+    parser.add_argument('--model', required=True,
+                        help='Path to the model (protocol buffer binary file)')
+    parser.add_argument('--scorer', required=False,
+                        help='Path to the external scorer file')
+    parser.add_argument('--beam_width', type=int,
+                        help='Beam width for the CTC decoder')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8080,
+                        help='Port to listen on')
+    parser.add_argument('--max_batch_size', type=int, default=16,
+                        help='Maximum number of streams processed in one micro-batch')
+    parser.add_argument('--batch_window_ms', type=int, default=20,
+                        help='Time to wait for chunks of further streams before processing a micro-batch')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of inference threads that process the streams of a micro-batch')
+    parser.add_argument('--vad_aggressiveness', type=int, choices=[0, 1, 2, 3],
+                        help='If set, silent audio is dropped by voice activity detection before reaching the model')
+    parser.add_argument('--silence_timeout_ms', type=int,
+                        help='With --vad_aggressiveness: silence duration after which an utterance gets finished')
+    parser.add_argument('--stream_timeout', type=int, default=600,
+                        help='Seconds of inactivity after which a stream gets freed')
+    args = parser.parse_args()
+
+    from deepspeech import Model, version  # pylint: disable=import-outside-toplevel
+    print('DeepSpeech {} - loading model from file {}'.format(version(), args.model), file=sys.stderr)
+    ds = Model(args.model)
+    if args.beam_width:
+        ds.setBeamWidth(args.beam_width)
+    if args.scorer:
+        ds.enableExternalScorer(args.scorer)
+
+    server = StreamingServer((args.host, args.port), ds,
+                             vad_aggressiveness=args.vad_aggressiveness,
+                             silence_timeout_ms=args.silence_timeout_ms,
+                             stream_timeout=args.stream_timeout,
+                             max_batch_size=args.max_batch_size,
+                             batch_window_ms=args.batch_window_ms,
+                             workers=args.workers)
+    print('Listening on http://{}:{}'.format(*server.server_address), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import math
+from collections import deque
+
+import numpy as np
+
+#The API is not snake case which triggers linter errors
+#pylint: disable=invalid-name
+
+
+def as_int16_samples(audio_buffer):
+    """
+    Returns the content of a buffer as flat NumPy int16 array, copying only if a conversion is required.
+    Raw bytes are interpreted as native 16-bit samples, float32 samples are expected in [-1.0, 1.0].
+    """
+    if not isinstance(audio_buffer, np.ndarray):
+        try:
+            view = memoryview(audio_buffer)
+        except TypeError:
+            view = None
+        if view is not None and view.format in ['B', 'b', 'c']:
+            return np.frombuffer(view, dtype=np.int16)
+        audio_buffer = np.asarray(audio_buffer if view is None else view)
+    audio_buffer = audio_buffer.reshape(-1)
+    if audio_buffer.dtype == np.float32:
+        return (np.clip(audio_buffer, -1.0, 1.0) * 32767).astype(np.int16)
+    return audio_buffer.astype(np.int16, copy=False)
+
+
+class EnergyVad(object):
+    """
+    Energy based voice activity detector - fallback if package `webrtcvad` is not available
+    """
+    def __init__(self, threshold_dbfs=-45.0):
+        self.threshold = math.pow(10.0, threshold_dbfs / 20.0) * (1 << 15)
+
+    def is_speech(self, frame, sample_rate):  # pylint: disable=unused-argument
+        frame = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        return len(frame) > 0 and math.sqrt(np.mean(np.square(frame))) > self.threshold
+
+
+def create_vad(aggressiveness=3, energy_threshold_dbfs=None):
+    if energy_threshold_dbfs is None:
+        try:
+            from webrtcvad import Vad  # pylint: disable=import-outside-toplevel
+            return Vad(int(aggressiveness))
+        except ImportError:
+            energy_threshold_dbfs = -45.0
+    return EnergyVad(energy_threshold_dbfs)
+
+
+class VoiceGate(object):
+    """
+    Frame by frame voice activity gating. It triggers a voiced region as soon as more than
+    `threshold * num_padding_frames` of the last `num_padding_frames` frames are speech and passes on these
+    padding frames with it. The region ends as soon as more than that many of the frames since its trigger
+    (at most `num_padding_frames`) are non-speech. These are the rules of `find_voiced_segments` in
+    `deepspeech_training.util.audio`, which splits whole files for training and cannot be imported by this package.
+    """
+    def __init__(self, num_padding_frames=10, threshold=0.5):
+        self._ring_buffer = deque(maxlen=num_padding_frames)
+        self._limit = threshold * num_padding_frames
+        self._flagged = 0
+        self.triggered = False
+
+    def _append(self, frame, flag):
+        if len(self._ring_buffer) == self._ring_buffer.maxlen:
+            self._flagged -= self._ring_buffer[0][1]
+        self._ring_buffer.append((frame, flag))
+        self._flagged += flag
+
+    def push(self, frame, is_speech):
+        """
+        Returns the frames to pass on: the padding frames of a newly triggered region, the frame itself within
+        a voiced region (including the one that ends it) or nothing.
+        """
+        # Counts speech frames before and non-speech frames after triggering
+        self._append(frame, bool(is_speech) != self.triggered)
+        if self._flagged <= self._limit:
+            return [frame] if self.triggered else []
+        self.triggered = not self.triggered
+        frames = [frame] if not self.triggered else [f for f, _ in self._ring_buffer]
+        self._ring_buffer.clear()
+        self._flagged = 0
+        return frames
+
+
+class GatedStream(object):
+    """
+    Stream that holds back unvoiced audio. The constructor cannot be called directly.
+    Use :func:`Model.createGatedStream()`
+    """
+    def __init__(self, model, aggressiveness=3, frame_duration_ms=30, num_padding_frames=10, threshold=0.5,
+                 silence_timeout_ms=None, on_silence='finish', energy_threshold_dbfs=None):
+        if frame_duration_ms not in [10, 20, 30]:
+            raise ValueError('VAD frame duration has to be 10, 20, or 30 ms')
+        if on_silence not in ['finish', 'reset']:
+            raise ValueError('on_silence has to be "finish" or "reset"')
+        self._model = model
+        self._stream = model.createStream()
+        self._vad = create_vad(aggressiveness=aggressiveness, energy_threshold_dbfs=energy_threshold_dbfs)
+        self._sample_rate = model.sampleRate()
+        self._frame_size = self._sample_rate * frame_duration_ms // 1000
+        self._gate = VoiceGate(num_padding_frames=num_padding_frames, threshold=threshold)
+        self._remainder = np.zeros(0, dtype=np.int16)
+        self._silence_frames = None
+        if silence_timeout_ms is not None:
+            self._silence_frames = max(1, int(silence_timeout_ms) // frame_duration_ms)
+        self._on_silence = on_silence
+        self._unvoiced_run = 0
+        self._segment_voiced = False
+        self._voiced_samples = 0
+        self.segments = []
+
+    def _feed(self, frames):
+        if frames:
+            audio = np.concatenate(frames)
+            self._voiced_samples += len(audio)
+            self._segment_voiced = True
+            self._stream.feedAudioContent(audio)
+
+    def _end_segment(self):
+        if self._on_silence == 'finish':
+            self.segments.append(self._stream.finishStream())
+        else:
+            self._stream.freeStream()
+        self._stream = self._model.createStream()
+        self._segment_voiced = False
+
+    def feedAudioContent(self, audio_buffer):
+        """
+        Feed audio samples to an ongoing streaming inference. Only voiced frames (and their padding)
+        reach the acoustic model. Samples that do not fill a complete VAD frame are kept until the next call.
+
+        :param audio_buffer: A 16-bit, mono raw audio signal at the appropriate sample rate (matching what the model was trained on).
+                             Any C-contiguous buffer is accepted without copying: bytes, bytearray, memoryview or array.array
+                             holding 16-bit samples or a NumPy int16 array. Float32 samples in [-1.0, 1.0] get converted natively.
+                             Other array-likes (like lists or non-contiguous and byte-swapped arrays) get converted by NumPy.
+        :type audio_buffer: buffer
+
+        :throws: RuntimeError if the stream object is not valid
+        """
+        if not self._stream._impl:
+            raise RuntimeError("Stream object is not valid. Trying to feed an already finished stream?")
+        audio = np.concatenate((self._remainder, as_int16_samples(audio_buffer)))
+        num_frames = len(audio) // self._frame_size
+        self._remainder = audio[num_frames * self._frame_size:]
+        voiced = []
+        for index in range(num_frames):
+            frame = audio[index * self._frame_size:(index + 1) * self._frame_size]
+            is_speech = self._vad.is_speech(frame.tobytes(), self._sample_rate)
+            self._unvoiced_run = 0 if is_speech else self._unvoiced_run + 1
+            passed = self._gate.push(frame, is_speech)
+            voiced.extend(passed)
+            if (not passed and not self._gate.triggered and self._silence_frames is not None
+                    and self._unvoiced_run >= self._silence_frames and (self._segment_voiced or voiced)):
+                self._feed(voiced)
+                voiced = []
+                self._end_segment()
+        self._feed(voiced)
+
+    def voicedDuration(self):
+        """
+        Duration of the audio that was passed on to the acoustic model so far.
+
+        :return: Duration in seconds.
+        :type: float
+        """
+        return self._voiced_samples / self._sample_rate
+
+    def intermediateDecode(self):
+        """
+        Compute the intermediate decoding of the current segment. See :func:`Stream.intermediateDecode()`.
+        """
+        return self._stream.intermediateDecode()
+
+    def intermediateDecodeWithMetadata(self, num_results=1):
+        """
+        Compute the intermediate decoding of the current segment and return results including metadata.
+        See :func:`Stream.intermediateDecodeWithMetadata()`.
+        """
+        return self._stream.intermediateDecodeWithMetadata(num_results)
+
+    def finishStream(self):
+        """
+        Compute the final decoding of the current segment. See :func:`Stream.finishStream()`.
+        Transcripts of segments that were finished on silence timeouts are available in `segments`.
+        """
+        return self._stream.finishStream()
+
+    def finishStreamWithMetadata(self, num_results=1):
+        """
+        Compute the final decoding of the current segment and return results including metadata.
+        See :func:`Stream.finishStreamWithMetadata()`.
+        """
+        return self._stream.finishStreamWithMetadata(num_results)
+
+    def freeStream(self):
+        """
+        Destroy the streaming state without decoding. See :func:`Stream.freeStream()`.
+        """
+        self._stream.freeStream()
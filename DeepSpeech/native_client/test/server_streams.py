@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import http.client
+import json
+import threading
+import wave
+
+from deepspeech import Model
+from deepspeech.server import StreamingServer
+
+
+def request(address, method, path, body=None):
+    connection = http.client.HTTPConnection(*address)
+    connection.request(method, path, body=body)
+    response = connection.getresponse()
+    result = json.loads(response.read().decode('utf-8'))
+    connection.close()
+    if response.status != 200:
+        raise RuntimeError('{} {} failed: {}'.format(method, path, result))
+    return result
+
+
+def stream_file(address, audio_path, chunk_ms, results, index):
+    with wave.open(audio_path, 'rb') as fin:
+        chunk_frames = fin.getframerate() * chunk_ms // 1000
+        stream_id = request(address, 'POST', '/streams')['id']
+        while True:
+            chunk = fin.readframes(chunk_frames)
+            if len(chunk) == 0:
+                break
+            request(address, 'POST', '/streams/' + stream_id, body=chunk)
+    results[index] = request(address, 'POST', '/streams/{}/finish'.format(stream_id))['transcript']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Running concurrent streams against a local DeepSpeech server.')
+    parser.add_argument('--model', required=True,
+                        help='Path to the model (protocol buffer binary file)')
+    parser.add_argument('--scorer', nargs='?',
+                        help='Path to the external scorer file')
+    parser.add_argument('--audio', required=True, nargs='+',
+                        help='Audio files to stream concurrently')
+    parser.add_argument('--chunk_ms', type=int, default=320,
+                        help='Duration of the audio chunks sent per request')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Print server metrics as JSON after all streams finished')
+    args = parser.parse_args()
+
+    ds = Model(args.model)
+    if args.scorer:
+        ds.enableExternalScorer(args.scorer)
+
+    server = StreamingServer(('127.0.0.1', 0), ds)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    results = [None] * len(args.audio)
+    clients = [threading.Thread(target=stream_file, args=(server.server_address, audio_path, args.chunk_ms, results, i))
+               for i, audio_path in enumerate(args.audio)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    for result in results:
+        print(result)
+    if args.metrics:
+        print(json.dumps(request(server.server_address, 'GET', '/metrics'), indent=2))
+
+    server.shutdown()
+    server.server_close()
+
+if __name__ == '__main__':
+    main()
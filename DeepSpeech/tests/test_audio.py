@@ -0,0 +1,412 @@
+import io
+import os
+import sys
+import struct
+import tempfile
+import types
+import ctypes
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from deepspeech_training.util import audio
+from deepspeech_training.util.audio import (
+    AudioFormat,
+    Resampler,
+    convert_pcm,
+    find_voiced_segments,
+    get_opus_codec,
+    pcm_to_np,
+    read_opus,
+    read_ogg_opus_chunks,
+    read_ogg_opus_header,
+    read_pcm_chunks_from_file,
+    read_opus_np,
+    read_wav_header,
+    vad_split,
+    write_opus,
+    write_wav
+)
+from deepspeech_training.util.probing import ProbeCache, probe_audio_files
+
+try:
+    import opuslib  # pylint: disable=unused-import
+    OPUS_AVAILABLE = True
+except Exception:  # pylint: disable=broad-except
+    # opuslib raises a plain Exception if libopus is missing
+    OPUS_AVAILABLE = False
+
+
+def sine_pcm(rate, channels, duration=1.0, frequency=440.0):
+    t = np.arange(int(rate * duration)) / rate
+    samples = np.stack([0.5 * np.sin(2 * np.pi * frequency * t)] * channels, axis=1)
+    return (samples * 32767).astype(np.int16).tobytes()
+
+
+class TestResampler(unittest.TestCase):
+
+    def test_same_format_passthrough(self):
+        pcm = sine_pcm(16000, 1)
+        self.assertEqual(convert_pcm(pcm, AudioFormat(16000, 1, 2), AudioFormat(16000, 1, 2)), pcm)
+
+    def test_output_length_and_downmix(self):
+        pcm = sine_pcm(44100, 2)
+        converted = np.frombuffer(convert_pcm(pcm, AudioFormat(44100, 2, 2), AudioFormat(16000, 1, 2)), np.int16)
+        self.assertEqual(len(converted), 16000)
+        t = np.arange(16000) / 16000
+        expected = 0.5 * np.sin(2 * np.pi * 440.0 * t) * 32767
+        # Skipping filter edges
+        self.assertLess(np.abs(converted[100:-100] - expected[100:-100]).max(), 100)
+
+    def test_chunked_equals_one_shot(self):
+        src_format, dst_format = AudioFormat(22050, 1, 2), AudioFormat(16000, 1, 2)
+        pcm = sine_pcm(22050, 1)
+        resampler = Resampler(src_format, dst_format)
+        # Chunks of odd byte lengths are not aligned to samples
+        chunks = [resampler.process(pcm[i:i + 777]) for i in range(0, len(pcm), 777)]
+        chunks.append(resampler.flush())
+        self.assertEqual(b''.join(chunks), convert_pcm(pcm, src_format, dst_format))
+
+    def test_invalid_channels(self):
+        with self.assertRaises(ValueError):
+            Resampler(AudioFormat(16000, 1, 2), AudioFormat(16000, 2, 2))
+
+
+class TestVadSplit(unittest.TestCase):
+
+    def test_find_voiced_segments(self):
+        mask = np.array([0, 0, 1, 1, 1, 0, 0, 0, 0, 1, 1, 1, 1], dtype=bool)
+        segments = find_voiced_segments(mask, num_padding_frames=4, threshold=0.5)
+        self.assertEqual(segments, [(1, 7, True), (8, 12, False)])
+
+    def test_no_speech(self):
+        self.assertEqual(find_voiced_segments(np.zeros(100, dtype=bool)), [])
+
+    def test_energy_detector_segments(self):
+        frame = 480
+        t = np.arange(frame * 20) / 16000
+        tone = (np.sin(2 * np.pi * 200 * t) * 8000).astype(np.int16).tobytes()
+        silence = bytes(frame * 2 * 20)
+        pcm = silence + tone + silence
+        frames = [pcm[i:i + frame * 2] for i in range(0, len(pcm), frame * 2)]
+        segments = list(vad_split(frames, detector='energy'))
+        self.assertEqual(len(segments), 1)
+        segment, time_start, time_end = segments[0]
+        self.assertEqual(bytes(segment[-len(tone) - frame * 2 * 6:-frame * 2 * 6]), tone)
+        self.assertEqual((time_start, time_end), (450.0, 1350.0))
+
+    def test_streaming_matches_whole_mask(self):
+        frame = 480
+        t = np.arange(frame) / 16000
+        tone = (np.sin(2 * np.pi * 200 * t) * 8000).astype(np.int16).tobytes()
+        silence = bytes(frame * 2)
+        speech = np.repeat(np.random.RandomState(0).rand(60) < 0.5, 17)
+        frames = [tone if flag else silence for flag in speech]
+        pcm = b''.join(frames)
+        expected = [bytes(pcm[first * frame * 2:(last + 1) * frame * 2])
+                    for first, last, _ in find_voiced_segments(speech, num_padding_frames=10, threshold=0.5)]
+        self.assertGreater(len(expected), 5)
+        for block_frames in [5, 64, 4096]:
+            with mock.patch('deepspeech_training.util.audio.VAD_BLOCK_FRAMES', block_frames):
+                segments = list(vad_split(frames, detector='energy'))
+            self.assertEqual([segment for segment, _, _ in segments], expected)
+
+    def test_segments_yielded_while_reading(self):
+        frame = 480
+        t = np.arange(frame) / 16000
+        tone = (np.sin(2 * np.pi * 200 * t) * 8000).astype(np.int16).tobytes()
+        silence = bytes(frame * 2)
+        consumed = []
+
+        def frames():
+            for index in range(100000):
+                consumed.append(index)
+                yield tone if index % 200 < 100 else silence
+
+        with mock.patch('deepspeech_training.util.audio.VAD_BLOCK_FRAMES', 64):
+            segment, _, _ = next(vad_split(frames(), detector='energy'))
+        self.assertLess(len(consumed), 300)
+        self.assertEqual(len(segment), 106 * frame * 2)
+
+
+class TestReadHeader(unittest.TestCase):
+
+    def test_wav_header(self):
+        for audio_format in [AudioFormat(16000, 1, 2), AudioFormat(44100, 2, 2), AudioFormat(8000, 1, 1)]:
+            wav_file = io.BytesIO()
+            write_wav(wav_file, bytes(1234 * audio_format.channels * audio_format.width), audio_format=audio_format)
+            self.assertEqual(read_wav_header(wav_file), (audio_format, 1234))
+
+    def test_not_a_wav(self):
+        with self.assertRaises(ValueError):
+            read_wav_header(io.BytesIO(b'OggS' + bytes(100)))
+
+    def test_extensible_wav_header(self):
+        wav_file = io.BytesIO(extensible_wav(audio.KSDATAFORMAT_SUBTYPE_PCM))
+        self.assertEqual(read_wav_header(wav_file), (AudioFormat(16000, 2, 2), 100))
+        # IEEE float sub-format
+        float_guid = b'\x03' + audio.KSDATAFORMAT_SUBTYPE_PCM[1:]
+        with self.assertRaises(ValueError):
+            read_wav_header(io.BytesIO(extensible_wav(float_guid)))
+
+    def test_ogg_opus_header(self):
+        ogg_file = io.BytesIO(ogg_opus(channels=2, pre_skip=312, granule_positions=[48000, 96312]))
+        self.assertEqual(read_ogg_opus_header(ogg_file), (AudioFormat(48000, 2, 2), 96000))
+
+    def test_ogg_opus_header_truncated(self):
+        data = ogg_opus(channels=1, pre_skip=0, granule_positions=[960, 1920])
+        # Last page cut off, so no page ends with the file
+        with self.assertRaises(ValueError):
+            read_ogg_opus_header(io.BytesIO(data[:-10]))
+
+    def test_not_an_ogg_opus(self):
+        with self.assertRaises(ValueError):
+            read_ogg_opus_header(io.BytesIO(b'RIFF' + bytes(100)))
+
+
+def extensible_wav(sub_format, channels=2, rate=16000, num_samples=100):
+    fmt_chunk = struct.pack('<HHIIHHHHI', audio.WAVE_FORMAT_EXTENSIBLE, channels, rate, rate * channels * 2,
+                            channels * 2, 16, 22, 16, 3) + sub_format
+    data = bytes(num_samples * channels * 2)
+    chunks = b'fmt ' + struct.pack('<I', len(fmt_chunk)) + fmt_chunk + b'data' + struct.pack('<I', len(data)) + data
+    return b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' + chunks
+
+
+def ogg_page(packet, granule_position, sequence, header_type=0):
+    segments = [255] * (len(packet) // 255) + [len(packet) % 255]
+    return (b'OggS' + struct.pack('<BBqIII', 0, header_type, granule_position, 1, sequence, 0) +
+            bytes([len(segments)] + segments) + packet)
+
+
+def ogg_opus(channels, pre_skip, granule_positions):
+    """Ogg Opus stream with placeholder audio packets - only container headers are valid"""
+    head = b'OpusHead' + struct.pack('<BBHIhB', 1, channels, pre_skip, 48000, 0, 0)
+    pages = [ogg_page(head, 0, 0, header_type=2), ogg_page(b'OpusTags' + bytes(8), 0, 1)]
+    for index, granule_position in enumerate(granule_positions):
+        pages.append(ogg_page(bytes(300), granule_position, index + 2,
+                              header_type=4 if index == len(granule_positions) - 1 else 0))
+    return b''.join(pages)
+
+
+class TestProbing(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache_path = os.path.join(self.directory.name, 'probes.sqlite')
+
+    def write_wav_file(self, name, num_samples, mtime_ns=None):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as wav_file:
+            write_wav(wav_file, bytes(num_samples * 2))
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return path
+
+    def test_probe_audio_files(self):
+        wav_path = self.write_wav_file('a.wav', 16000)
+        ogg_path = os.path.join(self.directory.name, 'b.opus')
+        with open(ogg_path, 'wb') as ogg_file:
+            ogg_file.write(ogg_opus(channels=1, pre_skip=0, granule_positions=[24000]))
+        broken_path = os.path.join(self.directory.name, 'c.wav')
+        with open(broken_path, 'wb') as broken_file:
+            broken_file.write(b'not a wav')
+        missing_path = os.path.join(self.directory.name, 'd.wav')
+        results = probe_audio_files([wav_path, ogg_path, broken_path, missing_path], processes=1)
+        self.assertEqual([result.path for result in results], [wav_path, ogg_path, broken_path, missing_path])
+        self.assertEqual(results[0].audio_format, AudioFormat(16000, 1, 2))
+        self.assertEqual(results[0].duration, 1.0)
+        self.assertEqual(results[1].duration, 0.5)
+        self.assertIsNone(results[2].duration)
+        self.assertEqual((results[3].size, results[3].duration), (-1, None))
+
+    def test_cache_invalidation(self):
+        path = self.write_wav_file('a.wav', 16000, mtime_ns=10 ** 18)
+        first = probe_audio_files([path], cache_path=self.cache_path, processes=1)
+        with mock.patch('deepspeech_training.util.probing.Pool', side_effect=AssertionError('probed again')):
+            self.assertEqual(probe_audio_files([path], cache_path=self.cache_path, processes=1), first)
+        # Same size, other modification time
+        self.write_wav_file('a.wav', 16000, mtime_ns=2 * 10 ** 18)
+        with ProbeCache(self.cache_path) as cache:
+            self.assertEqual(cache.lookup({path: (first[0].size, 2 * 10 ** 18)}), {})
+        # Other size
+        self.write_wav_file('a.wav', 8000, mtime_ns=10 ** 18)
+        second = probe_audio_files([path], cache_path=self.cache_path, processes=1)
+        self.assertEqual(second[0].duration, 0.5)
+        with ProbeCache(self.cache_path) as cache:
+            self.assertEqual(cache.lookup({path: (second[0].size, second[0].mtime_ns)}), {path: second[0]})
+
+
+class FakeOpusFile:
+    """Stand-in for libopusfile (as wrapped by pyogg) that decodes 20 ms packets of given samples"""
+    def __init__(self, samples):
+        self.samples = samples
+        self.position = 0
+        self.pending = 0
+        self.freed = False
+        self.opus = types.SimpleNamespace(opus_int16=ctypes.c_int16,
+                                          op_open_memory=self.op_open_memory,
+                                          op_channel_count=lambda opusfile, link: self.samples.shape[1],
+                                          op_read=self.op_read,
+                                          op_free=self.op_free)
+
+    def op_open_memory(self, data, size, error):
+        error.contents.value = 0
+        return self
+
+    def op_read(self, opusfile, target, buffer_size, link):
+        channels = self.samples.shape[1]
+        if self.pending == 0:
+            # Decoding the next packet
+            self.pending = min(960, len(self.samples) - self.position)
+        count = min(self.pending, buffer_size // channels)
+        values = self.samples[self.position:self.position + count].reshape(-1)
+        for index, value in enumerate(values):
+            target[index] = int(value)
+        self.position += count
+        self.pending -= count
+        return count
+
+    def op_free(self, opusfile):
+        self.freed = True
+
+
+class TestOggOpusChunks(unittest.TestCase):
+
+    def setUp(self):
+        self.samples = np.random.RandomState(0).randint(-1000, 1000, size=(48000 + 123, 2)).astype(np.int16)
+        self.opusfile = FakeOpusFile(self.samples)
+        for name, module in [('opus', self.opusfile.opus), ('ogg', types.SimpleNamespace(c_int_p=lambda: None))]:
+            patcher = mock.patch.object(audio.pyogg, name, module)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_chunks(self):
+        chunks = list(read_ogg_opus_chunks(io.BytesIO(b'data'), chunk_duration_ms=250))
+        self.assertEqual({audio_format for audio_format, _ in chunks}, {AudioFormat(48000, 2, 2)})
+        # Chunks of 250 ms do not align with packets
+        self.assertEqual([len(chunk) for _, chunk in chunks], [12000 * 4] * 4 + [123 * 4])
+        self.assertEqual(b''.join(chunk for _, chunk in chunks), self.samples.tobytes())
+        self.assertTrue(self.opusfile.freed)
+
+    def test_decoding_while_reading(self):
+        chunks = read_ogg_opus_chunks(io.BytesIO(b'data'), chunk_duration_ms=100)
+        next(chunks)
+        self.assertEqual(self.opusfile.position, 4800)
+        chunks.close()
+        self.assertTrue(self.opusfile.freed)
+
+    def test_read_pcm_chunks_from_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            opus_path = os.path.join(tmp_dir, 'audio.opus')
+            with open(opus_path, 'wb') as opus_file:
+                opus_file.write(b'data')
+            chunks = list(read_pcm_chunks_from_file(opus_path, audio_format=AudioFormat(48000, 2, 2),
+                                                    chunk_duration_ms=500))
+        self.assertEqual(b''.join(chunks), self.samples.tobytes())
+
+
+def fake_opuslib():
+    """Minimal stand-in for opuslib that records codec creations and state resets"""
+    module = types.SimpleNamespace(created=[], resets=[])
+
+    class Codec:
+        def __init__(self, *args):
+            self._state = object()
+            module.created.append(args)
+
+    def ctl(state, request):
+        module.resets.append((state, request))
+
+    module.Encoder = Codec
+    module.Decoder = Codec
+    module.exceptions = types.SimpleNamespace(OpusError=RuntimeError)
+    module.api = types.SimpleNamespace(encoder=types.SimpleNamespace(ctl=ctl),
+                                       decoder=types.SimpleNamespace(ctl=ctl),
+                                       ctl=types.SimpleNamespace(reset_state='reset_state'))
+    return module
+
+
+class TestOpusCodecPool(unittest.TestCase):
+
+    def setUp(self):
+        self.opuslib = fake_opuslib()
+        patcher = mock.patch.dict(sys.modules, {'opuslib': self.opuslib})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(audio._OPUS_CODECS.__dict__.clear)
+        audio._OPUS_CODECS.__dict__.clear()
+
+    def test_pooled_and_reset(self):
+        mono = AudioFormat(16000, 1, 2)
+        encoder = get_opus_codec('encoder', mono)
+        self.assertEqual(self.opuslib.resets, [])
+        self.assertIs(get_opus_codec('encoder', mono), encoder)
+        # Reset by the state pointer, as reset_state() of opuslib 2.0 is broken
+        self.assertEqual(self.opuslib.resets, [(encoder._state, 'reset_state')])
+        decoder = get_opus_codec('decoder', mono)
+        self.assertIsNot(decoder, encoder)
+        self.assertIsNot(get_opus_codec('encoder', AudioFormat(16000, 2, 2)), encoder)
+        self.assertEqual(len(self.opuslib.created), 3)
+
+    def test_decode_into_preallocated_buffer(self):
+        audio_format = AudioFormat(16000, 2, 2)
+        frame_size = audio.get_opus_frame_size(audio_format.rate)
+        num_samples = 2 * frame_size + 10
+        chunks = [b'a', b'bb', b'ccc']
+        opus_file = io.BytesIO(b''.join(audio.pack_number(len(chunk), audio.OPUS_CHUNK_LEN_SIZE) + chunk
+                                        for chunk in chunks))
+
+        def decode(state, chunk, chunk_len, target, max_samples, fec):
+            self.assertEqual((chunk_len, max_samples, fec), (len(chunk), frame_size, 0))
+            for index in range(max_samples * audio_format.channels):
+                target[index] = chunk_len
+            return max_samples
+
+        samples = np.zeros((audio._get_opus_buffer_samples(num_samples, audio_format), 2), dtype=np.int16)
+        self.assertEqual(len(samples), 3 * frame_size)
+        audio._decode_opus_chunks(opus_file, audio_format, num_samples, samples.ctypes.data, ctypes.c_int16, decode)
+        self.assertEqual(np.unique(samples[:frame_size]).tolist(), [1])
+        self.assertEqual(np.unique(samples[frame_size:2 * frame_size]).tolist(), [2])
+        self.assertEqual(np.unique(samples[2 * frame_size:]).tolist(), [3])
+
+
+@unittest.skipUnless(OPUS_AVAILABLE, 'requires libopus')
+class TestOpus(unittest.TestCase):
+
+    def encode(self, pcm, audio_format):
+        opus_file = io.BytesIO()
+        write_opus(opus_file, pcm, audio_format=audio_format)
+        return opus_file.getvalue()
+
+    def test_round_trip(self):
+        for audio_format in [AudioFormat(16000, 1, 2), AudioFormat(48000, 2, 2)]:
+            # Not a multiple of the Opus frame size
+            pcm = sine_pcm(audio_format.rate, audio_format.channels, duration=1.013)
+            encoded = self.encode(pcm, audio_format)
+            decoded_format, decoded = read_opus(io.BytesIO(encoded))
+            self.assertEqual(decoded_format, audio_format)
+            self.assertEqual(len(decoded), len(pcm))
+            # Lossy, but close
+            error = np.frombuffer(decoded, np.int16).astype(np.float32) - np.frombuffer(pcm, np.int16)
+            self.assertLess(np.sqrt(np.mean(np.square(error))), 3000)
+
+    def test_np_decode_matches_pcm_decode(self):
+        for audio_format in [AudioFormat(16000, 1, 2), AudioFormat(48000, 2, 2)]:
+            encoded = self.encode(sine_pcm(audio_format.rate, audio_format.channels, duration=0.5), audio_format)
+            _, decoded = read_opus(io.BytesIO(encoded))
+            _, samples = read_opus_np(io.BytesIO(encoded))
+            self.assertEqual(samples.dtype, np.float32)
+            self.assertTrue(np.array_equal(samples, pcm_to_np(decoded, audio_format)))
+
+    def test_pooled_codecs_reset(self):
+        audio_format = AudioFormat(16000, 1, 2)
+        pcm = sine_pcm(16000, 1, duration=0.5)
+        other = sine_pcm(16000, 1, duration=0.3, frequency=1000.0)
+        first = self.encode(pcm, audio_format)
+        first_decoded = read_opus(io.BytesIO(first))[1]
+        # Codec state of other data must not leak into later results
+        read_opus(io.BytesIO(self.encode(other, audio_format)))
+        self.assertEqual(self.encode(pcm, audio_format), first)
+        self.assertEqual(read_opus(io.BytesIO(first))[1], first_decoded)
@@ -0,0 +1,270 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from deepspeech_training.util import augmentations
+from deepspeech_training.util.audio import (
+    AUDIO_TYPE_NP,
+    AudioFormat,
+    Sample,
+    gain_db_to_ratio,
+    max_dbfs,
+    normalize_audio,
+    pcm_to_np,
+    write_wav
+)
+from deepspeech_training.util.augmentations import (
+    Overlay,
+    Reverb,
+    Volume,
+    apply_sample_augmentations,
+    get_sample_seed,
+    parse_augmentation
+)
+
+AUDIO_FORMAT = AudioFormat(16000, 1, 2)
+# Overlay source samples of increasing length (CSV order) and distinct constant values
+SOURCE_LENGTHS = [160, 320, 480]
+SOURCE_VALUES = [1000, 2000, 3000]
+
+
+def constant_pcm(value, length):
+    return np.full(length, value, dtype=np.int16).tobytes()
+
+
+class TestOverlay(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.source = os.path.join(self.dir.name, 'noise.csv')
+        self.write_source(SOURCE_VALUES)
+        self.addCleanup(augmentations._remove_temporary_overlay_banks)
+
+    def write_source(self, values):
+        with open(self.source, 'w', encoding='utf8') as csv_file:
+            csv_file.write('wav_filename,wav_filesize,transcript\n')
+            for index, (value, length) in enumerate(zip(values, SOURCE_LENGTHS)):
+                filename = 'noise{}.wav'.format(index)
+                with open(os.path.join(self.dir.name, filename), 'wb') as wav_file:
+                    write_wav(wav_file, constant_pcm(value, length), audio_format=AUDIO_FORMAT)
+                csv_file.write('{},{},noise\n'.format(filename, 44 + 2 * length))
+
+    def expected_bank(self, values=SOURCE_VALUES):
+        return np.concatenate([pcm_to_np(constant_pcm(value, length), AUDIO_FORMAT)[:, 0]
+                               for value, length in zip(values, SOURCE_LENGTHS)])
+
+    def start(self, mode, **kwargs):
+        overlay = Overlay(self.source, mode=mode, **kwargs)
+        overlay.start()
+        self.addCleanup(overlay.stop)
+        return overlay
+
+    def test_parse(self):
+        overlay = parse_augmentation('overlay[source={},mode=sequential,bank_dir=/banks]'.format(self.source))
+        self.assertEqual((overlay.mode, overlay.bank_dir), ('sequential', '/banks'))
+        with self.assertRaises(ValueError):
+            Overlay(self.source, mode='shuffled')
+
+    def test_queue_mode(self):
+        overlay = self.start('queue')
+        values = []
+        for _ in range(5):
+            values.append(int(round(overlay._next_from_queue()[0, 0] * 32768)))
+            overlay.current_sample = None
+        # Every source sample once in source order, then repeated
+        self.assertEqual(values, SOURCE_VALUES + SOURCE_VALUES[:2])
+
+    def test_random_mode(self):
+        overlay = self.start('random')
+        self.assertIsNone(overlay.bank)
+        random.seed(0)
+        starts = set()
+        for _ in range(20):
+            current = overlay._next_from_bank()
+            starts.add(len(SOURCE_LENGTHS) - len(np.unique(current)))
+            # Every layer starts at a sample boundary and runs to the end of the bank
+            self.assertTrue(np.array_equal(current[:, 0], overlay.bank[len(overlay.bank) - len(current):]))
+            overlay.current_sample = None
+        self.assertEqual(starts, {0, 1, 2})
+        self.assertTrue(np.array_equal(overlay.bank, self.expected_bank()))
+
+    def test_sequential_mode(self):
+        overlay = self.start('sequential')
+        first = overlay._next_from_bank()
+        self.assertIn(len(overlay.bank) - len(first), [0, 160, 480])
+        overlay.current_sample = None
+        # Continues with the whole bank after wrapping around
+        self.assertTrue(np.array_equal(overlay._next_from_bank()[:, 0], self.expected_bank()))
+
+    def test_apply(self):
+        for mode in augmentations.OVERLAY_MODES:
+            overlay = self.start(mode, snr=0.0, layers=2)
+            audio = np.full((1000, 1), 0.1, dtype=np.float32)
+            audio[::2] = -0.1
+            sample = Sample(AUDIO_TYPE_NP, audio.copy(), audio_format=AUDIO_FORMAT)
+            overlay.apply(sample)
+            self.assertEqual(sample.audio.shape, audio.shape)
+            self.assertAlmostEqual(float(np.max(np.abs(sample.audio))), 0.1, places=5)
+            self.assertFalse(np.allclose(sample.audio, audio))
+
+    def test_temporary_bank_removed(self):
+        overlay = self.start('random')
+        bank_path = overlay.bank_path
+        self.assertTrue(bank_path.startswith(tempfile.gettempdir()))
+        self.assertTrue(os.path.exists(bank_path + '.bank'))
+        overlay.stop()
+        augmentations._remove_temporary_overlay_banks()
+        self.assertFalse(os.path.exists(bank_path + '.bank'))
+        self.assertFalse(os.path.exists(bank_path + '.index.npy'))
+
+    def test_bank_dir(self):
+        bank_dir = os.path.join(self.dir.name, 'banks')
+        os.mkdir(bank_dir)
+        first_path = self.start('random', bank_dir=bank_dir).bank_path
+        self.assertEqual(os.path.dirname(first_path), bank_dir)
+        # Unchanged source re-uses the bank, which survives the cleanup of temporary banks
+        self.assertEqual(self.start('random', bank_dir=bank_dir).bank_path, first_path)
+        augmentations._remove_temporary_overlay_banks()
+        self.assertTrue(os.path.exists(first_path + '.index.npy'))
+        # Changed source gets a new bank and the former one is removed
+        self.write_source([4000, 5000, 6000])
+        os.utime(self.source, ns=(10 ** 18, 10 ** 18))
+        overlay = self.start('sequential', bank_dir=bank_dir)
+        self.assertNotEqual(overlay.bank_path, first_path)
+        self.assertEqual(sorted(os.listdir(bank_dir)),
+                         sorted(os.path.basename(overlay.bank_path) + suffix for suffix in ['.bank', '.index.npy']))
+        overlay._next_from_bank()
+        self.assertTrue(np.array_equal(overlay.bank, self.expected_bank([4000, 5000, 6000])))
+
+    def test_concurrent_bank_builders(self):
+        bank_dir = os.path.join(self.dir.name, 'banks')
+        os.mkdir(bank_dir)
+        find_files = augmentations.glob.glob
+        nested_paths = []
+
+        def build_concurrently(*args, **kwargs):
+            # Another builder of the same bank completes after this one found no bank and before it removes stale ones
+            if not nested_paths:
+                nested_paths.append(None)
+                nested_paths[0] = augmentations._build_overlay_bank(self.source, bank_dir=bank_dir)
+                self.assertTrue(os.path.exists(nested_paths[0] + '.index.npy'))
+            return find_files(*args, **kwargs)
+
+        with mock.patch.object(augmentations.glob, 'glob', side_effect=build_concurrently), \
+                mock.patch.object(os, 'remove', wraps=os.remove) as remove:
+            bank_path = augmentations._build_overlay_bank(self.source, bank_dir=bank_dir)
+        # The completed bank never got removed and no temporary files are left behind
+        self.assertEqual(bank_path, nested_paths[0])
+        self.assertEqual([path for (path,), _ in remove.call_args_list if not path.endswith('.tmp')], [])
+        self.assertEqual(sorted(os.listdir(bank_dir)),
+                         sorted(os.path.basename(bank_path) + suffix for suffix in ['.bank', '.index.npy']))
+        overlay = self.start('random', bank_dir=bank_dir)
+        overlay._next_from_bank()
+        self.assertTrue(np.array_equal(overlay.bank, self.expected_bank()))
+
+    def test_incomplete_bank_of_current_version_kept(self):
+        bank_dir = os.path.join(self.dir.name, 'banks')
+        os.mkdir(bank_dir)
+        bank_path, prefix = augmentations._get_overlay_bank_path(self.source, bank_dir=bank_dir)
+        # Bank of a concurrent builder that did not write its index yet and a bank of a former source version
+        with open(bank_path + '.bank', 'wb') as bank_file:
+            bank_file.write(self.expected_bank().tobytes())
+        with open(prefix + 'former.bank', 'wb') as bank_file:
+            bank_file.write(b'former')
+        with mock.patch.object(os, 'remove', wraps=os.remove) as remove:
+            self.assertEqual(augmentations._build_overlay_bank(self.source, bank_dir=bank_dir), bank_path)
+            self.assertEqual([call[0][0] for call in remove.call_args_list], [prefix + 'former.bank'])
+        self.assertEqual(sorted(os.listdir(bank_dir)),
+                         sorted(os.path.basename(bank_path) + suffix for suffix in ['.bank', '.index.npy']))
+
+
+def reference_reverb(audio, rate, delay, decay):
+    """Dry signal plus five feedback comb filters y[n] = x[n] + decay * y[n - n_delay], sample by sample"""
+    audio = audio[:, 0].astype(np.float64)
+    decay = gain_db_to_ratio(-decay)
+    result = np.copy(audio)
+    primes = [17, 19, 23, 29, 31]
+    for delay_prime in primes:
+        n_delay = max(16, int(delay * (delay_prime / primes[0]) * rate / 1000.0))
+        layer = np.copy(audio)
+        for n in range(n_delay, len(layer)):
+            layer[n] += decay * layer[n - n_delay]
+        result += layer
+    return normalize_audio(result[:, np.newaxis], dbfs=max_dbfs(audio))
+
+
+class TestReverb(unittest.TestCase):
+
+    def test_matches_comb_filter_recurrence(self):
+        audio = np.random.RandomState(0).uniform(-0.5, 0.5, size=(3000, 1)).astype(np.float32)
+        # Sparse (direct taps) and dense (FFT) impulse responses
+        for delay, decay in [(20.0, 10.0), (5.0, 3.0), (1.0, 0.5), (50.0, 30.0)]:
+            sample = Sample(AUDIO_TYPE_NP, audio.copy(), audio_format=AUDIO_FORMAT)
+            Reverb(delay=str(delay), decay=str(decay)).apply(sample)
+            self.assertEqual(sample.audio.dtype, np.float32)
+            expected = reference_reverb(audio, AUDIO_FORMAT.rate, delay, decay)
+            self.assertLess(np.abs(sample.audio - expected).max(), 1e-5, msg='delay {}, decay {}'.format(delay, decay))
+
+    def test_empty(self):
+        sample = Sample(AUDIO_TYPE_NP, np.zeros((0, 1), dtype=np.float32), audio_format=AUDIO_FORMAT)
+        Reverb().apply(sample)
+        self.assertEqual(len(sample.audio), 0)
+
+
+class TestSeeding(unittest.TestCase):
+
+    def augmented_dbfs(self, seed, shard_index=0):
+        samples = [Sample(AUDIO_TYPE_NP, np.full((100, 1), 0.1, dtype=np.float32), audio_format=AUDIO_FORMAT)
+                   for _ in range(20)]
+        augmented = apply_sample_augmentations(samples, [Volume(p=0.5, dbfs='-20~10')], process_ahead=0,
+                                               seed=seed, shard_index=shard_index)
+        return [round(max_dbfs(sample.audio), 3) for sample in augmented]
+
+    def test_shard_index(self):
+        self.assertNotEqual(get_sample_seed(1, 0, 5), get_sample_seed(1, 0, 5, shard_index=1))
+        self.assertEqual(self.augmented_dbfs(1, shard_index=1), self.augmented_dbfs(1, shard_index=1))
+        self.assertNotEqual(self.augmented_dbfs(1), self.augmented_dbfs(1, shard_index=1))
+
+    def test_global_random_state_untouched(self):
+        random.seed(0)
+        state = random.getstate()
+        self.assertEqual(self.augmented_dbfs(1), self.augmented_dbfs(1))
+        self.assertEqual(random.getstate(), state)
+        # Without seed the global random module is used
+        self.augmented_dbfs(None)
+        self.assertNotEqual(random.getstate(), state)
+
+
+class TestSkip(unittest.TestCase):
+
+    def augmented(self, skip=0, indexable=True):
+        # Augmentations change samples in-place, so every run gets new ones
+        samples = [Sample(AUDIO_TYPE_NP, np.full((100, 1), 0.1, dtype=np.float32), audio_format=AUDIO_FORMAT,
+                          sample_id=str(index)) for index in range(20)]
+
+        class Iterable:
+            def __iter__(self):
+                return iter(samples)
+
+            def __len__(self):
+                return len(samples)
+
+        augmented = apply_sample_augmentations(samples if indexable else Iterable(),
+                                               [Volume(p=0.5, dbfs='-20~10')], process_ahead=0,
+                                               clock=0.0, final_clock=1.0, seed=1, epoch=2, skip=skip)
+        return [(sample.sample_id, round(max_dbfs(sample.audio), 3)) for sample in augmented]
+
+    def test_same_augmentations_as_without_skipping(self):
+        expected = self.augmented()
+        self.assertEqual([sample_id for sample_id, _ in expected], [str(index) for index in range(20)])
+        self.assertEqual(self.augmented(skip=7), expected[7:])
+        self.assertEqual(self.augmented(skip=7, indexable=False), expected[7:])
+        self.assertEqual(self.augmented(skip=20), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import types
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+import tensorflow.compat.v1 as tfv1
+
+from deepspeech_training.util import checkpoints
+from deepspeech_training.util.checkpoints import (
+    AsyncCheckpointSaver,
+    BestWeightsSnapshot,
+    load_pipeline_state,
+    save_pipeline_state
+)
+
+
+class TestAsyncCheckpointSaver(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.weights = tfv1.get_variable('weights', initializer=np.arange(6, dtype=np.float32).reshape(2, 3))
+            self.global_step = tfv1.train.get_or_create_global_step()
+            self.increment = tfv1.group(self.weights.assign_add(tf.ones([2, 3])),
+                                        self.global_step.assign_add(1))
+            self.saver = AsyncCheckpointSaver(max_to_keep=1)
+            self.session = tfv1.Session(graph=self.graph)
+            self.session.run(tfv1.global_variables_initializer())
+        self.addCleanup(self.session.close)
+
+    def checkpoint_files(self, path):
+        return [name for name in os.listdir(self.dir.name) if name.startswith(os.path.basename(path) + '.')]
+
+    def test_save_and_restore(self):
+        prefix = os.path.join(self.dir.name, 'train')
+        first_path = self.saver.save(self.session, prefix, global_step=self.global_step)
+        self.session.run(self.increment)
+        second_path = self.saver.save(self.session, prefix, global_step=self.global_step)
+        self.saver.close()
+        self.assertEqual((first_path, second_path), (prefix + '-0', prefix + '-1'))
+        # Only the latest checkpoint is kept and listed in the state file
+        self.assertEqual(self.checkpoint_files(first_path), [])
+        self.assertNotEqual(self.checkpoint_files(second_path), [])
+        state = tfv1.train.get_checkpoint_state(self.dir.name)
+        self.assertEqual(state.model_checkpoint_path, second_path)
+        self.assertEqual(list(state.all_model_checkpoint_paths), [second_path])
+        # Restorable by the synchronous saver
+        with self.graph.as_default():
+            self.session.run(tfv1.global_variables_initializer())
+            tfv1.train.Saver().restore(self.session, second_path)
+        weights, global_step = self.session.run([self.weights, self.global_step])
+        self.assertTrue(np.array_equal(weights, np.arange(6, dtype=np.float32).reshape(2, 3) + 1))
+        self.assertEqual(global_step, 1)
+
+    def test_latest_filename(self):
+        prefix = os.path.join(self.dir.name, 'best_dev')
+        path = self.saver.save(self.session, prefix, global_step=7, latest_filename='best_dev_checkpoint')
+        self.saver.close()
+        self.assertEqual(path, prefix + '-7')
+        state = tfv1.train.get_checkpoint_state(self.dir.name, latest_filename='best_dev_checkpoint')
+        self.assertEqual(state.model_checkpoint_path, path)
+        self.assertIsNone(tfv1.train.get_checkpoint_state(self.dir.name))
+
+    def test_numpy_global_step(self):
+        # As fetched by the training loop
+        global_step = self.session.run(self.global_step)
+        self.assertIsInstance(global_step, np.int64)
+        path = self.saver.save(self.session, os.path.join(self.dir.name, 'train'), global_step=global_step)
+        self.saver.close()
+        self.assertEqual(path, os.path.join(self.dir.name, 'train-0'))
+        self.assertEqual(tfv1.train.get_checkpoint_state(self.dir.name).model_checkpoint_path, path)
+
+
+class TestBestWeightsSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.weights = tfv1.get_variable('layer/weights', initializer=np.arange(6, dtype=np.float32).reshape(2, 3))
+            self.step = tfv1.get_variable('step', initializer=np.int64(5))
+            self.change = tfv1.group(self.weights.assign(tf.zeros([2, 3])), self.step.assign_add(1))
+            self.snapshot = BestWeightsSnapshot()
+            init = tfv1.global_variables_initializer()
+            self.graph.finalize()
+        self.session = tfv1.Session(graph=self.graph)
+        self.addCleanup(self.session.close)
+        self.session.run(init)
+
+    def test_take_and_restore(self):
+        self.snapshot.take(self.session)
+        self.session.run(self.change)
+        self.assertEqual(self.session.run(self.step), 6)
+        self.snapshot.restore(self.session)
+        weights, step = self.session.run([self.weights, self.step])
+        self.assertTrue(np.array_equal(weights, np.arange(6, dtype=np.float32).reshape(2, 3)))
+        self.assertEqual(step, 5)
+        # Shadow variables are neither saved nor initialized with the model
+        self.assertEqual(len(self.graph.get_collection(tfv1.GraphKeys.GLOBAL_VARIABLES)), 2)
+
+    def test_restore_without_snapshot(self):
+        with mock.patch.object(checkpoints, 'reload_best_checkpoint') as reload_best_checkpoint:
+            self.snapshot.restore(self.session)
+            reload_best_checkpoint.assert_called_once_with(self.session)
+
+
+class TestPipelineState(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        flags = types.SimpleNamespace(save_checkpoint_dir=self.dir.name, load_checkpoint_dir=self.dir.name)
+        patcher = mock.patch.object(checkpoints, 'FLAGS', flags)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_round_trip(self):
+        self.assertIsNone(load_pipeline_state(100))
+        save_pipeline_state(3, 1280, np.int64(100))
+        self.assertEqual(load_pipeline_state(np.int64(100)), (3, 1280))
+
+    def test_other_checkpoint(self):
+        save_pipeline_state(3, 1280, 100)
+        # State of a later checkpoint than the loaded one
+        with mock.patch.object(checkpoints, 'log_warn') as log_warn:
+            self.assertIsNone(load_pipeline_state(90))
+            log_warn.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+
+from deepspeech_training.util.feeding import TranscriptEncoder, to_sparse_tuple
+
+
+class CountingAlphabet:
+    """Encodes lower-case ASCII letters as 0-25 and counts calls of Encode"""
+
+    def __init__(self):
+        self.encode_calls = 0
+
+    def CanEncodeSingle(self, ch):
+        return 'a' <= ch <= 'z'
+
+    def CanEncode(self, text):
+        return all(self.CanEncodeSingle(ch) for ch in text)
+
+    def Encode(self, text):
+        self.encode_calls += 1
+        return [ord(ch) - ord('a') for ch in text]
+
+
+class TestToSparseTuple(unittest.TestCase):
+
+    def test_sparse_tuple(self):
+        indices, values, shape = to_sparse_tuple([3, 1, 4, 1])
+        self.assertTrue(np.array_equal(indices, [[0, 0], [0, 1], [0, 2], [0, 3]]))
+        self.assertEqual(indices.dtype, np.int64)
+        self.assertTrue(np.array_equal(values, [3, 1, 4, 1]))
+        self.assertEqual(values.dtype, np.int32)
+        self.assertTrue(np.array_equal(shape, [1, 4]))
+        self.assertEqual(shape.dtype, np.int64)
+
+
+class TestTranscriptEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.alphabet = CountingAlphabet()
+        self.encoder = TranscriptEncoder(self.alphabet)
+
+    def test_encode(self):
+        indices, values, shape = self.encoder.encode('bad')
+        self.assertTrue(np.array_equal(indices, [[0, 0], [0, 1], [0, 2]]))
+        self.assertTrue(np.array_equal(values, [1, 0, 3]))
+        self.assertTrue(np.array_equal(shape, [1, 3]))
+
+    def test_memoized(self):
+        first = self.encoder.encode('bad')
+        second = self.encoder.encode('bad')
+        self.assertEqual(self.alphabet.encode_calls, 1)
+        for first_array, second_array in zip(first, second):
+            self.assertIs(first_array, second_array)
+            # Shared arrays must not be altered by one sample's pipeline
+            self.assertFalse(second_array.flags.writeable)
+        self.encoder.encode('cab')
+        self.assertEqual(self.alphabet.encode_calls, 2)
+
+    def test_errors_not_memoized(self):
+        for _ in range(2):
+            with self.assertRaisesRegex(ValueError, 'sample.wav'):
+                self.encoder.encode('b4d', context='sample.wav')
+            with self.assertRaisesRegex(ValueError, 'empty transcript'):
+                self.encoder.encode('')
+        self.assertEqual(self.encoder.encoded, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import json
+import tempfile
+import unittest
+
+from deepspeech_training.util.profiling import (
+    StepTimings,
+    Timings,
+    append_json_report,
+    format_step_summary,
+    format_summary
+)
+
+
+class TestTimings(unittest.TestCase):
+
+    def test_summary(self):
+        timings = Timings()
+        for duration in [0.1, 0.2, 0.3, 0.4]:
+            timings.add('reverb', duration)
+        timings.update({'reverb': 1.0, 'volume': 0.5})
+        summary = timings.summary()
+        self.assertEqual(sorted(summary.keys()), ['reverb', 'volume'])
+        reverb = summary['reverb']
+        self.assertEqual(reverb['calls'], 5)
+        self.assertAlmostEqual(reverb['total_time'], 2.0)
+        self.assertAlmostEqual(reverb['mean_time'], 400.0)
+        self.assertAlmostEqual(reverb['p95_time'], 880.0)
+        self.assertAlmostEqual(reverb['calls_per_second'], 2.5)
+        self.assertEqual(summary['volume']['calls'], 1)
+
+    def test_zero_time(self):
+        timings = Timings()
+        timings.add('volume', 0.0)
+        self.assertEqual(timings.summary()['volume']['calls_per_second'], 0.0)
+        # Also valid JSON
+        json.dumps(timings.summary(), allow_nan=False)
+
+    def test_reset(self):
+        timings = Timings()
+        timings.add('volume', 1.0)
+        timings.reset()
+        self.assertEqual(timings.summary(), {})
+
+    def test_format_summary(self):
+        timings = Timings()
+        timings.update({'volume': 0.5, 'reverb': 1.0})
+        timings.add('codec', 0.0)
+        lines = format_summary(timings.summary()).split('\n')
+        self.assertEqual(lines[0].split(), ['operation', 'calls', 'total', '(s)', 'mean', '(ms)', 'p95', '(ms)',
+                                            'calls/s'])
+        # Ordered by total time
+        self.assertEqual([line.split()[0] for line in lines[1:]], ['reverb', 'volume', 'codec'])
+        self.assertEqual(lines[1].split(), ['reverb', '1', '1.00', '1000.00', '1000.00', '1.0'])
+        self.assertEqual(lines[3].split()[-1], '0.0')
+
+
+class TestStepTimings(unittest.TestCase):
+
+    def test_summary(self):
+        timings = StepTimings(window=2)
+        timings.add(1.0, 1.0, 0.0, 8)
+        timings.add(0.1, 0.8, 0.1, 16)
+        timings.add(0.3, 0.6, 0.1, 16)
+        summary = timings.summary()
+        # Only the last two steps are kept
+        self.assertEqual(summary['steps'], 2)
+        self.assertAlmostEqual(summary['input_wait'], 200.0)
+        self.assertAlmostEqual(summary['compute'], 700.0)
+        self.assertAlmostEqual(summary['summaries'], 100.0)
+        self.assertAlmostEqual(summary['input_fraction'], 0.2)
+        self.assertAlmostEqual(summary['samples_per_second'], 16.0)
+
+    def test_empty_and_zero_time(self):
+        timings = StepTimings()
+        self.assertEqual(timings.summary(), {})
+        timings.add(0.0, 0.0, 0.0, 8)
+        summary = timings.summary()
+        self.assertEqual((summary['input_fraction'], summary['samples_per_second']), (0.0, 0.0))
+        timings.reset()
+        self.assertEqual(timings.summary(), {})
+
+    def test_format_step_summary(self):
+        timings = StepTimings()
+        timings.add(0.25, 0.75, 0.0, 32)
+        self.assertEqual(format_step_summary(timings.summary()),
+                         '1 steps: 250.0 ms input wait (25%), 750.0 ms compute, 0.0 ms summaries per step, '
+                         '32.0 samples/s')
+
+
+class TestJsonReport(unittest.TestCase):
+
+    def test_append(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report_path = os.path.join(tmp_dir, 'report.json')
+            append_json_report(report_path, {'epoch': 0})
+            append_json_report(report_path, {'epoch': 1})
+            with open(report_path) as report_file:
+                self.assertEqual(json.load(report_file), [{'epoch': 0}, {'epoch': 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
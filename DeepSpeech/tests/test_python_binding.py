@@ -0,0 +1,55 @@
+import os
+import array
+import unittest
+
+import numpy as np
+
+try:
+    from deepspeech import Model
+except ImportError:
+    Model = None
+
+# Binding tests need the built Python package and a model, e.g. from a release
+MODEL_PATH = os.environ.get('DEEPSPEECH_TEST_MODEL')
+
+
+@unittest.skipUnless(Model is not None and MODEL_PATH, 'requires the deepspeech package and DEEPSPEECH_TEST_MODEL')
+class TestAudioBufferTypemap(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = Model(MODEL_PATH)
+        rate = cls.model.sampleRate()
+        time = np.arange(rate) / rate
+        cls.samples = (3000 * np.sin(2 * np.pi * 220 * time) +
+                       np.random.RandomState(0).normal(0, 300, rate)).astype(np.int16)
+        cls.expected = cls.model.stt(cls.samples)
+
+    def assert_same_transcript(self, audio_buffer):
+        self.assertEqual(self.model.stt(audio_buffer), self.expected)
+        stream = self.model.createStream()
+        stream.feedAudioContent(audio_buffer)
+        self.assertEqual(stream.finishStream(), self.expected)
+
+    def test_zero_copy_buffers(self):
+        self.assert_same_transcript(self.samples.tobytes())
+        self.assert_same_transcript(bytearray(self.samples.tobytes()))
+        self.assert_same_transcript(memoryview(self.samples))
+        self.assert_same_transcript(array.array('h', self.samples.tobytes()))
+
+    def test_float32_conversion(self):
+        floats = self.samples.astype(np.float32) / 32767
+        self.assertEqual(self.model.stt(floats), self.expected)
+
+    def test_numpy_conversion_fallback(self):
+        self.assert_same_transcript(self.samples.tolist())
+        self.assert_same_transcript(self.samples.astype('>i2'))
+        self.assert_same_transcript(np.repeat(self.samples, 2)[::2])
+
+    def test_odd_raw_buffer(self):
+        with self.assertRaises(ValueError):
+            self.model.stt(self.samples.tobytes()[:-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
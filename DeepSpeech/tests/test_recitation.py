@@ -0,0 +1,114 @@
+import os
+import unittest
+import importlib.util
+
+RECITATION_PATH = os.path.join(os.path.dirname(__file__), '..', 'native_client', 'python', 'recitation.py')
+
+
+def load_recitation_module():
+    spec = importlib.util.spec_from_file_location('deepspeech_recitation', RECITATION_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+recitation = load_recitation_module()
+Mismatch = recitation.Mismatch
+
+EXPECTED = ' '.join('w{}'.format(i) for i in range(100))
+
+
+class StubStream:
+    def __init__(self, transcripts):
+        self.transcripts = list(transcripts)
+
+    def intermediateDecode(self):
+        return self.transcripts.pop(0)
+
+    def finishStream(self):
+        return self.transcripts.pop(0)
+
+
+def recite(first, last, replace=None, drop=None, insert=None):
+    words = ['w{}'.format(i) for i in range(first, last)]
+    if replace:
+        for index, word in replace.items():
+            words[words.index('w{}'.format(index))] = word
+    if drop:
+        for index in drop:
+            words.remove('w{}'.format(index))
+    if insert:
+        for index, word in insert.items():
+            words.insert(words.index('w{}'.format(index)), word)
+    return ' '.join(words)
+
+
+def track(tracker, transcript, step=1):
+    """Feeds the transcript word by word like growing intermediate transcripts and returns all states"""
+    words = transcript.split()
+    return [tracker.update_with(' '.join(words[:end])) for end in range(step, len(words) + step, step)]
+
+
+class TestRecitationTracker(unittest.TestCase):
+
+    def test_alignment(self):
+        tracker = recitation.RecitationTracker(None, EXPECTED)
+        transcript = recite(0, 30, replace={5: 'x'}, drop=[12], insert={20: 'y'})
+        state = track(tracker, transcript)[-1]
+        self.assertEqual(state.position, 30)
+        self.assertEqual(tracker.all_mismatches(), [
+            Mismatch('substitution', 'x', 'w5', 5),
+            Mismatch('deletion', None, 'w12', 12),
+            Mismatch('insertion', 'y', None, 20)
+        ])
+
+    def test_matches_full_alignment_of_final_transcript(self):
+        transcript = recite(0, 40, replace={3: 'a', 30: 'b'}, drop=[17, 18])
+        incremental = recitation.RecitationTracker(None, EXPECTED)
+        track(incremental, transcript, step=3)
+        one_shot = recitation.RecitationTracker(None, EXPECTED, lookback=1000)
+        one_shot.update_with(transcript)
+        self.assertEqual(incremental.all_mismatches(), one_shot.all_mismatches())
+
+    def test_settling(self):
+        tracker = recitation.RecitationTracker(None, EXPECTED, lookback=4)
+        states = track(tracker, recite(0, 20, replace={2: 'x'}))
+        # Mismatches are reported as live until they get settled, then exactly once as settled
+        settled = [mismatch for state in states for mismatch in state.settled]
+        self.assertEqual(settled, [Mismatch('substitution', 'x', 'w2', 2)])
+        self.assertEqual(tracker.settled_mismatches, settled)
+        self.assertEqual(states[3].mismatches, [Mismatch('substitution', 'x', 'w2', 2)])
+        self.assertEqual(states[-1].mismatches, [])
+        # Live state is bounded by the lookback window
+        self.assertEqual(len(tracker.columns), 5)
+
+    def test_changed_intermediate_words(self):
+        tracker = recitation.RecitationTracker(None, EXPECTED)
+        tracker.update_with('w0 w1 x')
+        state = tracker.update_with('w0 w1 w2 w3')
+        self.assertEqual(state.position, 4)
+        self.assertEqual(tracker.all_mismatches(), [])
+
+    def test_far_start_located(self):
+        tracker = recitation.RecitationTracker(None, EXPECTED, start=None)
+        state = track(tracker, recite(50, 70, replace={60: 'x'}))[-1]
+        self.assertEqual(state.position, 70)
+        self.assertEqual(tracker.all_mismatches(), [Mismatch('substitution', 'x', 'w60', 60)])
+
+    def test_far_start_given(self):
+        tracker = recitation.RecitationTracker(None, EXPECTED, start=50)
+        state = track(tracker, recite(52, 70))[-1]
+        self.assertEqual(state.position, 70)
+        self.assertEqual(tracker.all_mismatches(), [Mismatch('deletion', None, 'w50', 50),
+                                                    Mismatch('deletion', None, 'w51', 51)])
+
+    def test_finish(self):
+        tracker = recitation.RecitationTracker(StubStream(['w0 w1', 'w0 w1 w2']), 'w0 w1 w2 w3 w4')
+        self.assertEqual(tracker.update().position, 2)
+        state = tracker.finish()
+        self.assertEqual(state.position, 3)
+        self.assertEqual(state.mismatches, [Mismatch('deletion', None, 'w3', 3), Mismatch('deletion', None, 'w4', 4)])
+
+
+if __name__ == '__main__':
+    unittest.main()
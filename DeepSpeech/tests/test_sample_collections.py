@@ -0,0 +1,166 @@
+import io
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+from deepspeech_training.util import audio
+from deepspeech_training.util.audio import AUDIO_TYPE_PCM, AUDIO_TYPE_WAV, AudioFormat, Sample, write_wav
+from deepspeech_training.util.sample_collections import (
+    CSV,
+    CSV_INDEX_SUFFIX,
+    LabeledSample,
+    TFRecordWriter,
+    WeightedMix,
+    get_mix_counts,
+    get_shard_indices,
+    get_tfrecord_shards
+)
+
+
+def wav_bytes(num_samples, audio_format=AudioFormat(16000, 1, 2)):
+    wav_file = io.BytesIO()
+    write_wav(wav_file, bytes(num_samples * audio_format.channels * audio_format.width), audio_format=audio_format)
+    return bytearray(wav_file.getvalue())
+
+
+class TestSample(unittest.TestCase):
+
+    def test_lazy_header_parsing(self):
+        data = wav_bytes(8000, AudioFormat(8000, 2, 2))
+        with mock.patch.object(audio, 'read_header', wraps=audio.read_header) as read_header, \
+                mock.patch.object(audio, 'read_format', wraps=audio.read_format) as read_format:
+            sample = LabeledSample(AUDIO_TYPE_WAV, data, 'transcript')
+            # Only the transcript got touched so far
+            self.assertEqual(sample.transcript, 'transcript')
+            self.assertEqual((read_header.call_count, read_format.call_count), (0, 0))
+            self.assertIs(sample._audio, data)  # pylint: disable=protected-access
+            self.assertEqual(sample.duration, 1.0)
+            self.assertEqual(sample.duration, 1.0)
+            # Format got parsed together with the duration
+            self.assertEqual(sample.audio_format, AudioFormat(8000, 2, 2))
+            self.assertEqual((read_header.call_count, read_format.call_count), (1, 0))
+
+    def test_lazy_format_parsing(self):
+        sample = Sample(AUDIO_TYPE_WAV, wav_bytes(100))
+        with mock.patch.object(audio, 'read_format', wraps=audio.read_format) as read_format:
+            self.assertEqual(sample.audio_format, AudioFormat(16000, 1, 2))
+            self.assertEqual(sample.audio_format, AudioFormat(16000, 1, 2))
+            self.assertEqual(read_format.call_count, 1)
+
+    def test_cached_duration_invalidated(self):
+        sample = Sample(AUDIO_TYPE_PCM, bytes(32000), audio_format=AudioFormat(16000, 1, 2))
+        self.assertEqual(sample.duration, 1.0)
+        sample.audio_format = AudioFormat(8000, 1, 2)
+        self.assertEqual(sample.duration, 2.0)
+        sample.audio = bytes(8000)
+        self.assertEqual(sample.duration, 0.5)
+
+    def test_pickling(self):
+        sample = LabeledSample(AUDIO_TYPE_WAV, wav_bytes(1600), 'transcript', sample_id='id')
+        self.assertFalse(hasattr(sample, '__dict__'))
+        unpickled = pickle.loads(pickle.dumps(sample))
+        self.assertEqual((unpickled.audio_type, unpickled.sample_id, unpickled.transcript),
+                         (AUDIO_TYPE_WAV, 'id', 'transcript'))
+        self.assertEqual(unpickled.duration, 0.1)
+        # With cached header values and converted audio
+        sample.change_audio_type(AUDIO_TYPE_PCM)
+        unpickled = pickle.loads(pickle.dumps(sample))
+        self.assertEqual((unpickled.audio_type, unpickled.audio_format, unpickled.duration),
+                         (AUDIO_TYPE_PCM, AudioFormat(16000, 1, 2), 0.1))
+        self.assertEqual(unpickled.audio, sample.audio)
+
+
+class TestCSV(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.csv_filename = os.path.join(self.dir.name, 'samples.csv')
+        with open(self.csv_filename, 'w', encoding='utf8') as csv_file:
+            csv_file.write('wav_filename,wav_filesize,transcript\n')
+            csv_file.write('a.wav,30,"one, two"\n/data/b.wav,10,three\nc.wav,30,ü\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def entries(self, samples):
+        return [(samples._get_filename(index), samples.transcripts[index]) for index in samples.order]
+
+    def test_order_and_paths(self):
+        samples = CSV(self.csv_filename)
+        self.assertTrue(samples.labeled)
+        self.assertEqual(self.entries(samples), [
+            ('/data/b.wav', 'three'),
+            (os.path.join(self.dir.name, 'a.wav'), 'one, two'),
+            (os.path.join(self.dir.name, 'c.wav'), 'ü')
+        ])
+        self.assertEqual(list(CSV(self.csv_filename, reverse=True).order), [0, 2, 1])
+
+    def test_index_cache(self):
+        parsed = self.entries(CSV(self.csv_filename))
+        self.assertTrue(os.path.exists(self.csv_filename + CSV_INDEX_SUFFIX))
+        self.assertEqual(self.entries(CSV(self.csv_filename)), parsed)
+        with open(self.csv_filename, 'a', encoding='utf8') as csv_file:
+            csv_file.write('d.wav,20,four\n')
+        self.assertEqual(len(CSV(self.csv_filename)), 4)
+
+    def test_missing_transcripts(self):
+        with open(self.csv_filename, 'w', encoding='utf8') as csv_file:
+            csv_file.write('wav_filename\na.wav\n')
+        self.assertFalse(CSV(self.csv_filename).labeled)
+        with self.assertRaises(RuntimeError):
+            CSV(self.csv_filename, labeled=True)
+
+
+class TestSharding(unittest.TestCase):
+
+    def test_snake_order(self):
+        self.assertEqual([list(get_shard_indices(10, 3, i)) for i in range(3)],
+                         [[0, 5, 6], [1, 4, 7], [2, 3, 8, 9]])
+
+    def test_balanced(self):
+        lengths = list(range(1000))
+        shards = [get_shard_indices(len(lengths), 4, i, drop_remainder=True) for i in range(4)]
+        self.assertEqual(sorted(index for shard in shards for index in shard), lengths)
+        totals = [sum(lengths[index] for index in shard) for shard in shards]
+        self.assertEqual(len(set(len(shard) for shard in shards)), 1)
+        self.assertLess(max(totals) - min(totals), len(lengths))
+
+
+class TestTFRecord(unittest.TestCase):
+
+    def test_sharded_writer(self):
+        import tensorflow as tf  # pylint: disable=import-outside-toplevel
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tfrecord_filename = os.path.join(tmp_dir, 'samples.tfrecord')
+            with TFRecordWriter(tfrecord_filename, num_shards=2) as writer:
+                for i in range(5):
+                    writer.add(LabeledSample(AUDIO_TYPE_PCM, bytes(320), str(i), audio_format=AudioFormat(16000, 1, 2)))
+            shards = get_tfrecord_shards(tfrecord_filename)
+            self.assertEqual([os.path.basename(shard) for shard in shards],
+                             ['samples-00000-of-00002.tfrecord', 'samples-00001-of-00002.tfrecord'])
+            self.assertEqual([sum(1 for _ in tf.compat.v1.io.tf_record_iterator(shard)) for shard in shards], [3, 2])
+
+
+class TestWeightedMix(unittest.TestCase):
+
+    def test_counts(self):
+        self.assertEqual(list(get_mix_counts([100, 1000])), [100, 1000])
+        self.assertEqual(list(get_mix_counts([100, 1000], weights=[0.0, 1.0])), [0, 1100])
+        # Relative weights at a fixed total - not absolute sampling rates
+        self.assertEqual(list(get_mix_counts([300, 300], weights=[2.0, 1.0])), [400, 200])
+        self.assertEqual(list(get_mix_counts([300, 300], weights=[4.0, 2.0])), [400, 200])
+        small, big = get_mix_counts([100, 1000], temperature=2.0)
+        self.assertGreater(small, 100)
+        self.assertEqual(small + big, 1100)
+
+    def test_order(self):
+        short_to_long = [[(length, 'a') for length in range(0, 100, 10)], [(length, 'b') for length in range(0, 100, 2)]]
+        mix = list(WeightedMix(short_to_long, weights=[3.0, 1.0]))
+        self.assertEqual(len(mix), 60)
+        # 3 * 10 vs. 1 * 50 samples
+        self.assertEqual(sum(1 for _, source in mix if source == 'a'), 22)
+        self.assertEqual(len(set(sample for sample in mix if sample[1] == 'a')), 10)
+        # Approximately ordered by length
+        self.assertLessEqual(max(abs(length - 100 * index / len(mix)) for index, (length, _) in enumerate(mix)), 10)
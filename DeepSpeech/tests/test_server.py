@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+import unittest
+import importlib.util
+
+import numpy as np
+
+SERVER_PATH = os.path.join(os.path.dirname(__file__), '..', 'native_client', 'python', 'server.py')
+
+
+def load_server_module():
+    spec = importlib.util.spec_from_file_location('deepspeech_server', SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+server = load_server_module()
+
+
+class StubStream:
+    """Stands in for a native stream and records any use after it got finished or freed"""
+    def __init__(self, feed_time=0.05):
+        self.feed_time = feed_time
+        self.fed = 0
+        self.feeding = False
+        self.closed = False
+        self.violations = []
+
+    def _check(self, operation):
+        if self.closed:
+            self.violations.append(operation + ' after close')
+        if self.feeding:
+            self.violations.append(operation + ' while feeding')
+
+    def feedAudioContent(self, audio):
+        self._check('feed')
+        self.feeding = True
+        time.sleep(self.feed_time)
+        self.fed += len(audio)
+        self.feeding = False
+
+    def intermediateDecode(self):
+        self._check('decode')
+        return 'fed {}'.format(self.fed)
+
+    def finishStream(self):
+        self._check('finish')
+        self.closed = True
+        return 'fed {}'.format(self.fed)
+
+    def freeStream(self):
+        self._check('free')
+        self.closed = True
+
+
+class StubModel:
+    def __init__(self):
+        self.streams = []
+
+    def sampleRate(self):
+        return 16000
+
+    def createStream(self):
+        stream = StubStream()
+        self.streams.append(stream)
+        return stream
+
+
+class TestStreamingServer(unittest.TestCase):
+
+    def setUp(self):
+        self.model = StubModel()
+        self.server = server.StreamingServer(('127.0.0.1', 0), self.model, batch_window_ms=1, workers=2)
+
+    def tearDown(self):
+        self.server.server_close()
+
+    def test_feed_and_finish(self):
+        session = self.server.create_session()
+        for _ in range(3):
+            self.server.batcher.submit(session, np.zeros(160, dtype=np.int16)).wait()
+        self.assertIsNone(session.error)
+        self.assertEqual(session.transcript, 'fed 480')
+        self.assertEqual(session.close(finish=True), 'fed 480')
+        self.assertEqual(self.model.streams[0].violations, [])
+
+    def test_finish_waits_for_feeding(self):
+        session = self.server.create_session()
+        done = self.server.batcher.submit(session, np.zeros(160, dtype=np.int16))
+        while not self.model.streams[0].feeding:
+            time.sleep(0.001)
+        self.assertEqual(session.close(finish=True), 'fed 160')
+        done.wait()
+        self.assertEqual(self.model.streams[0].violations, [])
+
+    def test_concurrent_feed_finish_and_expire(self):
+        sessions = [self.server.create_session() for _ in range(8)]
+        events = [self.server.batcher.submit(session, np.zeros(160, dtype=np.int16)) for session in sessions]
+
+        def finish(session):
+            self.server.get_session(session.id, remove=True)
+            session.close(finish=True)
+
+        finishers = [threading.Thread(target=finish, args=(session,)) for session in sessions[:4]]
+        for thread in finishers:
+            thread.start()
+        self.server.stream_timeout = -1
+        self.server.expire_sessions()
+        for thread in finishers:
+            thread.join()
+        for event in events:
+            event.wait()
+        self.assertEqual(self.server.active_sessions(), 0)
+        for stream in self.model.streams:
+            self.assertTrue(stream.closed)
+            self.assertEqual(stream.violations, [])
+
+    def test_feed_after_close(self):
+        session = self.server.create_session()
+        session.close()
+        self.server.batcher.submit(session, np.zeros(160, dtype=np.int16)).wait()
+        self.assertIsInstance(session.error, RuntimeError)
+        self.assertEqual(self.model.streams[0].violations, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import unittest
+import importlib.util
+
+import numpy as np
+
+from deepspeech_training.util.audio import find_voiced_segments
+
+VAD_PATH = os.path.join(os.path.dirname(__file__), '..', 'native_client', 'python', 'vad.py')
+
+
+def load_vad_module():
+    spec = importlib.util.spec_from_file_location('deepspeech_vad', VAD_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+vad = load_vad_module()
+
+SAMPLE_RATE = 16000
+FRAME_SIZE = SAMPLE_RATE * 30 // 1000
+
+
+class StubStream:
+    def __init__(self, index):
+        self._impl = True
+        self.index = index
+        self.audio = []
+        self.finished = False
+        self.freed = False
+
+    def feedAudioContent(self, audio):
+        self.audio.append(np.array(audio))
+
+    def fed_samples(self):
+        return np.concatenate(self.audio) if self.audio else np.zeros(0, dtype=np.int16)
+
+    def intermediateDecode(self):
+        return 'stream {}'.format(self.index)
+
+    def finishStream(self):
+        self.finished = True
+        self._impl = None
+        return 'stream {}'.format(self.index)
+
+    def freeStream(self):
+        self.freed = True
+        self._impl = None
+
+
+class StubModel:
+    def __init__(self):
+        self.streams = []
+
+    def sampleRate(self):
+        return SAMPLE_RATE
+
+    def createStream(self):
+        stream = StubStream(len(self.streams))
+        self.streams.append(stream)
+        return stream
+
+
+def frames(mask):
+    """Loud (speech) and silent frames with their frame index as first sample"""
+    audio = np.zeros((len(mask), FRAME_SIZE), dtype=np.int16)
+    audio[np.asarray(mask, dtype=bool), 1:] = 10000
+    audio[:, 0] = np.arange(len(mask))
+    return audio
+
+
+def fed_frame_indices(stream):
+    return list(stream.fed_samples()[::FRAME_SIZE])
+
+
+class TestAsInt16Samples(unittest.TestCase):
+
+    def test_zero_copy(self):
+        samples = np.arange(-100, 100, dtype=np.int16)
+        self.assertTrue(np.shares_memory(vad.as_int16_samples(samples), samples))
+        converted = vad.as_int16_samples(samples.tobytes())
+        self.assertTrue(np.array_equal(converted, samples))
+
+    def test_conversions(self):
+        samples = np.arange(-100, 100, dtype=np.int16)
+        for audio_buffer in [samples.tolist(), samples.astype('>i2'), np.repeat(samples, 2)[::2]]:
+            self.assertTrue(np.array_equal(vad.as_int16_samples(audio_buffer), samples))
+        floats = np.array([-2.0, -1.0, 0.0, 0.5, 1.0], dtype=np.float32)
+        self.assertEqual(vad.as_int16_samples(floats).tolist(), [-32767, -32767, 0, 16383, 32767])
+
+
+class TestVoiceGate(unittest.TestCase):
+
+    def test_same_segments_as_training_split(self):
+        random = np.random.RandomState(0)
+        for _ in range(20):
+            mask = random.rand(300) < random.uniform(0.2, 0.8)
+            gate = vad.VoiceGate(num_padding_frames=6, threshold=0.5)
+            passed = [index for index, speech in enumerate(mask) for index in gate.push(index, speech)]
+            expected = [index for first, last, _ in find_voiced_segments(mask, num_padding_frames=6, threshold=0.5)
+                        for index in range(first, last + 1)]
+            self.assertEqual(passed, expected)
+
+
+class TestGatedStream(unittest.TestCase):
+
+    def create_stream(self, model, **kwargs):
+        return vad.GatedStream(model, num_padding_frames=4, energy_threshold_dbfs=-30.0, **kwargs)
+
+    def test_silence_dropped(self):
+        model = StubModel()
+        stream = self.create_stream(model)
+        stream.feedAudioContent(frames([False] * 50).reshape(-1))
+        self.assertEqual(len(model.streams[0].fed_samples()), 0)
+        self.assertEqual(stream.voicedDuration(), 0.0)
+
+    def test_padding_kept(self):
+        model = StubModel()
+        stream = self.create_stream(model)
+        mask = [False] * 10 + [True] * 10 + [False] * 10
+        audio = frames(mask).reshape(-1)
+        # Chunks that do not align with VAD frames
+        for chunk_start in range(0, len(audio), 1000):
+            stream.feedAudioContent(audio[chunk_start:chunk_start + 1000])
+        # Triggered by the 3rd speech frame, ended by the 3rd silent frame
+        self.assertEqual(fed_frame_indices(model.streams[0]), list(range(9, 23)))
+        self.assertAlmostEqual(stream.voicedDuration(), 14 * 0.03)
+
+    def test_silence_timeout_finishes_utterance(self):
+        model = StubModel()
+        stream = self.create_stream(model, silence_timeout_ms=300)
+        mask = [True] * 10 + [False] * 20 + [True] * 10
+        stream.feedAudioContent(frames(mask).tobytes())
+        self.assertTrue(model.streams[0].finished)
+        self.assertEqual(stream.segments, ['stream 0'])
+        self.assertEqual(fed_frame_indices(model.streams[0]), list(range(0, 13)))
+        self.assertEqual(fed_frame_indices(model.streams[1]), list(range(29, 40)))
+        self.assertEqual(stream.finishStream(), 'stream 1')
+
+    def test_silence_timeout_reset(self):
+        model = StubModel()
+        stream = self.create_stream(model, silence_timeout_ms=300, on_silence='reset')
+        stream.feedAudioContent(frames([True] * 10 + [False] * 20).reshape(-1))
+        self.assertTrue(model.streams[0].freed)
+        self.assertEqual(stream.segments, [])
+        self.assertEqual(len(model.streams), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,6 +17,8 @@ import tensorflow as tf
 import tensorflow.compat.v1 as tfv1
 import time
 
+from collections import Counter
+
 tfv1.logging.set_verbosity({
     '0': tfv1.logging.DEBUG,
     '1': tfv1.logging.INFO,
@@ -28,13 +30,16 @@ from datetime import datetime
 from ds_ctcdecoder import ctc_beam_search_decoder, Scorer
 from .evaluate import evaluate
 from six.moves import zip, range
+from .util.augmentations import Overlay
 from .util.config import Config, initialize_globals
-from .util.checkpoints import load_or_init_graph_for_training, load_graph_for_evaluation, reload_best_checkpoint
+from .util.checkpoints import load_or_init_graph_for_training, load_graph_for_evaluation, save_pipeline_state, \
+    load_pipeline_state, create_checkpoint_saver, AsyncCheckpointSaver, BestWeightsSnapshot
 from .util.evaluate_tools import save_samples_json
 from .util.feeding import create_dataset, audio_to_features, audiofile_to_features
 from .util.flags import create_flags, FLAGS
 from .util.helpers import check_ctcdecoder_version, ExceptionBox
 from .util.logging import create_progressbar, log_debug, log_error, log_info, log_progress, log_warn
+from .util.profiling import Timings, StepTimings, append_json_report, summary_to_tf_summary, format_step_summary
 from .util.io import open_remote, remove_remote, listdir_remote, is_remote_path, isdir_remote
 
 check_ctcdecoder_version()
@@ -232,8 +237,13 @@ def calculate_mean_edit_distance_and_loss(iterator, dropout, reuse):
     Next to total and average loss it returns the mean edit distance,
     the decoded result and the batch's original Y.
     '''
-    # Obtain the next batch of data
-    batch_filenames, (batch_x, batch_seq_len), batch_y = iterator.get_next()
+    # Obtain the next batch of data - timestamps around it measure how long the step waits for the input pipeline
+    input_start = tf.timestamp()
+    with tf.control_dependencies([input_start]):
+        batch_filenames, (batch_x, batch_seq_len), batch_y = iterator.get_next()
+    with tf.control_dependencies([batch_filenames, batch_x, batch_seq_len]):
+        tfv1.add_to_collection('step_input_wait', tf.timestamp() - input_start)
+    tfv1.add_to_collection('step_samples', tf.size(batch_filenames))
 
     if FLAGS.train_cudnn:
         rnn_impl = rnn_impl_cudnn_rnn
@@ -410,6 +420,24 @@ def log_grads_and_vars(grads_and_vars):
         log_variable(variable, gradient=gradient)
 
 
+def write_augmentation_timings(summary, epoch, step, summary_writer):
+    summary_writer.add_summary(summary_to_tf_summary(summary, 'augmentations'), step)
+    summary_writer.flush()
+    append_json_report(os.path.join(FLAGS.summary_dir, 'augmentations.json'),
+                       {'epoch': epoch, 'step': int(step), 'operations': summary})
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]['total_time']):
+        log_debug('Augmentation timing of "{}": {} calls, {:.2f} ms mean, {:.2f} ms p95'.format(
+            name, stats['calls'], stats['mean_time'], stats['p95_time']))
+
+
+def log_step_timings(summary, set_name):
+    log_info('{} step timing of the last {}'.format(set_name, format_step_summary(summary)))
+    if summary['input_fraction'] > FLAGS.input_bound_threshold:
+        log_warn('{} is input-bound: {:.0%} of the step time is spent waiting for samples - consider pre-augmenting '
+                 'with bin/data_set_tool.py, a --feature_cache or a bigger --read_buffer'.format(
+                     set_name, summary['input_fraction']))
+
+
 def train():
     exception_box = ExceptionBox()
 
@@ -418,6 +446,13 @@ def train():
 
     # Create training and validation datasets
     split_dataset = FLAGS.horovod
+    augmentation_timings = Timings() if FLAGS.profile_augmentations else None
+    train_weights = [float(weight) for weight in FLAGS.train_weights.split(',')] if FLAGS.train_weights else None
+    if FLAGS.augmentation_seed is not None and any(isinstance(augmentation, Overlay) and augmentation.mode != 'random'
+                                                   for augmentation in Config.augmentations):
+        log_warn('Overlay augmentations are only reproducible in mode "random"')
+    # Epoch and number of samples to skip for the next (resumed) run of the training set
+    train_position = Counter()
 
     train_set = create_dataset(FLAGS.train_files.split(','),
                                batch_size=FLAGS.train_batch_size,
@@ -430,7 +465,12 @@ def train():
                                reverse=FLAGS.reverse_train,
                                limit=FLAGS.limit_train,
                                buffering=FLAGS.read_buffer,
-                               split_dataset=split_dataset)
+                               split_dataset=split_dataset,
+                               timings=augmentation_timings,
+                               augmentation_seed=FLAGS.augmentation_seed,
+                               weights=train_weights,
+                               temperature=FLAGS.train_temperature,
+                               epoch_counter=train_position)
 
     iterator = tfv1.data.Iterator.from_structure(tfv1.data.get_output_types(train_set),
                                                  tfv1.data.get_output_shapes(train_set),
@@ -517,6 +557,9 @@ def train():
 
     # Summaries
     step_summaries_op = tfv1.summary.merge_all('step_summaries')
+    # Input wait of the slowest tower and samples of all towers
+    step_timing_ops = [tf.reduce_max(tfv1.get_collection('step_input_wait')),
+                       tf.add_n(tfv1.get_collection('step_samples'))] if FLAGS.profile_steps > 0 else []
     step_summary_writers = {
         'train': tfv1.summary.FileWriter(os.path.join(FLAGS.summary_dir, 'train'), max_queue=120),
         'dev': tfv1.summary.FileWriter(os.path.join(FLAGS.summary_dir, 'dev'), max_queue=120),
@@ -531,10 +574,10 @@ def train():
 
     # Checkpointing
     if Config.is_master_process:
-        checkpoint_saver = tfv1.train.Saver(max_to_keep=FLAGS.max_to_keep)
+        checkpoint_saver = create_checkpoint_saver(max_to_keep=FLAGS.max_to_keep)
         checkpoint_path = os.path.join(FLAGS.save_checkpoint_dir, 'train')
 
-        best_dev_saver = tfv1.train.Saver(max_to_keep=1)
+        best_dev_saver = create_checkpoint_saver(max_to_keep=1)
         best_dev_path = os.path.join(FLAGS.save_checkpoint_dir, 'best_dev')
 
         # Save flags next to checkpoints
@@ -544,6 +587,9 @@ def train():
         with open_remote(flags_file, 'w') as fout:
             fout.write(FLAGS.flags_into_string())
 
+    # Best validating weights for rolling back on a plateau
+    best_weights = BestWeightsSnapshot() if FLAGS.reduce_lr_on_plateau and FLAGS.dev_files else None
+
     if FLAGS.horovod:
         bcast = hvd.broadcast_global_variables(0)
 
@@ -558,6 +604,18 @@ def train():
         if FLAGS.horovod:
             bcast.run()
 
+        # Samples each rank consumes per training step - one tower per rank with Horovod
+        # (where Config.num_devices is the number of ranks), otherwise one per local device
+        samples_per_step = (1 if FLAGS.horovod else len(Config.available_devices)) * FLAGS.train_batch_size
+        start_epoch = 0
+        if FLAGS.resume_pipeline:
+            pipeline_state = load_pipeline_state(session.run(global_step))
+            if pipeline_state is not None:
+                start_epoch, start_sample = pipeline_state
+                train_position['epoch'] = start_epoch
+                train_position['skip'] = start_sample
+                log_info('Resuming input pipeline at sample {} of epoch {}'.format(start_sample, start_epoch))
+
         def run_set(set_name, epoch, init_op, dataset=None):
             is_train = set_name == 'train'
             train_op = apply_gradient_op if is_train else []
@@ -565,9 +623,11 @@ def train():
 
             total_loss = 0.0
             step_count = 0
+            skipped_samples = train_position['skip'] if is_train else 0
 
             step_summary_writer = step_summary_writers.get(set_name)
             checkpoint_time = time.time()
+            step_timings = StepTimings(window=FLAGS.profile_steps) if FLAGS.profile_steps > 0 else None
 
             if is_train and FLAGS.cache_for_epochs > 0 and FLAGS.feature_cache:
                 feature_cache_index = FLAGS.feature_cache + '.index'
@@ -598,9 +658,11 @@ def train():
             # Batch loop
             while True:
                 try:
-                    _, current_step, batch_loss, problem_files, step_summary = \
-                        session.run([train_op, global_step, loss, non_finite_files, step_summaries_op],
+                    run_start = time.perf_counter()
+                    _, current_step, batch_loss, problem_files, step_summary, step_timing = \
+                        session.run([train_op, global_step, loss, non_finite_files, step_summaries_op, step_timing_ops],
                                     feed_dict=feed_dict)
+                    run_time = time.perf_counter() - run_start
                     exception_box.raise_if_set()
                 except tf.errors.OutOfRangeError:
                     exception_box.raise_if_set()
@@ -614,15 +676,35 @@ def train():
                 total_loss += batch_loss
                 step_count += 1
 
+                summary_time = 0.0
                 if Config.is_master_process:
                     pbar.update(step_count)
 
+                    summary_start = time.perf_counter()
                     step_summary_writer.add_summary(step_summary, current_step)
+                    summary_time = time.perf_counter() - summary_start
 
                     if is_train and FLAGS.checkpoint_secs > 0 and time.time() - checkpoint_time > FLAGS.checkpoint_secs:
                         checkpoint_saver.save(session, checkpoint_path, global_step=current_step)
+                        if FLAGS.resume_pipeline:
+                            save_pipeline_state(epoch, skipped_samples + step_count * samples_per_step, current_step)
                         checkpoint_time = time.time()
 
+                if step_timings is not None:
+                    input_wait, samples = step_timing
+                    compute_time = max(0.0, run_time - input_wait)
+                    step_timings.add(input_wait, compute_time, summary_time, samples)
+                    if Config.is_master_process:
+                        step_time = run_time + summary_time
+                        step_summary_writer.add_summary(summary_to_tf_summary({'step': {
+                            'input_wait': 1000.0 * input_wait,
+                            'compute': 1000.0 * compute_time,
+                            'summaries': 1000.0 * summary_time,
+                            'samples_per_second': samples / step_time if step_time > 0 else 0.0
+                        }}, 'timing'), current_step)
+                        if step_count % FLAGS.profile_steps == 0:
+                            log_step_timings(step_timings.summary(), human_readable_set_names[set_name])
+
             if Config.is_master_process:
                 pbar.finish()
             mean_loss = total_loss / step_count if step_count > 0 else 0.0
@@ -634,7 +716,7 @@ def train():
         dev_losses = []
         epochs_without_improvement = 0
         try:
-            for epoch in range(FLAGS.epochs):
+            for epoch in range(start_epoch, FLAGS.epochs):
                 # Training
                 if Config.is_master_process:
                     log_progress('Training epoch %d...' % epoch)
@@ -642,6 +724,13 @@ def train():
                 if Config.is_master_process:
                     log_progress('Finished training epoch %d - loss: %f' % (epoch, train_loss))
                     checkpoint_saver.save(session, checkpoint_path, global_step=global_step)
+                    if FLAGS.resume_pipeline:
+                        save_pipeline_state(epoch + 1, 0, session.run(global_step))
+                if augmentation_timings is not None and augmentation_timings.durations:
+                    if Config.is_master_process:
+                        write_augmentation_timings(augmentation_timings.summary(), epoch, session.run(global_step),
+                                                   step_summary_writers['train'])
+                    augmentation_timings.reset()
 
                 if FLAGS.dev_files:
                     # Validation
@@ -666,10 +755,12 @@ def train():
                     else:
                         epochs_without_improvement = 0
 
-                    if Config.is_master_process:
-                        # Save new best model
-                        if dev_loss < best_dev_loss:
-                            best_dev_loss = dev_loss
+                    # Save new best model
+                    if dev_loss < best_dev_loss:
+                        best_dev_loss = dev_loss
+                        if best_weights is not None:
+                            best_weights.take(session)
+                        if Config.is_master_process:
                             save_path = best_dev_saver.save(session, best_dev_path, global_step=global_step,
                                                             latest_filename='best_dev_checkpoint')
                             log_info("Saved new best validating model with loss %f to: %s" % (best_dev_loss, save_path))
@@ -689,11 +780,14 @@ def train():
                         and epochs_without_improvement > 0
                         and epochs_without_improvement % FLAGS.plateau_epochs == 0
                     ):
-                        # Reload checkpoint that we use the best_dev weights again
-                        reload_best_checkpoint(session)
+                        # Restore the best_dev weights from their in-memory snapshot
+                        best_weights.restore(session)
+                        if FLAGS.horovod:
+                            bcast.run()
 
-                        # Reduce learning rate
+                        # Reduce learning rate and keep it with the best_dev weights
                         session.run(reduce_learning_rate_op)
+                        best_weights.take(session)
                         current_learning_rate = learning_rate_var.eval()
                         if Config.is_master_process:
                             log_info('Encountered a plateau, reducing learning rate to {}'.format(
@@ -718,6 +812,23 @@ def train():
 
         except KeyboardInterrupt:
             pass
+        finally:
+            if Config.is_master_process:
+                # Finish checkpoints that are still being written
+                propagating = sys.exc_info()[1] is not None
+                close_error = None
+                for saver in [checkpoint_saver, best_dev_saver]:
+                    if isinstance(saver, AsyncCheckpointSaver):
+                        try:
+                            saver.close()
+                        except Exception as e:  # pylint: disable=broad-except
+                            # Not masking the exception that is already propagating
+                            if propagating:
+                                log_error('Failed to finish writing checkpoint: {}'.format(e))
+                            elif close_error is None:
+                                close_error = e
+                if close_error is not None:
+                    raise close_error
         if Config.is_master_process:
             log_info('FINISHED optimization in {}'.format(datetime.utcnow() - train_start_time))
     log_debug('Session closed.')
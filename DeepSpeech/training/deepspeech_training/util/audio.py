@@ -1,11 +1,15 @@
-import collections
 import ctypes
 import io
 import math
+import itertools
 import numpy as np
 import os
 import pyogg
+import shutil
+import struct
+import subprocess
 import tempfile
+import threading
 import wave
 
 from .helpers import LimitingPool
@@ -33,10 +37,19 @@ OPUS_CHANNELS_SIZE = 1
 OPUS_WIDTH_SIZE = 1
 OPUS_CHUNK_LEN_SIZE = 2
 
+# Number of frames that get classified at once by vad_split
+VAD_BLOCK_FRAMES = 1024
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# SubFormat GUID 00000001-0000-0010-8000-00AA00389B71 of WAVE_FORMAT_EXTENSIBLE integer PCM (as stored in files)
+KSDATAFORMAT_SUBTYPE_PCM = b'\x01\x00\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+
 
 class Sample:
     """
     Represents in-memory audio data of a certain (convertible) representation.
+    Duration and audio format of serialized audio data get parsed on first access.
 
     Attributes
     ----------
@@ -49,6 +62,8 @@ class Sample:
     duration : float
         Audio duration of the sample in seconds
     """
+    __slots__ = ['audio_type', 'sample_id', '_audio', '_audio_format', '_duration']
+
     def __init__(self, audio_type, raw_data, audio_format=None, sample_id=None):
         """
         Parameters
@@ -71,24 +86,56 @@ class Sample:
             Tracking ID - should indicate sample's origin as precisely as possible
         """
         self.audio_type = audio_type
-        self.audio_format = audio_format
         self.sample_id = sample_id
-        if audio_type in SERIALIZABLE_AUDIO_TYPES:
-            self.audio = raw_data if isinstance(raw_data, io.BytesIO) else io.BytesIO(raw_data)
-            self.duration = read_duration(audio_type, self.audio)
-            if not self.audio_format:
-                self.audio_format = read_format(audio_type, self.audio)
-        else:
-            self.audio = raw_data
-            if self.audio_format is None:
+        self._audio = raw_data
+        self._audio_format = audio_format
+        self._duration = None
+        if audio_type not in SERIALIZABLE_AUDIO_TYPES:
+            if audio_format is None:
                 raise ValueError('For audio type "{}" parameter "audio_format" is mandatory'.format(self.audio_type))
-            if audio_type == AUDIO_TYPE_PCM:
-                self.duration = get_pcm_duration(len(self.audio), self.audio_format)
-            elif audio_type == AUDIO_TYPE_NP:
-                self.duration = get_np_duration(len(self.audio), self.audio_format)
-            else:
+            if audio_type not in [AUDIO_TYPE_PCM, AUDIO_TYPE_NP]:
                 raise ValueError('Unsupported audio type: {}'.format(self.audio_type))
 
+    @property
+    def audio(self):
+        if self.audio_type in SERIALIZABLE_AUDIO_TYPES and not isinstance(self._audio, io.BytesIO):
+            self._audio = io.BytesIO(self._audio)
+        return self._audio
+
+    @audio.setter
+    def audio(self, audio):
+        self._audio = audio
+        self._duration = None
+
+    @property
+    def audio_format(self):
+        if self._audio_format is None and self.audio_type in SERIALIZABLE_AUDIO_TYPES:
+            self._audio_format = read_format(self.audio_type, self.audio)
+        return self._audio_format
+
+    @audio_format.setter
+    def audio_format(self, audio_format):
+        self._audio_format = audio_format
+        self._duration = None
+
+    @property
+    def duration(self):
+        if self._duration is None:
+            if self.audio_type in SERIALIZABLE_AUDIO_TYPES:
+                try:
+                    # Parsing the header once for both duration and format
+                    audio_format, num_samples = read_header(self.audio_type, self.audio)
+                    if self._audio_format is None:
+                        self._audio_format = audio_format
+                    self._duration = num_samples / audio_format.rate
+                except ValueError:
+                    self._duration = read_duration(self.audio_type, self.audio)
+            elif self.audio_type == AUDIO_TYPE_PCM:
+                self._duration = get_pcm_duration(len(self._audio), self.audio_format)
+            else:
+                self._duration = get_np_duration(len(self._audio), self.audio_format)
+        return self._duration
+
     def change_audio_type(self, new_audio_type, bitrate=None):
         """
         In-place conversion of audio data into a different representation.
@@ -108,6 +155,10 @@ class Sample:
             self.audio = audio
         elif new_audio_type == AUDIO_TYPE_PCM and self.audio_type == AUDIO_TYPE_NP:
             self.audio = np_to_pcm(self.audio, self.audio_format)
+        elif new_audio_type == AUDIO_TYPE_NP and self.audio_type == AUDIO_TYPE_OPUS:
+            self.audio_format, audio = read_opus_np(self.audio)
+            self.audio.close()
+            self.audio = audio
         elif new_audio_type == AUDIO_TYPE_NP:
             self.change_audio_type(AUDIO_TYPE_PCM)
             self.audio = pcm_to_np(self.audio, self.audio_format)
@@ -173,10 +224,152 @@ def convert_audio(src_audio_path, dst_audio_path, file_type=None, audio_format=D
     transformer.build(src_audio_path, dst_audio_path)
 
 
+class Resampler:
+    """
+    Streaming converter of interleaved PCM data into a different sample rate, channel count and sample width.
+    Sample rate conversion is done by a vectorized polyphase filter (Kaiser windowed sinc) that keeps its
+    history between calls of `process`, so converting a signal chunk by chunk produces the same result
+    as converting it at once. Channels get down-mixed by averaging.
+    """
+    def __init__(self, src_format, dst_format=DEFAULT_FORMAT, num_zeros=16, rolloff=0.945, block_size=4096):
+        """
+        Parameters
+        ----------
+        src_format : util.audio.AudioFormat
+            Format of the PCM data that is passed to `process`
+        dst_format : util.audio.AudioFormat
+            Format of the PCM data that is returned. Channel count has to be 1 or the one of src_format.
+        num_zeros : int
+            Number of zero-crossings of the sinc filter on each side (filter quality)
+        rolloff : float
+            Cutoff frequency of the anti-aliasing filter relative to the lower Nyquist frequency
+        block_size : int
+            Maximum number of output samples that are computed in one vectorized step
+        """
+        if dst_format.channels not in [1, src_format.channels]:
+            raise ValueError('Can only convert from {} to 1 or {} channels'.format(src_format.channels,
+                                                                                src_format.channels))
+        self.src_format = src_format
+        self.dst_format = dst_format
+        self.block_size = block_size
+        self.frame_size = src_format.channels * src_format.width
+        self.remainder = b''
+        gcd = math.gcd(src_format.rate, dst_format.rate)
+        self.up, self.down = dst_format.rate // gcd, src_format.rate // gcd
+        self.passthrough = self.up == self.down
+        if self.passthrough:
+            return
+        cutoff = rolloff * min(1.0, self.up / self.down)
+        self.half = int(math.ceil(num_zeros / cutoff))
+        self.offsets = np.arange(-self.half + 1, self.half + 1)
+        # Filter bank: one row of taps per fractional output position (phase)
+        t = np.arange(self.up)[:, None] / self.up - self.offsets[None, :]
+        window = np.i0(8.6 * np.sqrt(np.clip(1 - (t / (self.half + 1)) ** 2, 0, 1))) / np.i0(8.6)
+        self.bank = (cutoff * np.sinc(cutoff * t) * window).astype(np.float32)
+        # Input samples before the signal start are zero
+        self.buffer = np.zeros((self.half - 1, dst_format.channels), dtype=np.float32)
+        self.buffer_start = -(self.half - 1)
+        self.num_in = 0
+        self.next_out = 0
+
+    def _decode(self, pcm_data):
+        width = self.src_format.width
+        if width == 1:
+            samples = (np.frombuffer(pcm_data, dtype=np.uint8).astype(np.float32) - 128) / 128
+        else:
+            dtype = get_dtype(self.src_format)
+            samples = np.frombuffer(pcm_data, dtype=dtype).astype(np.float32) / np.iinfo(dtype).max
+        samples = samples.reshape((-1, self.src_format.channels))
+        if self.dst_format.channels != self.src_format.channels:
+            samples = samples.mean(axis=1, keepdims=True)
+        return samples
+
+    def _encode(self, samples):
+        samples = np.clip(samples, -1.0, 1.0)
+        if self.dst_format.width == 1:
+            return np.round(samples * 127 + 128).astype(np.uint8).tobytes()
+        dtype = get_dtype(self.dst_format)
+        return np.round(samples * np.iinfo(dtype).max).astype(dtype).tobytes()
+
+    def _filter(self, last_out):
+        blocks = []
+        for block_start in range(self.next_out, last_out, self.block_size):
+            k = np.arange(block_start, min(last_out, block_start + self.block_size))
+            positions = k * self.down
+            indices = (positions // self.up - self.buffer_start)[:, None] + self.offsets[None, :]
+            blocks.append(np.einsum('kt,ktc->kc', self.bank[positions % self.up], self.buffer[indices]))
+        self.next_out = max(self.next_out, last_out)
+        keep_from = self.next_out * self.down // self.up - self.half + 1 - self.buffer_start
+        self.buffer = self.buffer[keep_from:]
+        self.buffer_start += keep_from
+        if len(blocks) == 0:
+            return np.zeros((0, self.dst_format.channels), dtype=np.float32)
+        return np.concatenate(blocks)
+
+    def process(self, pcm_data):
+        """
+        Converts a chunk of PCM data. Due to the filter delay, the returned data lags behind the input.
+
+        Parameters
+        ----------
+        pcm_data : bytes
+            PCM data in source format. Chunks don't have to be aligned to sample frames.
+
+        Returns
+        -------
+        bytes
+            PCM data in destination format
+        """
+        pcm_data = self.remainder + bytes(pcm_data)
+        aligned = len(pcm_data) - len(pcm_data) % self.frame_size
+        self.remainder = pcm_data[aligned:]
+        if self.src_format == self.dst_format:
+            return pcm_data[:aligned]
+        samples = self._decode(pcm_data[:aligned])
+        if self.passthrough:
+            return self._encode(samples)
+        self.buffer = np.concatenate((self.buffer, samples))
+        self.num_in += len(samples)
+        last_in = self.buffer_start + len(self.buffer) - 1
+        return self._encode(self._filter(((last_in - self.half + 1) * self.up - 1) // self.down + 1))
+
+    def flush(self):
+        """
+        Returns the remaining converted PCM data after the last chunk got passed to `process`.
+
+        Returns
+        -------
+        bytes
+            PCM data in destination format
+        """
+        if self.passthrough:
+            return b''
+        self.buffer = np.concatenate((self.buffer, np.zeros((self.half, self.dst_format.channels), dtype=np.float32)))
+        return self._encode(self._filter(-(-self.num_in * self.up // self.down)))
+
+
+def convert_pcm(pcm_data, src_format, dst_format=DEFAULT_FORMAT):
+    """Converts PCM data in-memory into a different format (see `Resampler`)"""
+    if src_format == dst_format:
+        return pcm_data
+    resampler = Resampler(src_format, dst_format)
+    return resampler.process(pcm_data) + resampler.flush()
+
+
+def open_pcm_as_wav(pcm_data, audio_format=DEFAULT_FORMAT):
+    """Returns a wave reader on an in-memory WAV representation of PCM data"""
+    wav_file = io.BytesIO()
+    write_wav(wav_file, pcm_data, audio_format=audio_format)
+    wav_file.seek(0)
+    return wave.open(wav_file, 'rb')
+
+
 class AudioFile:
     """
     Audio data file wrapper that ensures that the file is loaded with the correct sample rate, channels,
     and width, and converts the file on the fly otherwise.
+    WAV files with 8, 16 or 32 bit samples and Ogg Opus files get converted in-memory,
+    all other files through SoX.
     """
     def __init__(self, audio_path, as_path=False, audio_format=DEFAULT_FORMAT):
         self.audio_path = audio_path
@@ -188,19 +381,37 @@ class AudioFile:
         self.tmp_src_file_path = None
 
     def __enter__(self):
+        src_format, pcm_data = None, None
         if self.audio_path.endswith('.wav'):
             self.open_file = open_remote(self.audio_path, 'rb')
             self.open_wav = wave.open(self.open_file)
-            if read_audio_format_from_wav_file(self.open_wav) == self.audio_format:
+            src_format = read_audio_format_from_wav_file(self.open_wav)
+            if src_format == self.audio_format:
                 if self.as_path:
                     self.open_wav.close()
                     self.open_file.close()
                     return self.audio_path
                 return self.open_wav
+            if src_format.width in [1, 2, 4]:
+                pcm_data = self.open_wav.readframes(self.open_wav.getnframes())
             self.open_wav.close()
             self.open_file.close()
-
-        # If the format isn't right, copy the file to local tmp dir and do the conversion on disk
+            self.open_file = None
+        elif self.audio_path.endswith('.opus'):
+            with open_remote(self.audio_path, 'rb') as opus_file:
+                src_format, pcm_data = read_ogg_opus(io.BytesIO(opus_file.read()))
+
+        if pcm_data is not None:
+            pcm_data = convert_pcm(pcm_data, src_format, self.audio_format)
+            if self.as_path:
+                _, self.tmp_file_path = tempfile.mkstemp(suffix='.wav')
+                with open(self.tmp_file_path, 'wb') as tmp_file:
+                    write_wav(tmp_file, pcm_data, audio_format=self.audio_format)
+                return self.tmp_file_path
+            self.open_wav = open_pcm_as_wav(pcm_data, audio_format=self.audio_format)
+            return self.open_wav
+
+        # If the format can't be converted in-memory, copy the file to local tmp dir and do the conversion on disk
         if is_remote_path(self.audio_path):
             _, self.tmp_src_file_path = tempfile.mkstemp(suffix='.wav')
             copy_remote(self.audio_path, self.tmp_src_file_path, True)
@@ -237,18 +448,261 @@ def read_frames(wav_file, frame_duration_ms=30, yield_remainder=False):
             break
 
 
+def _read_pcm_chunks_through_sox(audio_path, audio_format, chunk_size):
+    command = ['sox']
+    if is_remote_path(audio_path):
+        command += ['--type', os.path.splitext(audio_path)[1][1:], '-']
+    else:
+        command += [audio_path]
+    command += ['--type', 'raw',
+                '--rate', str(audio_format.rate),
+                '--channels', str(audio_format.channels),
+                '--bits', str(audio_format.width * 8),
+                '--encoding', 'unsigned-integer' if audio_format.width == 1 else 'signed-integer',
+                '--endian', 'little', '--no-dither', '-']
+    process = subprocess.Popen(command,
+                               stdin=subprocess.PIPE if is_remote_path(audio_path) else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    feeder = None
+    if is_remote_path(audio_path):
+        def feed_remote_file():
+            try:
+                with open_remote(audio_path, 'rb') as audio_file:
+                    shutil.copyfileobj(audio_file, process.stdin)
+            except BrokenPipeError:
+                pass
+            finally:
+                process.stdin.close()
+        feeder = threading.Thread(target=feed_remote_file, daemon=True)
+        feeder.start()
+    completed = False
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if len(chunk) == 0:
+                break
+            yield chunk
+        completed = True
+    finally:
+        process.stdout.close()
+        if not completed:
+            process.kill()
+        error = process.stderr.read()
+        process.stderr.close()
+        process.wait()
+        if feeder is not None:
+            feeder.join()
+    if process.returncode != 0:
+        raise RuntimeError('SoX failed on "{}": {}'.format(audio_path, error.decode(errors='replace')))
+
+
+def read_pcm_chunks_from_file(audio_path, audio_format=DEFAULT_FORMAT, chunk_duration_ms=1000):
+    """
+    Generator that decodes an audio file and converts it into a given format while reading it.
+    WAV files get read chunk-wise, Ogg Opus files are decoded chunk-wise from their compressed data in memory
+    and all other formats are streamed from a SoX subprocess. Memory usage is independent of the duration of
+    the file (besides the compressed Ogg Opus data).
+
+    Parameters
+    ----------
+    audio_path : str
+        Path of the audio file (can be remote)
+    audio_format : util.audio.AudioFormat
+        Format of the yielded PCM data
+    chunk_duration_ms : int
+        Approximate duration of the yielded chunks
+
+    Returns
+    -------
+    iterable of bytes
+        PCM data chunks
+    """
+    src_format, pcm_data = None, None
+    if audio_path.endswith('.wav'):
+        with open_remote(audio_path, 'rb') as audio_file:
+            with wave.open(audio_file) as wav_file:
+                src_format = read_audio_format_from_wav_file(wav_file)
+                if src_format.width in [1, 2, 4]:
+                    resampler = Resampler(src_format, audio_format)
+                    chunk_frames = max(1, src_format.rate * chunk_duration_ms // 1000)
+                    while True:
+                        data = wav_file.readframes(chunk_frames)
+                        if len(data) == 0:
+                            break
+                        yield resampler.process(data)
+                    yield resampler.flush()
+                    return
+    elif audio_path.endswith('.opus'):
+        with open_remote(audio_path, 'rb') as opus_file:
+            ogg_file = io.BytesIO(opus_file.read())
+        resampler = None
+        for src_format, pcm_data in read_ogg_opus_chunks(ogg_file, chunk_duration_ms=chunk_duration_ms):
+            resampler = Resampler(src_format, audio_format) if resampler is None else resampler
+            yield resampler.process(pcm_data)
+        if resampler is not None:
+            yield resampler.flush()
+        return
+    chunk_size = max(1, audio_format.rate * chunk_duration_ms // 1000) * audio_format.channels * audio_format.width
+    yield from _read_pcm_chunks_through_sox(audio_path, audio_format, chunk_size)
+
+
 def read_frames_from_file(audio_path, audio_format=DEFAULT_FORMAT, frame_duration_ms=30, yield_remainder=False):
-    with AudioFile(audio_path, audio_format=audio_format) as wav_file:
-        for frame in read_frames(wav_file, frame_duration_ms=frame_duration_ms, yield_remainder=yield_remainder):
-            yield frame
+    """
+    Generator of fixed-duration PCM frames of an audio file in a given format.
+    Frames are produced while the file gets decoded (see `read_pcm_chunks_from_file`).
+    """
+    frame_size = int(audio_format.rate * (frame_duration_ms / 1000.0)) * audio_format.channels * audio_format.width
+    buffer = bytearray()
+    for chunk in read_pcm_chunks_from_file(audio_path, audio_format=audio_format):
+        buffer += chunk
+        complete = len(buffer) - len(buffer) % frame_size
+        for offset in range(0, complete, frame_size):
+            yield bytes(buffer[offset:offset + frame_size])
+        del buffer[:complete]
+    if yield_remainder and len(buffer) > 0:
+        yield bytes(buffer)
+
+
+def compute_speech_mask(pcm_buffer,
+                        frame_size,
+                        audio_format=DEFAULT_FORMAT,
+                        aggressiveness=3,
+                        detector='webrtc',
+                        energy_threshold_dbfs=-45.0,
+                        max_zero_crossing_rate=0.35):
+    """
+    Classifies consecutive frames of a mono 16 bit PCM buffer as speech or non-speech.
+
+    Parameters
+    ----------
+    pcm_buffer : bytes-like
+        PCM data of a whole number of frames
+    frame_size : int
+        Number of samples per frame
+    audio_format : util.audio.AudioFormat
+        Format of the PCM data
+    aggressiveness : int
+        WebRTC VAD aggressiveness mode (0 to 3)
+    detector : str
+        "webrtc" for WebRTC VAD or "energy" for a NumPy detector that requires frames to be louder than
+        `energy_threshold_dbfs` and to have a zero-crossing rate below `max_zero_crossing_rate`
+    energy_threshold_dbfs : float
+        Minimum RMS level of speech frames (energy detector only)
+    max_zero_crossing_rate : float
+        Maximum ratio of sign changes per sample of speech frames (energy detector only)
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean speech flag per frame
+    """
+    num_frames = len(pcm_buffer) // (frame_size * audio_format.width)
+    if detector == 'webrtc':
+        from webrtcvad import Vad  # pylint: disable=import-outside-toplevel
+        vad = Vad(int(aggressiveness))
+        view = memoryview(pcm_buffer).cast('B')
+        frame_bytes = frame_size * audio_format.width
+        return np.fromiter((vad.is_speech(view[i:i + frame_bytes], audio_format.rate)
+                            for i in range(0, num_frames * frame_bytes, frame_bytes)),
+                           dtype=bool, count=num_frames)
+    if detector == 'energy':
+        samples = np.frombuffer(pcm_buffer, dtype=np.int16, count=num_frames * frame_size)
+        samples = samples.reshape((num_frames, frame_size))
+        mask = np.empty(num_frames, dtype=bool)
+        # Blocks of frames limit the memory of the float conversion
+        for block_start in range(0, num_frames, 8192):
+            frames = samples[block_start:block_start + 8192].astype(np.float32) / np.iinfo(np.int16).max
+            rms = np.sqrt(np.mean(np.square(frames), axis=1))
+            zero_crossing_rate = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+            mask[block_start:block_start + len(frames)] = \
+                (rms > dbfs_to_rms(energy_threshold_dbfs)) & (zero_crossing_rate < max_zero_crossing_rate)
+        return mask
+    raise ValueError('Unknown VAD detector: {}'.format(detector))
+
+
+def _find_window_trigger(counts, start, window, threshold, block_size=4096, search_from=None):
+    """
+    Returns the first frame index i >= start for which the number of flagged frames within the
+    (at most) `window` frames in range [start, i] exceeds `threshold` - or None.
+    counts has to be the cumulative sum of the flags with a leading zero.
+    If search_from is given, frame indices before it are known to not trigger and get skipped.
+    """
+    num_frames = len(counts) - 1
+    for block_start in range(start if search_from is None else max(start, search_from), num_frames, block_size):
+        indices = np.arange(block_start, min(num_frames, block_start + block_size))
+        window_starts = np.maximum(start, indices - window + 1)
+        hits = np.flatnonzero(counts[indices + 1] - counts[window_starts] > threshold)
+        if len(hits) > 0:
+            return int(indices[hits[0]])
+    return None
+
+
+def find_voiced_segments(speech_mask, num_padding_frames=10, threshold=0.5):
+    """
+    Finds voiced segments in a speech mask using rolling sums. A segment gets triggered as soon as more than
+    `threshold * num_padding_frames` of the preceding `num_padding_frames` frames are speech, and includes
+    these padding frames. It ends as soon as more than `threshold * num_padding_frames` of the frames
+    since its trigger (at most `num_padding_frames`) are non-speech.
+
+    Returns
+    -------
+    list of (int, int, bool)
+        Index of the first and the last frame of each segment and if the segment got ended by silence
+        (instead of by the end of the mask)
+    """
+    speech_counts = np.concatenate(([0], np.cumsum(speech_mask, dtype=np.int64)))
+    silence_counts = np.arange(len(speech_counts)) - speech_counts
+    limit = threshold * num_padding_frames
+    segments = []
+    position = 0
+    while True:
+        trigger = _find_window_trigger(speech_counts, position, num_padding_frames, limit)
+        if trigger is None:
+            break
+        first = max(position, trigger - num_padding_frames + 1)
+        end = _find_window_trigger(silence_counts, trigger + 1, num_padding_frames, limit)
+        if end is None:
+            segments.append((first, len(speech_mask) - 1, False))
+            break
+        segments.append((first, end, True))
+        position = end + 1
+    return segments
 
 
 def vad_split(audio_frames,
               audio_format=DEFAULT_FORMAT,
               num_padding_frames=10,
               threshold=0.5,
-              aggressiveness=3):
-    from webrtcvad import Vad  # pylint: disable=import-outside-toplevel
+              aggressiveness=3,
+              detector='webrtc',
+              energy_threshold_dbfs=-45.0,
+              max_zero_crossing_rate=0.35):
+    """
+    Splits audio into voiced segments. Frames are classified in blocks of `VAD_BLOCK_FRAMES` frames
+    (see `compute_speech_mask`) and segmented using rolling sums with the rules of `find_voiced_segments`.
+    Segments are yielded as soon as they end and only frames that may still become part of a segment are kept.
+
+    Parameters
+    ----------
+    audio_frames : iterable of bytes
+        PCM frames of equal duration (10, 20 or 30 ms)
+    audio_format : util.audio.AudioFormat
+        Format of the frames (mono, 16 bit)
+    num_padding_frames : int
+        Size of the window that triggers segment starts and ends
+    threshold : float
+        Ratio of (non-)speech frames within the window that triggers segment starts (ends)
+    aggressiveness : int
+        WebRTC VAD aggressiveness mode (0 to 3)
+    detector : str
+        "webrtc" or "energy" - see `compute_speech_mask`
+
+    Returns
+    -------
+    iterable of (bytes, float, float)
+        Segment PCM data, start and end time in milliseconds
+    """
     if audio_format.channels != 1:
         raise ValueError('VAD-splitting requires mono samples')
     if audio_format.width != 2:
@@ -257,40 +711,73 @@ def vad_split(audio_frames,
         raise ValueError('VAD-splitting only supported for sample rates 8000, 16000, 32000, or 48000')
     if aggressiveness not in [0, 1, 2, 3]:
         raise ValueError('VAD-splitting aggressiveness mode has to be one of 0, 1, 2, or 3')
-    ring_buffer = collections.deque(maxlen=num_padding_frames)
-    triggered = False
-    vad = Vad(int(aggressiveness))
-    voiced_frames = []
-    frame_duration_ms = 0
-    frame_index = 0
-    for frame_index, frame in enumerate(audio_frames):
-        frame_duration_ms = get_pcm_duration(len(frame), audio_format) * 1000
-        if int(frame_duration_ms) not in [10, 20, 30]:
-            raise ValueError('VAD-splitting only supported for frame durations 10, 20, or 30 ms')
-        is_speech = vad.is_speech(frame, audio_format.rate)
-        if not triggered:
-            ring_buffer.append((frame, is_speech))
-            num_voiced = len([f for f, speech in ring_buffer if speech])
-            if num_voiced > threshold * ring_buffer.maxlen:
-                triggered = True
-                for f, s in ring_buffer:
-                    voiced_frames.append(f)
-                ring_buffer.clear()
-        else:
-            voiced_frames.append(frame)
-            ring_buffer.append((frame, is_speech))
-            num_unvoiced = len([f for f, speech in ring_buffer if not speech])
-            if num_unvoiced > threshold * ring_buffer.maxlen:
-                triggered = False
-                yield b''.join(voiced_frames), \
-                      frame_duration_ms * max(0, frame_index - len(voiced_frames)), \
-                      frame_duration_ms * frame_index
-                ring_buffer.clear()
-                voiced_frames = []
-    if len(voiced_frames) > 0:
-        yield b''.join(voiced_frames), \
-              frame_duration_ms * (frame_index - len(voiced_frames)), \
-              frame_duration_ms * (frame_index + 1)
+    limit = threshold * num_padding_frames
+    audio_frames = iter(audio_frames)
+    frame_bytes = None
+    # PCM data and speech flags of the kept frames - the first one has absolute frame index base
+    pcm_buffer = bytearray()
+    speech_mask = np.zeros(0, dtype=bool)
+    base = 0
+    # Start of the trigger window, trigger frame and first frame of the current segment
+    # and first frame that could end it (all relative to base)
+    position, trigger, first, end_search = 0, None, None, None
+    while True:
+        block = list(itertools.islice(audio_frames, VAD_BLOCK_FRAMES))
+        final = len(block) < VAD_BLOCK_FRAMES
+        for frame in block:
+            if frame_bytes is None:
+                frame_bytes = len(frame)
+                if int(get_pcm_duration(frame_bytes, audio_format) * 1000) not in [10, 20, 30]:
+                    raise ValueError('VAD-splitting only supported for frame durations 10, 20, or 30 ms')
+            elif len(frame) != frame_bytes:
+                raise ValueError('VAD-splitting only supported for frames of equal duration')
+        if frame_bytes is None:
+            return
+        frame_duration_ms = get_pcm_duration(frame_bytes, audio_format) * 1000
+        block_pcm = b''.join(block)
+        pcm_buffer += block_pcm
+        speech_mask = np.concatenate((speech_mask, compute_speech_mask(block_pcm,
+                                                                       frame_bytes // audio_format.width,
+                                                                       audio_format=audio_format,
+                                                                       aggressiveness=aggressiveness,
+                                                                       detector=detector,
+                                                                       energy_threshold_dbfs=energy_threshold_dbfs,
+                                                                       max_zero_crossing_rate=max_zero_crossing_rate)))
+        speech_counts = np.concatenate(([0], np.cumsum(speech_mask, dtype=np.int64)))
+        silence_counts = np.arange(len(speech_counts)) - speech_counts
+        while True:
+            if trigger is None:
+                trigger = _find_window_trigger(speech_counts, position, num_padding_frames, limit)
+                if trigger is None:
+                    # Later triggers cannot reach back further
+                    position = max(position, len(speech_mask) - num_padding_frames + 1)
+                    break
+                first = max(position, trigger - num_padding_frames + 1)
+                end_search = trigger + 1
+            end = _find_window_trigger(silence_counts, trigger + 1, num_padding_frames, limit,
+                                       search_from=end_search)
+            if end is None:
+                end_search = max(end_search, len(speech_mask))
+                if final:
+                    # Timing as reported by the former frame-by-frame implementation
+                    yield (bytes(pcm_buffer[first * frame_bytes:]),
+                           frame_duration_ms * (base + first - 1),
+                           frame_duration_ms * (base + len(speech_mask)))
+                break
+            yield (bytes(pcm_buffer[first * frame_bytes:(end + 1) * frame_bytes]),
+                   frame_duration_ms * max(0, base + first - 1),
+                   frame_duration_ms * (base + end))
+            position, trigger = end + 1, None
+        if final:
+            return
+        # Releasing frames that cannot become part of a segment anymore
+        keep = position if trigger is None else first
+        del pcm_buffer[:keep * frame_bytes]
+        speech_mask = speech_mask[keep:]
+        base += keep
+        position -= keep
+        if trigger is not None:
+            trigger, first, end_search = trigger - keep, first - keep, end_search - keep
 
 
 def pack_number(n, num_bytes):
@@ -305,19 +792,59 @@ def get_opus_frame_size(rate):
     return 60 * rate // 1000
 
 
+_OPUS_CODECS = threading.local()
+
+
+def get_opus_codec(kind, audio_format):
+    """
+    Returns a pooled Opus encoder or decoder for the given format. Codecs are kept per process and thread
+    and get reset to the equivalent of a freshly initialized state on each retrieval.
+
+    Parameters
+    ----------
+    kind : str
+        "encoder" or "decoder"
+    audio_format : util.audio.AudioFormat
+        Format of the PCM data to encode or decode
+
+    Returns
+    -------
+    opuslib.Encoder or opuslib.Decoder
+    """
+    import opuslib  # pylint: disable=import-outside-toplevel
+    codecs = getattr(_OPUS_CODECS, kind, None)
+    if codecs is None:
+        codecs = {}
+        setattr(_OPUS_CODECS, kind, codecs)
+    key = (audio_format.rate, audio_format.channels)
+    codec = codecs.get(key)
+    if codec is None:
+        if kind == 'encoder':
+            codec = opuslib.Encoder(audio_format.rate, audio_format.channels, 'audio')
+        else:
+            codec = opuslib.Decoder(audio_format.rate, audio_format.channels)
+        codecs[key] = codec
+    else:
+        # Not using reset_state() of the codec classes, as it is broken in opuslib 2.0
+        api = opuslib.api.encoder if kind == 'encoder' else opuslib.api.decoder
+        api.ctl(codec._state, opuslib.api.ctl.reset_state)  # pylint: disable=protected-access
+    return codec
+
+
 def write_opus(opus_file, audio_data, audio_format=DEFAULT_FORMAT, bitrate=None):
     frame_size = get_opus_frame_size(audio_format.rate)
     import opuslib  # pylint: disable=import-outside-toplevel
-    encoder = opuslib.Encoder(audio_format.rate, audio_format.channels, 'audio')
-    if bitrate is not None:
-        encoder.bitrate = bitrate
+    encoder = get_opus_codec('encoder', audio_format)
+    # Pooled encoders keep their settings, so the bitrate has to be set in any case
+    encoder.bitrate = opuslib.api.constants.AUTO if bitrate is None else bitrate
     chunk_size = frame_size * audio_format.channels * audio_format.width
     opus_file.write(pack_number(len(audio_data), OPUS_PCM_LEN_SIZE))
     opus_file.write(pack_number(audio_format.rate, OPUS_RATE_SIZE))
     opus_file.write(pack_number(audio_format.channels, OPUS_CHANNELS_SIZE))
     opus_file.write(pack_number(audio_format.width, OPUS_WIDTH_SIZE))
-    for i in range(0, len(audio_data), chunk_size):
-        chunk = audio_data[i:i + chunk_size]
+    audio_view = memoryview(audio_data).cast('B')
+    for i in range(0, len(audio_view), chunk_size):
+        chunk = bytes(audio_view[i:i + chunk_size])
         # Preventing non-deterministic encoding results from uninitialized remainder of the encoder buffer
         if len(chunk) < chunk_size:
             chunk = chunk + b'\0' * (chunk_size - len(chunk))
@@ -335,19 +862,112 @@ def read_opus_header(opus_file):
     return pcm_buffer_size, AudioFormat(rate, channels, width)
 
 
-def read_opus(opus_file):
-    pcm_buffer_size, audio_format = read_opus_header(opus_file)
-    frame_size = get_opus_frame_size(audio_format.rate)
+def _decode_opus_chunks(opus_file, audio_format, num_samples, buffer_address, sample_type, decode_function):
+    """Decodes Opus chunks of opus_file directly into a preallocated buffer of at least num_samples frames"""
     import opuslib  # pylint: disable=import-outside-toplevel
-    decoder = opuslib.Decoder(audio_format.rate, audio_format.channels)
-    audio_data = bytearray()
-    while len(audio_data) < pcm_buffer_size:
+    frame_size = get_opus_frame_size(audio_format.rate)
+    decoder = get_opus_codec('decoder', audio_format)
+    sample_pointer = ctypes.POINTER(sample_type)
+    offset = 0
+    while offset < num_samples:
         chunk_len = unpack_number(opus_file.read(OPUS_CHUNK_LEN_SIZE))
         chunk = opus_file.read(chunk_len)
-        decoded = decoder.decode(chunk, frame_size)
-        audio_data.extend(decoded)
-    audio_data = audio_data[:pcm_buffer_size]
-    return audio_format, bytes(audio_data)
+        target = ctypes.cast(buffer_address + offset * audio_format.channels * ctypes.sizeof(sample_type),
+                             sample_pointer)
+        result = decode_function(decoder._state, chunk, len(chunk), target, frame_size, 0)  # pylint: disable=protected-access
+        if result < 0:
+            raise opuslib.exceptions.OpusError(result)
+        offset += result
+
+
+def _get_opus_buffer_samples(num_samples, audio_format):
+    """Number of samples (per channel) of a buffer that can hold num_samples plus the padding of the last chunk"""
+    frame_size = get_opus_frame_size(audio_format.rate)
+    return int(math.ceil(num_samples / frame_size)) * frame_size
+
+
+def read_opus(opus_file):
+    import opuslib  # pylint: disable=import-outside-toplevel
+    pcm_buffer_size, audio_format = read_opus_header(opus_file)
+    num_samples = get_num_samples(pcm_buffer_size, audio_format)
+    buffer_samples = _get_opus_buffer_samples(num_samples, audio_format)
+    audio_data = bytearray(max(pcm_buffer_size, buffer_samples * audio_format.channels * 2))
+    buffer = (ctypes.c_char * len(audio_data)).from_buffer(audio_data)
+    _decode_opus_chunks(opus_file, audio_format, num_samples, ctypes.addressof(buffer),
+                        ctypes.c_int16, opuslib.api.libopus.opus_decode)
+    # Releasing the buffer export before truncating the padding in-place
+    del buffer
+    del audio_data[pcm_buffer_size:]
+    return audio_format, audio_data
+
+
+def read_opus_np(opus_file):
+    """
+    Decodes Opus data (custom container format) into a mono float32 NumPy column vector.
+    Samples are decoded directly into a preallocated 16 bit array and converted by `pcm_to_np`,
+    so results are identical to converting the result of `read_opus`.
+    """
+    import opuslib  # pylint: disable=import-outside-toplevel
+    pcm_buffer_size, audio_format = read_opus_header(opus_file)
+    num_samples = get_num_samples(pcm_buffer_size, audio_format)
+    samples = np.empty((_get_opus_buffer_samples(num_samples, audio_format), audio_format.channels),
+                       dtype=np.int16)
+    _decode_opus_chunks(opus_file, audio_format, num_samples, samples.ctypes.data,
+                        ctypes.c_int16, opuslib.api.libopus.opus_decode)
+    return audio_format, pcm_to_np(samples[:num_samples], audio_format)
+
+
+def read_ogg_opus_chunks(ogg_file, chunk_duration_ms=1000):
+    """
+    Generator that decodes Ogg Opus data of a memory file incrementally, so that only one chunk of
+    decoded audio is held in memory.
+
+    Parameters
+    ----------
+    ogg_file : io.BytesIO
+        Memory file with the Ogg Opus data
+    chunk_duration_ms : int
+        Duration of the yielded chunks (besides the last one)
+
+    Returns
+    -------
+    iterable of (util.audio.AudioFormat, bytes)
+        Audio format and 16 bit PCM data of each chunk
+    """
+    error = ctypes.c_int()
+    ogg_file_buffer = ogg_file.getbuffer()
+    ubyte_array = ctypes.c_ubyte * len(ogg_file_buffer)
+    opusfile = pyogg.opus.op_open_memory(ubyte_array.from_buffer(ogg_file_buffer),
+                                         len(ogg_file_buffer),
+                                         ctypes.pointer(error))
+    if error.value != 0:
+        raise ValueError('Ogg/Opus buffer could not be read. Error code: {}'.format(error.value))
+    try:
+        audio_format = AudioFormat(48000, pyogg.opus.op_channel_count(opusfile, -1), 2)
+        chunk_samples = max(1, audio_format.rate * chunk_duration_ms // 1000)
+        frame_size = audio_format.channels * audio_format.width
+        buffer = (pyogg.opus.opus_int16 * (chunk_samples * audio_format.channels))()
+        while True:
+            num_samples = 0
+            while num_samples < chunk_samples:
+                # op_read decodes at most one packet per call and keeps samples that do not fit the buffer
+                target = ctypes.cast(ctypes.addressof(buffer) + num_samples * frame_size,
+                                     ctypes.POINTER(pyogg.opus.opus_int16))
+                result = pyogg.opus.op_read(opusfile,
+                                            target,
+                                            (chunk_samples - num_samples) * audio_format.channels,
+                                            pyogg.ogg.c_int_p())
+                if result < 0:
+                    raise ValueError('Error while reading Ogg/Opus buffer. Error code: {}'.format(result))
+                if result == 0:
+                    break
+                num_samples += result
+            if num_samples > 0:
+                yield audio_format, ctypes.string_at(buffer, num_samples * frame_size)
+            if num_samples < chunk_samples:
+                return
+    finally:
+        pyogg.opus.op_free(opusfile)
 
 
 def read_ogg_opus(ogg_file):
@@ -481,7 +1101,51 @@ def write_audio(audio_type, audio_file, pcm_data, audio_format=DEFAULT_FORMAT, b
     raise ValueError('Unsupported audio type: {}'.format(audio_type))
 
 
+def read_wav_header(wav_file):
+    """
+    Reads the format and the number of sample frames of a WAV file by parsing only its RIFF chunk headers.
+
+    Returns
+    -------
+    (util.audio.AudioFormat, int)
+        Audio format and number of sample frames
+    """
+    wav_file.seek(0)
+    riff_header = wav_file.read(12)
+    if len(riff_header) < 12 or riff_header[:4] != b'RIFF' or riff_header[8:12] != b'WAVE':
+        raise ValueError('Not a RIFF WAVE file')
+    audio_format = None
+    while True:
+        chunk_header = wav_file.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError('WAV file without data chunk')
+        chunk_id, chunk_size = chunk_header[:4], struct.unpack('<I', chunk_header[4:])[0]
+        if chunk_id == b'fmt ':
+            fmt_chunk = wav_file.read(chunk_size)
+            if len(fmt_chunk) < 16:
+                raise ValueError('Truncated WAV fmt chunk')
+            format_tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', fmt_chunk[:16])
+            if format_tag not in [WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE]:
+                raise ValueError('Unsupported WAV format tag: {}'.format(format_tag))
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and fmt_chunk[24:40] != KSDATAFORMAT_SUBTYPE_PCM:
+                raise ValueError('Unsupported WAVE_FORMAT_EXTENSIBLE sub-format (only integer PCM is supported)')
+            audio_format = AudioFormat(rate, channels, (bits + 7) // 8)
+            wav_file.seek(chunk_size % 2, 1)
+        elif chunk_id == b'data':
+            if audio_format is None:
+                raise ValueError('WAV data chunk before fmt chunk')
+            return audio_format, chunk_size // (audio_format.channels * audio_format.width)
+        else:
+            # Chunks are word aligned
+            wav_file.seek(chunk_size + chunk_size % 2, 1)
+
+
 def read_wav_duration(wav_file):
+    try:
+        audio_format, num_frames = read_wav_header(wav_file)
+        return num_frames / audio_format.rate
+    except ValueError:
+        pass
     wav_file.seek(0)
     with wave.open(wav_file, 'rb') as wav_file_reader:
         return wav_file_reader.getnframes() / wav_file_reader.getframerate()
@@ -492,7 +1156,52 @@ def read_opus_duration(opus_file):
     return get_pcm_duration(pcm_buffer_size, audio_format)
 
 
+def read_ogg_opus_header(ogg_file):
+    """
+    Reads the format and the number of samples (per channel) of an Ogg Opus file by parsing its OpusHead packet
+    and the granule position of its last Ogg page - without decoding. Chained streams are not supported.
+
+    Returns
+    -------
+    (util.audio.AudioFormat, int)
+        Audio format and number of samples
+    """
+    ogg_file.seek(0)
+    page_header = ogg_file.read(27)
+    if len(page_header) < 27 or page_header[:4] != b'OggS':
+        raise ValueError('Not an Ogg file')
+    segment_table = ogg_file.read(page_header[26])
+    packet = ogg_file.read(sum(segment_table))
+    if len(packet) < 19 or packet[:8] != b'OpusHead':
+        raise ValueError('Ogg file without Opus header')
+    channels = packet[9]
+    pre_skip = struct.unpack('<H', packet[10:12])[0]
+    # Ogg pages are at most 65307 bytes long, so the last page starts within this range
+    ogg_file.seek(0, os.SEEK_END)
+    file_size = ogg_file.tell()
+    ogg_file.seek(max(0, file_size - 65307 - 27))
+    tail = ogg_file.read()
+    position = len(tail)
+    while True:
+        position = tail.rfind(b'OggS', 0, position)
+        if position < 0:
+            raise ValueError('Ogg file without valid last page')
+        if len(tail) - position >= 27 and tail[position + 4] == 0:
+            num_segments = tail[position + 26]
+            segments = tail[position + 27:position + 27 + num_segments]
+            granule_position = struct.unpack('<q', tail[position + 6:position + 14])[0]
+            # The last page has to end with the file
+            if granule_position >= 0 and position + 27 + num_segments + sum(segments) == len(tail):
+                break
+    return AudioFormat(48000, channels, 2), max(0, granule_position - pre_skip)
+
+
 def read_ogg_opus_duration(ogg_file):
+    try:
+        audio_format, num_samples = read_ogg_opus_header(ogg_file)
+        return num_samples / audio_format.rate
+    except ValueError:
+        pass
     error = ctypes.c_int()
     ogg_file_buffer = ogg_file.getbuffer()
     ubyte_array = ctypes.c_ubyte * len(ogg_file_buffer)
@@ -528,6 +1237,10 @@ def read_duration(audio_type, audio_file):
 
 
 def read_wav_format(wav_file):
+    try:
+        return read_wav_header(wav_file)[0]
+    except ValueError:
+        pass
     wav_file.seek(0)
     with wave.open(wav_file, 'rb') as wav_file_reader:
         return read_audio_format_from_wav_file(wav_file_reader)
@@ -539,6 +1252,10 @@ def read_opus_format(opus_file):
 
 
 def read_ogg_opus_format(ogg_file):
+    try:
+        return read_ogg_opus_header(ogg_file)[0]
+    except ValueError:
+        pass
     error = ctypes.c_int()
     ogg_file_buffer = ogg_file.getbuffer()
     ubyte_array = ctypes.c_ubyte * len(ogg_file_buffer)
@@ -562,6 +1279,21 @@ def read_ogg_opus_format(ogg_file):
     return AudioFormat(sample_rate, channel_count, sample_width)
 
 
+def read_header(audio_type, audio_file):
+    """
+    Reads format and number of samples (per channel) from the header(s) of serialized audio data.
+    For Ogg Opus this includes the last page.
+    """
+    if audio_type == AUDIO_TYPE_WAV:
+        return read_wav_header(audio_file)
+    if audio_type == AUDIO_TYPE_OPUS:
+        pcm_buffer_size, audio_format = read_opus_header(audio_file)
+        return audio_format, get_num_samples(pcm_buffer_size, audio_format)
+    if audio_type == AUDIO_TYPE_OGG_OPUS:
+        return read_ogg_opus_header(audio_file)
+    raise ValueError('Unsupported audio type: {}'.format(audio_type))
+
+
 def read_format(audio_type, audio_file):
     if audio_type == AUDIO_TYPE_WAV:
         return read_wav_format(audio_file)
@@ -610,6 +1342,10 @@ def rms_to_dbfs(rms):
     return 20.0 * math.log10(max(1e-16, rms)) + 3.0103
 
 
+def dbfs_to_rms(dbfs):
+    return math.pow(10.0, (dbfs - 3.0103) / 20.0)
+
+
 def max_dbfs(sample_data):
     # Peak dBFS based on the maximum energy sample. Will prevent overdrive if used for normalization.
     return rms_to_dbfs(max(abs(np.min(sample_data)), abs(np.max(sample_data))))
@@ -1,18 +1,37 @@
 
 import os
 import re
+import glob
 import math
+import atexit
 import random
+import time
+import hashlib
+import itertools
+import tempfile
 import resampy
 import numpy as np
 
+from functools import partial
 from multiprocessing import Queue, Process
-from .audio import gain_db_to_ratio, max_dbfs, normalize_audio, AUDIO_TYPE_NP, AUDIO_TYPE_PCM, AUDIO_TYPE_OPUS
+from .audio import (
+    gain_db_to_ratio,
+    max_dbfs,
+    normalize_audio,
+    change_audio_types,
+    AUDIO_TYPE_NP,
+    AUDIO_TYPE_PCM,
+    AUDIO_TYPE_OPUS
+)
 from .helpers import LimitingPool, int_range, float_range, pick_value_from_range, tf_pick_value_from_range, MEGABYTE
+from .io import stat_remote
 from .sample_collections import samples_from_source, unpack_maybe
 
 BUFFER_SIZE = 1 * MEGABYTE
 SPEC_PARSER = re.compile(r'^(?P<cls>[a-z_]+)(\[(?P<params>.*)\])?$')
+OVERLAY_MODES = ['queue', 'random', 'sequential']
+REVERB_MIN_GAIN = 1e-7  # reflections below float32 resolution get dropped
+REVERB_MAX_DIRECT_TAPS = 256  # up to this many impulse response taps, convolution is done without FFT
 
 
 class Augmentation:
@@ -24,7 +43,11 @@ class SampleAugmentation(Augmentation):
     def start(self, buffering=BUFFER_SIZE):
         pass
 
-    def apply(self, sample, clock=0.0):
+    def apply(self, sample, clock=0.0, rng=None):
+        """
+        Augments a sample in-place. Random decisions and parameters are drawn from rng
+        (a random.Random instance) - or from the global random module if it is None.
+        """
         raise NotImplementedError
 
     def stop(self):
@@ -138,9 +161,16 @@ def apply_graph_augmentations(domain, tensor, augmentations, transcript=None, cl
 
 
 class AugmentationContext:
-    def __init__(self, target_audio_type, augmentations):
+    def __init__(self, target_audio_type, augmentations, profile=False):
         self.target_audio_type = target_audio_type
         self.augmentations = augmentations
+        self.profile = profile
+        # Unique timing names like "overlay", "reverb" and "overlay_1" for a second overlay augmentation
+        self.names = []
+        for augmentation in augmentations:
+            name = augmentation.__class__.__name__.lower()
+            duplicates = sum(1 for other in self.names if other.split('_')[0] == name)
+            self.names.append('{}_{}'.format(name, duplicates) if duplicates else name)
 
 
 AUGMENTATION_CONTEXT = None
@@ -151,19 +181,43 @@ def _init_augmentation_worker(preparation_context):
     AUGMENTATION_CONTEXT = preparation_context
 
 
+def get_sample_seed(seed, epoch, sample_index, shard_index=0):
+    """
+    Derives the random seed for all augmentation decisions and parameters of a sample.
+    This makes augmented samples a pure function of (seed, epoch, shard_index, sample_index), independent of
+    worker scheduling - so they can be reproduced or produced ahead of time (see bin/data_set_tool.py).
+    As sample indices are local to a shard (e.g. a Horovod rank), the shard index is part of the seed.
+    """
+    return int(np.random.SeedSequence([seed, epoch, shard_index, sample_index]).generate_state(1)[0])
+
+
 def _load_and_augment_sample(timed_sample, context=None):
-    sample, clock = timed_sample
+    context = AUGMENTATION_CONTEXT if context is None else context
+    sample, clock, sample_seed = timed_sample
+    # A private generator per sample leaves the global random state of the calling process alone
+    rng = None if sample_seed is None else random.Random(sample_seed)
+    if not context.profile:
+        return _augment_sample((unpack_maybe(sample), clock), context, rng=rng)
+    start = time.perf_counter()
     realized_sample = unpack_maybe(sample)
-    return _augment_sample((realized_sample, clock), context)
+    timings = {'load': time.perf_counter() - start}
+    return _augment_sample((realized_sample, clock), context, timings=timings, rng=rng), timings
 
 
-def _augment_sample(timed_sample, context=None):
+def _augment_sample(timed_sample, context=None, timings=None, rng=None):
     context = AUGMENTATION_CONTEXT if context is None else context
     sample, clock = timed_sample
-    for augmentation in context.augmentations:
-        if random.random() < augmentation.probability:
-            augmentation.apply(sample, clock)
+    decide = random.random if rng is None else rng.random
+    for name, augmentation in zip(context.names, context.augmentations):
+        if decide() < augmentation.probability:
+            start = time.perf_counter()
+            augmentation.apply(sample, clock, rng=rng)
+            if timings is not None:
+                timings[name] = time.perf_counter() - start
+    start = time.perf_counter()
     sample.change_audio_type(new_audio_type=context.target_audio_type)
+    if timings is not None:
+        timings['convert'] = time.perf_counter() - start
     return sample
 
 
@@ -173,7 +227,12 @@ def apply_sample_augmentations(samples,
                                buffering=BUFFER_SIZE,
                                process_ahead=None,
                                clock=0.0,
-                               final_clock=None):
+                               final_clock=None,
+                               timings=None,
+                               seed=None,
+                               epoch=0,
+                               shard_index=0,
+                               skip=0):
     """
     Prepares samples for being used during training.
     This includes parallel and buffered application of augmentations and a conversion to a specified audio-type.
@@ -195,19 +254,39 @@ def apply_sample_augmentations(samples,
     final_clock : float
         Final clock value between 0.0 and 1.0 for the last sample. Has to be >= than clock.
         Requires samples.__len__ attribute.
+    timings : util.profiling.Timings
+        If provided, per sample wall times of loading, each applied augmentation and the final conversion
+        get measured inside the workers and are collected into it.
+    seed : int
+        If provided, random decisions and parameters of all augmentations get derived from seed, epoch, shard index
+        and sample index (see get_sample_seed). Not supported by overlay augmentations in modes "queue" and
+        "sequential".
+    epoch : int
+        Epoch number for deriving per sample seeds
+    shard_index : int
+        Index of the shard (e.g. Horovod rank) the samples belong to, for deriving per sample seeds
+    skip : int
+        Number of leading samples to skip (e.g. for resuming an epoch) - clock values and seeds of the remaining
+        samples are the same as without skipping. Indexable sample collections are not read for skipped samples.
 
     Returns
     -------
     iterable of util.sample_collections.LabeledSample or util.audio.Sample
     """
+    def indexed_samples():
+        if skip > 0 and hasattr(samples, '__getitem__'):
+            return ((index, samples[index]) for index in range(skip, len(samples)))
+        return itertools.islice(enumerate(samples), skip, None)
+
     def timed_samples():
-        if final_clock is None:
-            for sample in samples:
-                yield sample, clock
-        else:
-            for sample_index, sample in enumerate(samples):
+        for sample_index, sample in indexed_samples():
+            sample_clock = clock
+            if final_clock is not None:
                 sample_clock = clock + (final_clock - clock) * (sample_index / len(samples))
-                yield sample, sample_clock
+            sample_seed = None
+            if seed is not None:
+                sample_seed = get_sample_seed(seed, epoch, sample_index, shard_index=shard_index)
+            yield sample, sample_clock, sample_seed
 
     assert 0.0 <= clock <= 1.0
     if final_clock is not None:
@@ -217,20 +296,29 @@ def apply_sample_augmentations(samples,
     try:
         for augmentation in augmentations:
             augmentation.start(buffering=buffering)
-        context = AugmentationContext(audio_type, augmentations)
+        context = AugmentationContext(audio_type, augmentations, profile=timings is not None)
         if process_ahead == 0:
-            for timed_sample in timed_samples():
-                yield _load_and_augment_sample(timed_sample, context=context)
+            results = map(partial(_load_and_augment_sample, context=context), timed_samples())
+            yield from _collect_timings(results, timings)
         else:
             with LimitingPool(process_ahead=process_ahead,
                               initializer=_init_augmentation_worker,
                               initargs=(context,)) as pool:
-                yield from pool.imap(_load_and_augment_sample, timed_samples())
+                yield from _collect_timings(pool.imap(_load_and_augment_sample, timed_samples()), timings)
     finally:
         for augmentation in augmentations:
             augmentation.stop()
 
 
+def _collect_timings(results, timings):
+    if timings is None:
+        yield from results
+    else:
+        for sample, sample_timings in results:
+            timings.update(sample_timings)
+            yield sample
+
+
 def _enqueue_overlay_samples(sample_source, queue, buffering=BUFFER_SIZE):
     """
     As the central distribution point for overlay samples this function is supposed to run in one process only.
@@ -244,49 +332,160 @@ def _enqueue_overlay_samples(sample_source, queue, buffering=BUFFER_SIZE):
             queue.put(sample)
 
 
+_TEMPORARY_OVERLAY_BANKS = set()
+
+
+def _remove_temporary_overlay_banks():
+    for bank_path in _TEMPORARY_OVERLAY_BANKS:
+        for suffix in ['.bank', '.index.npy']:
+            if os.path.exists(bank_path + suffix):
+                os.remove(bank_path + suffix)
+    _TEMPORARY_OVERLAY_BANKS.clear()
+
+
+atexit.register(_remove_temporary_overlay_banks)
+
+
+def _get_overlay_bank_path(sample_source, bank_dir=None):
+    """
+    Returns the common path of the bank files of the current version of a sample source
+    and a path prefix that is shared by the banks of all its versions.
+    Without bank_dir, banks are private to the current process and live in the temp directory.
+    """
+    size, mtime = stat_remote(sample_source)
+    source_key = hashlib.sha1(os.path.abspath(sample_source).encode('utf8')).hexdigest()[:16]
+    version_key = hashlib.sha1('{}|{}'.format(size, mtime).encode('utf8')).hexdigest()[:16]
+    if bank_dir is None:
+        prefix = os.path.join(tempfile.gettempdir(), 'deepspeech-overlay-{}-{}-'.format(os.getpid(), source_key))
+    else:
+        prefix = os.path.join(bank_dir, 'deepspeech-overlay-{}-'.format(source_key))
+    return prefix + version_key, prefix
+
+
+def _build_overlay_bank(sample_source, buffering=BUFFER_SIZE, bank_dir=None):
+    """
+    Decodes all samples of a sample source once into a float32 noise bank file (mono, concatenated)
+    and an index file of sample offsets within the bank. Existing banks of unchanged sources are re-used
+    and banks of former versions of the source get removed. Banks in the temp directory (no bank_dir)
+    are removed when the process exits.
+    Several processes (e.g. Horovod ranks sharing a bank_dir) can build the same bank concurrently:
+    files are only ever replaced by complete files of identical content, so banks that got opened stay valid.
+    Returns the common path of bank (<path>.bank) and index (<path>.index.npy) files.
+    """
+    bank_path, prefix = _get_overlay_bank_path(sample_source, bank_dir=bank_dir)
+    if bank_dir is None:
+        _TEMPORARY_OVERLAY_BANKS.add(bank_path)
+    if os.path.exists(bank_path + '.index.npy'):
+        return bank_path
+    for suffix in ['.bank', '.index.npy']:
+        for stale_path in glob.glob(glob.escape(prefix) + '*' + suffix):
+            if stale_path != bank_path + suffix:
+                try:
+                    os.remove(stale_path)
+                except FileNotFoundError:
+                    pass  # removed by a concurrent builder
+    offsets = [0]
+    samples = samples_from_source(sample_source, buffering=buffering, labeled=False)
+    bank_fd, tmp_bank_path = tempfile.mkstemp(dir=os.path.dirname(bank_path),
+                                              prefix=os.path.basename(bank_path) + '.', suffix='.tmp')
+    with os.fdopen(bank_fd, 'wb') as bank_file:
+        for sample in change_audio_types(samples, audio_type=AUDIO_TYPE_NP):
+            audio = sample.audio.mean(axis=1) if sample.audio.shape[1] > 1 else sample.audio[:, 0]
+            bank_file.write(audio.astype(np.float32).tobytes())
+            offsets.append(offsets[-1] + len(audio))
+    if offsets[-1] == 0:
+        os.remove(tmp_bank_path)
+        raise RuntimeError('Overlay source "{}" contains no audio'.format(sample_source))
+    if os.path.exists(bank_path + '.index.npy'):
+        # Completed by a concurrent builder in the meantime
+        os.remove(tmp_bank_path)
+        return bank_path
+    os.replace(tmp_bank_path, bank_path + '.bank')
+    # The index file is written last, as its existence marks a complete bank
+    index_fd, tmp_index_path = tempfile.mkstemp(dir=os.path.dirname(bank_path),
+                                                prefix=os.path.basename(bank_path) + '.', suffix='.tmp')
+    with os.fdopen(index_fd, 'wb') as index_file:
+        np.save(index_file, np.array(offsets, dtype=np.int64))
+    os.replace(tmp_index_path, bank_path + '.index.npy')
+    return bank_path
+
+
 class Overlay(SampleAugmentation):
     """See "Overlay augmentation" in training documentation"""
-    def __init__(self, source, p=1.0, snr=3.0, layers=1):
+    def __init__(self, source, p=1.0, snr=3.0, layers=1, mode='queue', bank_dir=None):
         super(Overlay, self).__init__(p)
         self.source = source
         self.snr = float_range(snr)
         self.layers = int_range(layers)
+        if mode not in OVERLAY_MODES:
+            raise ValueError('Unsupported overlay mode: {} - has to be one of {}'.format(mode, OVERLAY_MODES))
+        self.mode = mode
+        self.bank_dir = bank_dir
         self.current_sample = None
         self.queue = None
         self.enqueue_process = None
+        self.bank_path = None
+        self.bank = None
+        self.bank_offsets = None
+        self.bank_position = None
 
     def start(self, buffering=BUFFER_SIZE):
+        if self.mode != 'queue':
+            # Only the bank's path gets passed to the workers - they open it on first use
+            self.bank_path = _build_overlay_bank(self.source, buffering=buffering, bank_dir=self.bank_dir)
+            return
         self.queue = Queue(max(1, math.floor(self.probability * self.layers[1] * os.cpu_count())))
         self.enqueue_process = Process(target=_enqueue_overlay_samples,
                                        args=(self.source, self.queue),
                                        kwargs={'buffering': buffering})
         self.enqueue_process.start()
 
-    def apply(self, sample, clock=0.0):
+    def _next_from_queue(self):
+        if self.current_sample is None:
+            next_overlay_sample = self.queue.get()
+            next_overlay_sample = unpack_maybe(next_overlay_sample)
+            next_overlay_sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
+            self.current_sample = next_overlay_sample.audio
+        return self.current_sample
+
+    def _next_from_bank(self, rng=None):
+        if self.bank is None:
+            self.bank = np.memmap(self.bank_path + '.bank', dtype=np.float32, mode='r')
+            self.bank_offsets = np.load(self.bank_path + '.index.npy')
+        if self.current_sample is None:
+            if self.mode == 'random' or self.bank_position is None:
+                # In sequential mode every worker starts at a random sample and continues from there
+                rng = random if rng is None else rng
+                self.bank_position = self.bank_offsets[rng.randrange(len(self.bank_offsets) - 1)]
+            # Stitching continues across sample boundaries and wraps around at the end of the bank
+            self.current_sample = self.bank[self.bank_position:, np.newaxis]
+            self.bank_position = 0
+        return self.current_sample
+
+    def apply(self, sample, clock=0.0, rng=None):
         sample = unpack_maybe(sample)
         sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
-        n_layers = pick_value_from_range(self.layers, clock=clock)
+        n_layers = pick_value_from_range(self.layers, clock=clock, rng=rng)
         audio = sample.audio
         overlay_data = np.zeros_like(audio)
+        next_overlay_data = self._next_from_queue if self.mode == 'queue' else partial(self._next_from_bank, rng=rng)
         for _ in range(n_layers):
             overlay_offset = 0
             while overlay_offset < len(audio):
-                if self.current_sample is None:
-                    next_overlay_sample = self.queue.get()
-                    next_overlay_sample = unpack_maybe(next_overlay_sample)
-                    next_overlay_sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
-                    self.current_sample = next_overlay_sample.audio
+                current_sample = next_overlay_data()
                 n_required = len(audio) - overlay_offset
-                n_current = len(self.current_sample)
+                n_current = len(current_sample)
                 if n_required >= n_current:  # take it completely
-                    overlay_data[overlay_offset:overlay_offset + n_current] += self.current_sample
+                    overlay_data[overlay_offset:overlay_offset + n_current] += current_sample
                     overlay_offset += n_current
                     self.current_sample = None
                 else:  # take required slice from head and keep tail for next layer or sample
-                    overlay_data[overlay_offset:overlay_offset + n_required] += self.current_sample[0:n_required]
+                    overlay_data[overlay_offset:overlay_offset + n_required] += current_sample[0:n_required]
                     overlay_offset += n_required
-                    self.current_sample = self.current_sample[n_required:]
-        snr_db = pick_value_from_range(self.snr, clock=clock)
+                    self.current_sample = current_sample[n_required:]
+            if self.mode == 'random':
+                self.current_sample = None
+        snr_db = pick_value_from_range(self.snr, clock=clock, rng=rng)
         orig_dbfs = max_dbfs(audio)
         overlay_gain = orig_dbfs - max_dbfs(overlay_data) - snr_db
         audio += overlay_data * gain_db_to_ratio(overlay_gain)
@@ -298,6 +497,9 @@ class Overlay(SampleAugmentation):
             self.enqueue_process = None
         self.current_sample = None
         self.queue = None
+        self.bank = None
+        self.bank_offsets = None
+        self.bank_position = None
 
 
 class Codec(SampleAugmentation):
@@ -306,8 +508,8 @@ class Codec(SampleAugmentation):
         super(Codec, self).__init__(p)
         self.bitrate = int_range(bitrate)
 
-    def apply(self, sample, clock=0.0):
-        bitrate = pick_value_from_range(self.bitrate, clock=clock)
+    def apply(self, sample, clock=0.0, rng=None):
+        bitrate = pick_value_from_range(self.bitrate, clock=clock, rng=rng)
         sample.change_audio_type(new_audio_type=AUDIO_TYPE_PCM)  # decoding to ensure it has to get encoded again
         sample.change_audio_type(new_audio_type=AUDIO_TYPE_OPUS, bitrate=bitrate)  # will get decoded again downstream
 
@@ -319,25 +521,40 @@ class Reverb(SampleAugmentation):
         self.delay = float_range(delay)
         self.decay = float_range(decay)
 
-    def apply(self, sample, clock=0.0):
+    def apply(self, sample, clock=0.0, rng=None):
         sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
-        audio = np.array(sample.audio, dtype=np.float64)
+        audio = np.asarray(sample.audio, dtype=np.float32)
+        n_samples = len(audio)
+        if n_samples == 0:
+            return
         orig_dbfs = max_dbfs(audio)
-        delay = pick_value_from_range(self.delay, clock=clock)
-        decay = pick_value_from_range(self.decay, clock=clock)
+        delay = pick_value_from_range(self.delay, clock=clock, rng=rng)
+        decay = pick_value_from_range(self.decay, clock=clock, rng=rng)
         decay = gain_db_to_ratio(-decay)
-        result = np.copy(audio)
+        # Impulse response of the dry signal plus one feedback comb filter y[n] = x[n] + decay * y[n - n_delay]
+        # per delay, truncated to sample length and to reflections that are still audible in float32
+        max_reflections = math.floor(math.log(REVERB_MIN_GAIN) / math.log(decay)) + 1 if decay < 1.0 else n_samples
+        taps, gains = [np.zeros(1, dtype=np.int64)], [np.ones(1, dtype=np.float32)]
         primes = [17, 19, 23, 29, 31]
         for delay_prime in primes:  # primes to minimize comb filter interference
-            layer = np.copy(audio)
             n_delay = math.floor(delay * (delay_prime / primes[0]) * sample.audio_format.rate / 1000.0)
-            n_delay = max(16, n_delay)  # 16 samples minimum to avoid performance trap and risk of division by zero
-            for w_index in range(0, math.floor(len(audio) / n_delay)):
-                w1 = w_index * n_delay
-                w2 = (w_index + 1) * n_delay
-                width = min(len(audio) - w2, n_delay)  # last window could be smaller
-                layer[w2:w2 + width] += decay * layer[w1:w1 + width]
-            result += layer
+            n_delay = max(16, n_delay)  # 16 samples minimum to avoid risk of division by zero
+            reflections = np.arange(min(max_reflections, (n_samples - 1) // n_delay + 1))
+            taps.append(reflections * n_delay)
+            gains.append(decay ** reflections.astype(np.float32))
+        taps, gains = np.concatenate(taps), np.concatenate(gains)
+        impulse_response = np.zeros(taps.max() + 1, dtype=np.float32)
+        np.add.at(impulse_response, taps, gains)
+        taps = np.flatnonzero(impulse_response)
+        if len(taps) <= REVERB_MAX_DIRECT_TAPS:
+            # Sparse impulse response: adding delayed copies is faster than FFT convolution
+            result = np.zeros_like(audio)
+            for tap in taps:
+                result[tap:] += impulse_response[tap] * audio[:n_samples - tap]
+        else:
+            fft_len = 1 << (n_samples + len(impulse_response) - 2).bit_length()  # avoids circular wrap-around
+            spectrum = np.fft.rfft(audio, n=fft_len, axis=0) * np.fft.rfft(impulse_response, n=fft_len)[:, np.newaxis]
+            result = np.fft.irfft(spectrum, n=fft_len, axis=0)[:n_samples]
         audio = normalize_audio(result, dbfs=orig_dbfs)
         sample.audio = np.array(audio, dtype=np.float32)
 
@@ -348,9 +565,9 @@ class Resample(SampleAugmentation):
         super(Resample, self).__init__(p)
         self.rate = int_range(rate)
 
-    def apply(self, sample, clock=0.0):
+    def apply(self, sample, clock=0.0, rng=None):
         sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
-        rate = pick_value_from_range(self.rate, clock=clock)
+        rate = pick_value_from_range(self.rate, clock=clock, rng=rng)
         orig_len = len(sample.audio)
         resampled = resampy.resample(sample.audio, sample.audio_format.rate, rate, axis=0, filter='kaiser_fast')
         sample.audio = resampy.resample(resampled, rate, sample.audio_format.rate, axis=0, filter='kaiser_fast')[:orig_len]
@@ -361,7 +578,7 @@ class NormalizeSampleRate(SampleAugmentation):
         super().__init__(p=1.0)
         self.rate = rate
 
-    def apply(self, sample, clock=0.0):
+    def apply(self, sample, clock=0.0, rng=None):
         if sample.audio_format.rate == self.rate:
             return
 
@@ -376,9 +593,9 @@ class Volume(SampleAugmentation):
         super(Volume, self).__init__(p)
         self.target_dbfs = float_range(dbfs)
 
-    def apply(self, sample, clock=0.0):
+    def apply(self, sample, clock=0.0, rng=None):
         sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
-        target_dbfs = pick_value_from_range(self.target_dbfs, clock=clock)
+        target_dbfs = pick_value_from_range(self.target_dbfs, clock=clock, rng=rng)
         sample.audio = normalize_audio(sample.audio, dbfs=target_dbfs)
 
 
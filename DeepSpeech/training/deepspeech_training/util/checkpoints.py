@@ -1,10 +1,16 @@
+import os
 import sys
+import json
 import tensorflow as tf
 import tensorflow.compat.v1 as tfv1
 
+from concurrent.futures import ThreadPoolExecutor
 from .flags import FLAGS
+from .io import open_remote, path_exists_remote
 from .logging import log_info, log_error, log_warn
 
+PIPELINE_STATE_FILENAME = 'pipeline_state.json'
+
 
 def _load_checkpoint(session, checkpoint_path, allow_drop_layers, allow_lr_init=True):
     # Load the checkpoint and put all variables into loading list
@@ -123,6 +129,36 @@ def reload_best_checkpoint(session):
     _load_or_init_impl(session, ['best'], allow_drop_layers=False, allow_lr_init=False)
 
 
+class BestWeightsSnapshot:
+    '''
+    Keeps a copy of all global variables in shadow variables in host memory, so that the best validating weights can
+    be restored by an in-graph copy instead of reloading the best validating checkpoint variable by variable.
+    Has to be created before the graph gets finalized.
+    '''
+    def __init__(self):
+        variables = tfv1.global_variables()
+        with tf.device('/cpu:0'), tf.name_scope('best_weights'):
+            # Not part of any collection, so that they neither get saved nor initialized
+            shadows = [tfv1.Variable(tf.zeros(v.shape, dtype=v.dtype.base_dtype),
+                                     trainable=False,
+                                     collections=[],
+                                     name=v.op.name.replace('/', '_')) for v in variables]
+        self.snapshot_op = tf.group(*[shadow.assign(v) for v, shadow in zip(variables, shadows)])
+        self.restore_op = tf.group(*[v.assign(shadow) for v, shadow in zip(variables, shadows)])
+        self.taken = False
+
+    def take(self, session):
+        session.run(self.snapshot_op)
+        self.taken = True
+
+    def restore(self, session):
+        '''Restores the snapshot or - if none was taken yet - reloads the best validating checkpoint'''
+        if self.taken:
+            session.run(self.restore_op)
+        else:
+            reload_best_checkpoint(session)
+
+
 def load_or_init_graph_for_training(session):
     '''
     Load variables from checkpoint or initialize variables. By default this will
@@ -149,3 +185,106 @@ def load_graph_for_evaluation(session):
     else:
         methods = [FLAGS.load_evaluate]
     _load_or_init_impl(session, methods, allow_drop_layers=False)
+
+
+def save_pipeline_state(epoch, sample_index, global_step):
+    '''
+    Saves the position of the training input pipeline next to the checkpoints:
+    sample_index samples of epoch have been trained on at global_step.
+    '''
+    state = {'epoch': epoch, 'sample_index': sample_index, 'global_step': int(global_step)}
+    with open_remote(os.path.join(FLAGS.save_checkpoint_dir, PIPELINE_STATE_FILENAME), 'w') as state_file:
+        json.dump(state, state_file)
+
+
+def load_pipeline_state(global_step):
+    '''
+    Loads the input pipeline position saved by save_pipeline_state.
+    Returns (epoch, sample_index) if it belongs to the loaded checkpoint (same global step), otherwise None.
+    '''
+    state_path = os.path.join(FLAGS.load_checkpoint_dir, PIPELINE_STATE_FILENAME)
+    if not path_exists_remote(state_path):
+        return None
+    with open_remote(state_path, 'r') as state_file:
+        state = json.load(state_file)
+    if state['global_step'] != int(global_step):
+        log_warn('Not resuming input pipeline, as its state belongs to step {} instead of {}'.format(
+            state['global_step'], global_step))
+        return None
+    return state['epoch'], state['sample_index']
+
+
+class AsyncCheckpointSaver:
+    '''
+    Replacement for tfv1.train.Saver that snapshots all global variables into host memory and writes the checkpoint
+    from a background thread, so that training does not wait for (remote) storage.
+    A save waits for the previous one to finish. Call close() for finishing a save that is still in progress.
+    '''
+    def __init__(self, max_to_keep=5):
+        self.max_to_keep = max_to_keep
+        self.variables = sorted(tfv1.global_variables(), key=lambda v: v.op.name)
+        self.checkpoint_paths = {}  # per checkpoint state file
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+        # Separate graph, as the training graph gets finalized
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.prefix = tfv1.placeholder(tf.string, [])
+            self.placeholders = [tfv1.placeholder(v.dtype.base_dtype, v.shape) for v in self.variables]
+            self.save_op = tf.raw_ops.SaveV2(prefix=self.prefix,
+                                             tensor_names=[v.op.name for v in self.variables],
+                                             shape_and_slices=[''] * len(self.variables),
+                                             tensors=self.placeholders)
+        self.session = tfv1.Session(graph=self.graph, config=tfv1.ConfigProto(device_count={'GPU': 0}))
+
+    def save(self, session, save_path, global_step=None, latest_filename=None):
+        self.wait()
+        # Like tfv1.train.Saver, global_step can be a tensor, a variable or a plain (Python or NumPy) number
+        fetch_step = isinstance(global_step, (tf.Tensor, tf.Variable))
+        fetches = [global_step] + self.variables if fetch_step else self.variables
+        values = session.run(fetches)
+        if fetch_step:
+            global_step, values = values[0], values[1:]
+        if global_step is not None:
+            save_path = '{}-{}'.format(save_path, int(global_step))
+        self.pending = self.executor.submit(self._write, values, save_path, latest_filename or 'checkpoint')
+        return save_path
+
+    def _write(self, values, save_path, latest_filename):
+        feed_dict = dict(zip(self.placeholders, values))
+        feed_dict[self.prefix] = save_path
+        self.session.run(self.save_op, feed_dict=feed_dict)
+        paths = self.checkpoint_paths.setdefault(latest_filename, [])
+        if save_path in paths:
+            paths.remove(save_path)
+        paths.append(save_path)
+        while self.max_to_keep and len(paths) > self.max_to_keep:
+            tfv1.train.remove_checkpoint(paths.pop(0))
+        tfv1.train.update_checkpoint_state(os.path.dirname(save_path), save_path,
+                                           all_model_checkpoint_paths=paths,
+                                           latest_filename=latest_filename)
+
+    def wait(self):
+        '''Waits for a save in progress and raises its exception (if any)'''
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending.result()
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown()
+            self.session.close()
+
+
+def create_checkpoint_saver(max_to_keep):
+    '''
+    Creates an AsyncCheckpointSaver if requested by --async_checkpoints and supported by the graph,
+    otherwise a tfv1.train.Saver.
+    '''
+    if FLAGS.async_checkpoints:
+        if not tfv1.get_collection(tfv1.GraphKeys.SAVEABLE_OBJECTS):
+            return AsyncCheckpointSaver(max_to_keep=max_to_keep)
+        log_warn('Asynchronous checkpoint saving does not support CuDNN RNN models - saving synchronously')
+    return tfv1.train.Saver(max_to_keep=max_to_keep)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function
 
+import os
+
 from collections import Counter
 from functools import partial
 
@@ -12,10 +14,19 @@ from tensorflow.python.ops import gen_audio_ops as contrib_audio
 from .config import Config
 from .text import text_to_char_array
 from .flags import FLAGS
-from .augmentations import apply_sample_augmentations, apply_graph_augmentations
+from .augmentations import SampleAugmentation, apply_sample_augmentations, apply_graph_augmentations
 from .audio import read_frames_from_file, vad_split, pcm_to_np, DEFAULT_FORMAT
-from .sample_collections import samples_from_sources
+from .sample_collections import (
+    EPOCH_PLACEHOLDER,
+    TFRECORD_SAMPLE_ID_KEY,
+    TFRECORD_TRANSCRIPT_KEY,
+    TFRECORD_WAV_KEY,
+    get_tfrecord_shards,
+    samples_from_sources
+)
 from .helpers import remember_exception, MEGABYTE
+from .io import path_exists_remote
+from .logging import log_warn
 
 
 def audio_to_features(audio, sample_rate, transcript=None, clock=0.0, train_phase=False, augmentations=None, sample_id=None):
@@ -79,11 +90,49 @@ def to_sparse_tuple(sequence):
     r"""Creates a sparse representention of ``sequence``.
         Returns a tuple with (indices, values, shape)
     """
-    indices = np.asarray(list(zip([0]*len(sequence), range(len(sequence)))), dtype=np.int64)
+    sequence = np.asarray(sequence, dtype=np.int32)
+    indices = np.zeros((len(sequence), 2), dtype=np.int64)
+    indices[:, 1] = np.arange(len(sequence))
     shape = np.asarray([1, len(sequence)], dtype=np.int64)
     return indices, sequence, shape
 
 
+class TranscriptEncoder:
+    """Memoizes sparse encodings of transcripts, as many samples (e.g. of different speakers) share the same text.
+    Unencodable or empty transcripts are never memoized and raise on every occurrence."""
+    def __init__(self, alphabet):
+        self.alphabet = alphabet
+        self.encoded = {}
+
+    def encode(self, transcript, context=''):
+        sparse = self.encoded.get(transcript)
+        if sparse is None:
+            sparse = to_sparse_tuple(text_to_char_array(transcript, self.alphabet, context=context))
+            for array in sparse:
+                # Shared by all samples with this transcript
+                array.setflags(write=False)
+            self.encoded[transcript] = sparse
+        return sparse
+
+
+def get_epoch_sources(sources, epoch):
+    """
+    Resolves placeholder "{epoch}" in sample source paths (as written by bin/data_set_tool.py --epochs).
+    If there are less materialized epochs than requested, they get re-used round-robin.
+    """
+    epoch_sources = []
+    for source in sources:
+        if EPOCH_PLACEHOLDER in source:
+            num_epochs = 0
+            while path_exists_remote(source.replace(EPOCH_PLACEHOLDER, str(num_epochs))):
+                num_epochs += 1
+            if num_epochs == 0:
+                raise RuntimeError('No materialized epochs found for sample source "{}"'.format(source))
+            source = source.replace(EPOCH_PLACEHOLDER, str(epoch % num_epochs))
+        epoch_sources.append(source)
+    return epoch_sources
+
+
 def create_dataset(sources,
                    batch_size,
                    epochs=1,
@@ -95,29 +144,57 @@ def create_dataset(sources,
                    exception_box=None,
                    process_ahead=None,
                    buffering=1 * MEGABYTE,
-                   split_dataset=False):
-    epoch_counter = Counter()  # survives restarts of the dataset and its generator
+                   split_dataset=False,
+                   timings=None,
+                   augmentation_seed=None,
+                   weights=None,
+                   temperature=1.0,
+                   epoch_counter=None):
+    # Survives restarts of the dataset and its generator.
+    # Can be provided for resuming at an epoch ('epoch') and a number of samples to skip in it ('skip').
+    epoch_counter = Counter() if epoch_counter is None else epoch_counter
+    transcript_encoder = TranscriptEncoder(Config.alphabet)  # also shared by all epochs
+    num_shards, shard_index = 1, 0
+    if split_dataset:
+        # Every rank only reads, augments and converts its own (length-balanced) share of the samples
+        import horovod.tensorflow as hvd  # pylint: disable=import-outside-toplevel
+        num_shards, shard_index = hvd.size(), hvd.rank()
 
     def generate_values():
         epoch = epoch_counter['epoch']
+        skip = epoch_counter.pop('skip', 0)
         if train_phase:
             epoch_counter['epoch'] += 1
-        samples = samples_from_sources(sources, buffering=buffering, labeled=True, reverse=reverse)
+        samples = samples_from_sources(get_epoch_sources(sources, epoch),
+                                       buffering=buffering,
+                                       labeled=True,
+                                       reverse=reverse,
+                                       num_shards=num_shards,
+                                       shard_index=shard_index,
+                                       drop_remainder=train_phase,
+                                       weights=weights,
+                                       temperature=temperature,
+                                       epoch=epoch)
         num_samples = len(samples)
         if limit > 0:
-            num_samples = min(limit, num_samples)
+            # Limit is meant for the total number of samples of all ranks
+            num_samples = min(max(1, limit // num_shards), num_samples)
         samples = apply_sample_augmentations(samples,
                                              augmentations,
                                              buffering=buffering,
                                              process_ahead=2 * batch_size if process_ahead is None else process_ahead,
                                              clock=epoch / epochs,
-                                             final_clock=(epoch + 1) / epochs)
-        for sample_index, sample in enumerate(samples):
+                                             final_clock=(epoch + 1) / epochs,
+                                             timings=timings,
+                                             seed=augmentation_seed,
+                                             epoch=epoch,
+                                             shard_index=shard_index,
+                                             skip=skip)
+        for sample_index, sample in enumerate(samples, start=skip):
             if sample_index >= num_samples:
                 break
             clock = (epoch * num_samples + sample_index) / (epochs * num_samples) if train_phase and epochs > 0 else 0.0
-            transcript = text_to_char_array(sample.transcript, Config.alphabet, context=sample.sample_id)
-            transcript = to_sparse_tuple(transcript)
+            transcript = transcript_encoder.encode(sample.transcript, context=sample.sample_id)
             yield sample.sample_id, sample.audio, sample.audio_format.rate, transcript, clock
 
     # Batching a dataset of 2D SparseTensors creates 3D batches, which fail
@@ -134,16 +211,77 @@ def create_dataset(sources,
         sample_ids = sample_ids.batch(batch_size)
         return tf.data.Dataset.zip((sample_ids, features, transcripts))
 
+    def generate_clock():
+        # Only runs once per epoch - the per-sample work of TFRecord data-sets is done by TensorFlow
+        epoch = epoch_counter['epoch']
+        if epoch_counter.pop('skip', 0) > 0:
+            log_warn('TFRecord data-sets cannot skip samples - resuming at the start of epoch {}'.format(epoch))
+        if train_phase:
+            epoch_counter['epoch'] += 1
+        yield epoch / epochs if train_phase and epochs > 0 else 0.0
+
+    def encode_transcript(transcript, sample_id):
+        return transcript_encoder.encode(transcript.decode(), context=sample_id.decode())
+
+    def parse_record(record, clock):
+        parsed = tf.io.parse_single_example(record, {
+            TFRECORD_SAMPLE_ID_KEY: tf.io.FixedLenFeature([], tf.string),
+            TFRECORD_WAV_KEY: tf.io.FixedLenFeature([], tf.string),
+            TFRECORD_TRANSCRIPT_KEY: tf.io.FixedLenFeature([], tf.string)
+        })
+        sample_id = parsed[TFRECORD_SAMPLE_ID_KEY]
+        decoded = contrib_audio.decode_wav(parsed[TFRECORD_WAV_KEY], desired_channels=1)
+        indices, values, shape = tf.numpy_function(encode_transcript,
+                                                   [parsed[TFRECORD_TRANSCRIPT_KEY], sample_id],
+                                                   (tf.int64, tf.int32, tf.int64),
+                                                   name='encode_transcript')
+        indices.set_shape([None, 2])
+        values.set_shape([None])
+        shape.set_shape([2])
+        return sample_id, decoded.audio, decoded.sample_rate, (indices, values, shape), clock
+
+    def tfrecord_values():
+        if any(isinstance(augmentation, SampleAugmentation) for augmentation in augmentations or []):
+            raise ValueError('Sample augmentations are not supported for TFRecord data-sets - '
+                             'use bin/data_set_tool.py for applying them ahead of training')
+        if reverse:
+            raise ValueError('Reverse order is not supported for TFRecord data-sets')
+        if any(EPOCH_PLACEHOLDER in source for source in sources):
+            raise ValueError('Epoch placeholders are not supported for TFRecord data-sets')
+        if weights is not None or temperature != 1.0:
+            raise ValueError('Weighted mixing is not supported for TFRecord data-sets')
+        shards = [shard for source in sources for shard in get_tfrecord_shards(source)]
+        # With enough files, each rank only opens and reads its own share of them
+        shard_files = num_shards > 1 and len(shards) >= num_shards
+        if shard_files:
+            shards = shards[shard_index::num_shards]
+        records = tf.data.Dataset.from_tensor_slices(shards).interleave(
+            tf.data.TFRecordDataset,
+            cycle_length=len(shards),
+            block_length=1,
+            num_parallel_calls=tf.data.experimental.AUTOTUNE)
+        if num_shards > 1 and not shard_files:
+            # Fewer files than ranks - records are only parsed and decoded by the rank they belong to
+            records = records.shard(num_shards, shard_index)
+        if limit > 0:
+            records = records.take(max(1, limit // num_shards))
+        clocks = tf.data.Dataset.from_generator(remember_exception(generate_clock, exception_box),
+                                                output_types=tf.float64)
+        return clocks.flat_map(lambda clock: records.map(
+            lambda record: parse_record(record, clock),
+            num_parallel_calls=tf.data.experimental.AUTOTUNE))
+
     process_fn = partial(entry_to_features, train_phase=train_phase, augmentations=augmentations)
 
-    dataset = tf.data.Dataset.from_generator(remember_exception(generate_values, exception_box),
-                                             output_types=(tf.string, tf.float32, tf.int32,
-                                                           (tf.int64, tf.int32, tf.int64), tf.float64))
-    if split_dataset:
-        # Using horovod Iterator.get_next() is not aware of different devices.
-        # A.shard(n, i) will contain all elements of A whose index mod n = i.
-        import horovod.tensorflow as hvd
-        dataset = dataset.shard(hvd.size(), hvd.rank())
+    tfrecord_sources = [os.path.splitext(source)[1].lower() == '.tfrecord' for source in sources]
+    if all(tfrecord_sources):
+        dataset = tfrecord_values()
+    elif any(tfrecord_sources):
+        raise ValueError('TFRecord data-sets cannot be combined with other sample sources')
+    else:
+        dataset = tf.data.Dataset.from_generator(remember_exception(generate_values, exception_box),
+                                                 output_types=(tf.string, tf.float32, tf.int32,
+                                                               (tf.int64, tf.int32, tf.int64), tf.float64))
     dataset = dataset.map(process_fn, num_parallel_calls=tf.data.experimental.AUTOTUNE)
     if cache_path:
         dataset = dataset.cache(cache_path)
@@ -13,6 +13,8 @@ def create_flags():
     f = absl.flags
 
     f.DEFINE_string('train_files', '', 'comma separated list of files specifying the dataset used for training. Multiple files will get merged. If empty, training will not be run.')
+    f.DEFINE_string('train_weights', '', 'comma separated list of relative mixing weights for the files of --train_files - mixes the training sources instead of just merging them, keeping the epoch size at the total number of samples: the share of each source is proportional to its weight times its size (e.g. "2.0,1.0" with two sources of equal size gives shares of 2/3 and 1/3, i.e. 1.33 and 0.67 times their sizes)')
+    f.DEFINE_float('train_temperature', 1.0, 'temperature for mixing the files of --train_files - values above 1.0 move the share of samples from big sources to small ones')
     f.DEFINE_string('dev_files', '', 'comma separated list of files specifying the datasets used for validation. Multiple files will get reported separately. If empty, validation will not be run.')
     f.DEFINE_string('test_files', '', 'comma separated list of files specifying the datasets used for testing. Multiple files will get reported separately. If empty, the model will not be tested.')
     f.DEFINE_string('metrics_files', '', 'comma separated list of files specifying the datasets used for tracking of metrics (after validation step). Currently the only metric is the CTC loss but without affecting the tracking of best validation loss. Multiple files will get reported separately. If empty, metrics will not be computed.')
@@ -30,6 +32,10 @@ def create_flags():
     # ================
 
     f.DEFINE_multi_string('augment', None, 'specifies an augmentation of the training samples. Format is "--augment operation[param1=value1, ...]"')
+    f.DEFINE_integer('augmentation_seed', None, 'if set, all random decisions and parameters of sample augmentations are derived from this seed, the epoch, the Horovod rank and the sample index - making augmented samples reproducible (overlay augmentations only in mode "random")')
+    f.DEFINE_integer('profile_steps', 0, 'if greater 0, the time each step waits for input, its compute time, its summary writing time and its sample throughput are written as TensorBoard summaries (--summary_dir) and summarized on the console every that many steps')
+    f.DEFINE_float('input_bound_threshold', 0.2, 'fraction of the step time spent waiting for input above which --profile_steps warns about input-bound training')
+    f.DEFINE_boolean('profile_augmentations', False, 'measure wall times of loading and sample augmentations per training sample and write them per epoch as TensorBoard summaries (--summary_dir) and to augmentations.json in --summary_dir')
 
     # Global Constants
     # ================
@@ -89,6 +95,8 @@ def create_flags():
     f.DEFINE_string('load_checkpoint_dir', '', 'directory in which checkpoints are stored - defaults to directory "deepspeech/checkpoints" within user\'s data home specified by the XDG Base Directory Specification')
     f.DEFINE_string('save_checkpoint_dir', '', 'directory to which checkpoints are saved - defaults to directory "deepspeech/checkpoints" within user\'s data home specified by the XDG Base Directory Specification')
     f.DEFINE_integer('checkpoint_secs', 600, 'checkpoint saving interval in seconds')
+    f.DEFINE_boolean('async_checkpoints', False, 'if set, checkpoints are written by a background thread from a snapshot of the variables in host memory, so that training does not wait for (remote) storage')
+    f.DEFINE_boolean('resume_pipeline', False, 'if set, the position of the training input pipeline (epoch and sample) is saved with each checkpoint and training resumes from there instead of starting over at epoch 0 - only applies if the loaded checkpoint is the one the position was saved with')
     f.DEFINE_integer('max_to_keep', 5, 'number of checkpoint files to keep - default value is 5')
     f.DEFINE_string('load_train', 'auto', 'what checkpoint to load before starting the training process. "last" for loading most recent epoch checkpoint, "best" for loading best validation loss checkpoint, "init" for initializing a new checkpoint, "auto" for trying several options.')
     f.DEFINE_string('load_evaluate', 'auto', 'what checkpoint to load for evaluation tasks (test epochs, model export, single file inference, etc). "last" for loading most recent epoch checkpoint, "best" for loading best validation loss checkpoint, "auto" for trying several options.')
@@ -194,10 +194,11 @@ def float_range(value):
     return get_value_range(value, float)
 
 
-def pick_value_from_range(value_range, clock=None):
-    clock = random.random() if clock is None else max(0.0, min(1.0, float(clock)))
+def pick_value_from_range(value_range, clock=None, rng=None):
+    rng = random if rng is None else rng
+    clock = rng.random() if clock is None else max(0.0, min(1.0, float(clock)))
     value = value_range.start + clock * (value_range.end - value_range.start)
-    value = random.uniform(value - value_range.r, value + value_range.r)
+    value = rng.uniform(value - value_range.r, value + value_range.r)
     return round(value) if isinstance(value_range.start, int) else value
 
 
@@ -79,3 +79,14 @@ def remove_remote(filename):
     """
     # Conditional import
     return gfile.remove(filename)
+
+
+def stat_remote(path):
+    """
+    Wrapper that returns size and modification time (in nanoseconds) of local and remote files like `gs://...`
+    """
+    if is_remote_path(path):
+        stat = gfile.stat(path)
+        return stat.length, stat.mtime_nsec
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
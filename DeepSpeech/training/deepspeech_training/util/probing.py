@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+
+from collections import namedtuple
+from multiprocessing import Pool
+
+from .audio import AudioFormat, get_loadable_audio_type_from_extension, read_header
+from .io import open_remote, stat_remote
+
+PROBE_CHUNK_SIZE = 64
+HEADER_BUFFER_SIZE = 4096
+
+
+class ProbeResult(namedtuple('ProbeResult', 'path size mtime_ns audio_format num_samples')):
+    """
+    Header information of an audio file.
+    audio_format and num_samples are None if the file could not be probed.
+    """
+    @property
+    def duration(self):
+        if self.audio_format is None:
+            return None
+        return self.num_samples / self.audio_format.rate
+
+
+def probe_audio_file(path, stat=None):
+    """
+    Reads format and number of samples of a WAV or Ogg Opus file from its container headers only.
+
+    Parameters
+    ----------
+    path : str
+        Path of the audio file (can be remote)
+    stat : (int, int)
+        Size and modification time of the file (as returned by `util.io.stat_remote`), if already known
+
+    Returns
+    -------
+    ProbeResult
+    """
+    size, mtime_ns = stat_remote(path) if stat is None else stat
+    audio_type = get_loadable_audio_type_from_extension(os.path.splitext(path)[1].lower())
+    audio_format, num_samples = None, None
+    if audio_type is not None:
+        try:
+            with open_remote(path, 'rb', buffering=HEADER_BUFFER_SIZE) as audio_file:
+                audio_format, num_samples = read_header(audio_type, audio_file)
+        except (OSError, ValueError):
+            pass
+    return ProbeResult(path, size, mtime_ns, audio_format, num_samples)
+
+
+def _probe_audio_file(path_and_stat):
+    return probe_audio_file(*path_and_stat)
+
+
+class ProbeCache:
+    """
+    Persistent (SQLite) cache of audio file probes. Entries are keyed by path, size and modification time,
+    so changed files get probed again.
+    """
+    def __init__(self, cache_path):
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS probes ('
+                                'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+                                'rate INTEGER, channels INTEGER, width INTEGER, num_samples INTEGER)')
+        self.connection.commit()
+
+    def lookup(self, path_stats):
+        """
+        Looks up cached probes.
+
+        Parameters
+        ----------
+        path_stats : dict
+            Mapping from paths to their current (size, mtime_ns)
+
+        Returns
+        -------
+        dict
+            Mapping from paths to ProbeResult for all up-to-date entries
+        """
+        results = {}
+        for row in self.connection.execute('SELECT path, size, mtime_ns, rate, channels, width, num_samples '
+                                           'FROM probes'):
+            path, size, mtime_ns, rate, channels, width, num_samples = row
+            if path_stats.get(path) == (size, mtime_ns):
+                audio_format = None if rate is None else AudioFormat(rate, channels, width)
+                results[path] = ProbeResult(path, size, mtime_ns, audio_format, num_samples)
+        return results
+
+    def store(self, results):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((result.path, result.size, result.mtime_ns,
+                  *(result.audio_format if result.audio_format is not None else (None, None, None)),
+                  result.num_samples) for result in results))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def probe_audio_files(paths, cache_path=None, processes=None):
+    """
+    Probes many audio files in parallel (see `probe_audio_file`). If a cache path is provided,
+    only new or changed files get probed and results are persisted for subsequent calls.
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths of the audio files
+    cache_path : str
+        Path of the SQLite probe cache file
+    processes : int
+        Number of probing processes - defaults to the number of CPUs
+
+    Returns
+    -------
+    list of ProbeResult
+        Results in order of paths
+    """
+    path_stats = {}
+    for path in paths:
+        try:
+            path_stats[path] = stat_remote(path)
+        except OSError:
+            path_stats[path] = (-1, -1)
+    cache = ProbeCache(cache_path) if cache_path else None
+    try:
+        results = cache.lookup(path_stats) if cache else {}
+        missing = [(path, path_stats[path]) for path in path_stats if path not in results]
+        if len(missing) > 0:
+            with Pool(processes=processes) as pool:
+                probed = pool.map(_probe_audio_file, missing, chunksize=PROBE_CHUNK_SIZE)
+            results.update((result.path, result) for result in probed)
+            if cache:
+                cache.store(result for result in probed if result.size >= 0)
+    finally:
+        if cache:
+            cache.close()
+    return [results[path] for path in paths]
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import json
+
+from array import array
+from collections import deque
+
+import numpy as np
+
+from .io import open_remote, path_exists_remote
+
+
+class Timings:
+    """
+    Collects wall times of named operations (like sample augmentations) and summarizes them by
+    call count, total time, throughput and latency percentiles.
+    Timings of other processes can be merged in as dictionaries from operation names to durations.
+    """
+    def __init__(self):
+        self.durations = {}
+
+    def add(self, name, duration):
+        if name not in self.durations:
+            self.durations[name] = array('d')
+        self.durations[name].append(duration)
+
+    def update(self, timings):
+        """
+        Parameters
+        ----------
+        timings : dict
+            Operation names mapped to durations in seconds (e.g. of one sample)
+        """
+        for name, duration in timings.items():
+            self.add(name, duration)
+
+    def reset(self):
+        self.durations = {}
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict
+            Operation names mapped to dictionaries with "calls", "total_time" (s), "mean_time" (ms),
+            "p95_time" (ms) and "calls_per_second" (if the operation ran in a single thread)
+            - "calls_per_second" is 0.0 if no time was measured
+        """
+        summary = {}
+        for name, durations in self.durations.items():
+            durations = np.frombuffer(durations, dtype=np.float64)
+            total_time = float(durations.sum())
+            summary[name] = {
+                'calls': len(durations),
+                'total_time': total_time,
+                'mean_time': 1000.0 * total_time / len(durations),
+                'p95_time': 1000.0 * float(np.percentile(durations, 95)),
+                'calls_per_second': len(durations) / total_time if total_time > 0 else 0.0
+            }
+        return summary
+
+
+class StepTimings:
+    """
+    Keeps the timings of the most recent training steps, split into time waiting for the input pipeline,
+    compute time and time for writing summaries, to tell if training is input-bound.
+    """
+    def __init__(self, window=100):
+        self.steps = deque(maxlen=window)
+
+    def add(self, input_wait, compute, summaries, samples):
+        """
+        Parameters
+        ----------
+        input_wait : float
+            Seconds the step waited for its batch(es)
+        compute : float
+            Seconds of the step's session run without input wait
+        summaries : float
+            Seconds for writing the step's summaries
+        samples : int
+            Number of samples the step processed
+        """
+        self.steps.append((input_wait, compute, summaries, samples))
+
+    def reset(self):
+        self.steps.clear()
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict
+            "steps", mean "input_wait", "compute" and "summaries" times (ms), "input_fraction" of the total step time
+            and "samples_per_second" over the kept steps
+        """
+        if not self.steps:
+            return {}
+        input_wait, compute, summaries, samples = np.array(self.steps, dtype=np.float64).sum(axis=0)
+        total_time = input_wait + compute + summaries
+        return {
+            'steps': len(self.steps),
+            'input_wait': 1000.0 * input_wait / len(self.steps),
+            'compute': 1000.0 * compute / len(self.steps),
+            'summaries': 1000.0 * summaries / len(self.steps),
+            'input_fraction': input_wait / total_time if total_time > 0 else 0.0,
+            'samples_per_second': samples / total_time if total_time > 0 else 0.0
+        }
+
+
+def summary_to_tf_summary(summary, prefix):
+    """Converts the result of Timings.summary() into a TensorBoard summary with one scalar per value"""
+    import tensorflow.compat.v1 as tfv1  # pylint: disable=import-outside-toplevel
+    values = []
+    for name, stats in sorted(summary.items()):
+        for key, value in sorted(stats.items()):
+            values.append(tfv1.Summary.Value(tag='{}/{}/{}'.format(prefix, name, key), simple_value=value))
+    return tfv1.Summary(value=values)
+
+
+def append_json_report(report_path, entry):
+    """Appends an entry to a JSON report file that contains a list of entries"""
+    entries = []
+    if path_exists_remote(report_path):
+        with open_remote(report_path, 'r') as report_file:
+            entries = json.load(report_file)
+    entries.append(entry)
+    with open_remote(report_path, 'w') as report_file:
+        json.dump(entries, report_file, indent=2)
+
+
+def format_summary(summary):
+    """Formats the result of Timings.summary() as a table"""
+    lines = ['{:<16} {:>10} {:>12} {:>12} {:>12} {:>12}'.format(
+        'operation', 'calls', 'total (s)', 'mean (ms)', 'p95 (ms)', 'calls/s')]
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]['total_time']):
+        lines.append('{:<16} {:>10} {:>12.2f} {:>12.2f} {:>12.2f} {:>12.1f}'.format(
+            name, stats['calls'], stats['total_time'], stats['mean_time'], stats['p95_time'],
+            stats['calls_per_second']))
+    return '\n'.join(lines)
+
+
+def format_step_summary(summary):
+    """Formats the result of StepTimings.summary() as a single line"""
+    return ('{steps} steps: {input_wait:.1f} ms input wait ({input_fraction:.0%}), {compute:.1f} ms compute, '
+            '{summaries:.1f} ms summaries per step, {samples_per_second:.1f} samples/s'.format(**summary))
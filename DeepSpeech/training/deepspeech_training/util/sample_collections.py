@@ -4,6 +4,7 @@ import io
 import csv
 import json
 import tarfile
+import numpy as np
 
 from pathlib import Path
 from functools import partial
@@ -13,6 +14,7 @@ from .audio import (
     Sample,
     AUDIO_TYPE_PCM,
     AUDIO_TYPE_OPUS,
+    AUDIO_TYPE_WAV,
     SERIALIZABLE_AUDIO_TYPES,
     get_loadable_audio_type_from_extension,
     write_wav
@@ -28,6 +30,15 @@ BUFFER_SIZE = 1 * MEGABYTE
 REVERSE_BUFFER_SIZE = 16 * KILOBYTE
 CACHE_SIZE = 1 * GIGABYTE
 
+CSV_INDEX_SUFFIX = '.index.npz'
+CSV_INDEX_VERSION = 1
+
+EPOCH_PLACEHOLDER = '{epoch}'  # in paths of pre-augmented epochs
+
+TFRECORD_SAMPLE_ID_KEY = 'sample_id'
+TFRECORD_WAV_KEY = 'wav'
+TFRECORD_TRANSCRIPT_KEY = 'transcript'
+
 SCHEMA_KEY = 'schema'
 CONTENT_KEY = 'content'
 MIME_TYPE_KEY = 'mime-type'
@@ -39,6 +50,8 @@ CONTENT_TYPE_TRANSCRIPT = 'transcript'
 class LabeledSample(Sample):
     """In-memory labeled audio sample representing an utterance.
     Derived from util.audio.Sample and used by sample collection readers and writers."""
+    __slots__ = ['transcript']
+
     def __init__(self, audio_type, raw_data, transcript, audio_format=None, sample_id=None):
         """
         Parameters
@@ -487,8 +500,122 @@ class TarWriter:  # pylint: disable=too-many-instance-attributes
         self.close()
 
 
+def get_tfrecord_shards(tfrecord_filename):
+    """
+    Resolves a TFRecord data-set name to its shard files.
+
+    Parameters
+    ----------
+    tfrecord_filename : str
+        Path as provided to TFRecordWriter - either a single TFRecord file
+        or the common name of shards like <name>-00000-of-00004.tfrecord
+
+    Returns
+    -------
+    list of str: Paths to the shard files
+    """
+    import tensorflow as tf  # pylint: disable=import-outside-toplevel
+    if tf.io.gfile.exists(tfrecord_filename):
+        return [tfrecord_filename]
+    base, ext = os.path.splitext(tfrecord_filename)
+    shards = sorted(tf.io.gfile.glob('{}-*-of-*{}'.format(base, ext)))
+    if not shards:
+        raise RuntimeError('No TFRecord file or shards found for "{}"'.format(tfrecord_filename))
+    return shards
+
+
+class TFRecordWriter:
+    """Sample collection writer for writing samples as WAV encoded tf.train.Example records to (sharded) TFRecord
+    files. Such data-sets are read by TensorFlow itself and don't require Python during feeding."""
+    def __init__(self,
+                 tfrecord_filename,
+                 num_shards=1,
+                 id_prefix=None,
+                 labeled=True):
+        """
+        Parameters
+        ----------
+        tfrecord_filename : str
+            Path to the TFRecord file to write. If num_shards > 1, this is the common name of the shard files
+            <name>-<index>-of-<num_shards>.tfrecord
+        num_shards : int
+            Number of shard files to distribute the samples to. Samples are distributed round-robin,
+            so that interleaved reading of the shards approximately keeps their original order.
+        id_prefix : str
+            Prefix for IDs of written samples - defaults to tfrecord_filename
+        labeled : bool or None
+            If True: Writes labeled samples (util.sample_collections.LabeledSample) only.
+            If False: Ignores transcripts (if available) and writes (unlabeled) util.audio.Sample instances.
+        """
+        import tensorflow as tf  # pylint: disable=import-outside-toplevel
+        self.tf = tf
+        self.id_prefix = tfrecord_filename if id_prefix is None else id_prefix
+        self.labeled = labeled
+        if num_shards > 1:
+            base, ext = os.path.splitext(tfrecord_filename)
+            filenames = ['{}-{:05d}-of-{:05d}{}'.format(base, i, num_shards, ext) for i in range(num_shards)]
+        else:
+            filenames = [tfrecord_filename]
+        self.writers = [tf.io.TFRecordWriter(filename) for filename in filenames]
+        self.num_samples = 0
+
+    def __enter__(self):
+        return self
+
+    def _bytes_feature(self, value):
+        return self.tf.train.Feature(bytes_list=self.tf.train.BytesList(value=[value]))
+
+    def add(self, sample):
+        sample.change_audio_type(AUDIO_TYPE_WAV)
+        sample.sample_id = '{}:{}'.format(self.id_prefix, self.num_samples)
+        feature = {
+            TFRECORD_SAMPLE_ID_KEY: self._bytes_feature(sample.sample_id.encode()),
+            TFRECORD_WAV_KEY: self._bytes_feature(sample.audio.getvalue())
+        }
+        if self.labeled:
+            feature[TFRECORD_TRANSCRIPT_KEY] = self._bytes_feature(sample.transcript.encode())
+        example = self.tf.train.Example(features=self.tf.train.Features(feature=feature))
+        self.writers[self.num_samples % len(self.writers)].write(example.SerializeToString())
+        self.num_samples += 1
+        return sample.sample_id
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+
+    def __len__(self):
+        return self.num_samples
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class StringColumn:
+    """Compact column of strings, stored as one UTF-8 encoded blob plus offsets."""
+    __slots__ = ['blob', 'offsets']
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [string.encode('utf8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(b''.join(encoded), offsets)
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode('utf8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
 class SampleList:
-    """Sample collection base class with samples loaded from a list of in-memory paths."""
+    """Sample collection base class with samples loaded from a list of in-memory paths.
+    Paths, file-sizes and transcripts are kept in columnar form (see StringColumn)."""
     def __init__(self, samples, labeled=True, reverse=False):
         """
         Parameters
@@ -501,21 +628,37 @@ class SampleList:
         reverse : bool
             If the order of the samples should be reversed
         """
+        samples = list(samples)
+        self._set_columns(StringColumn.from_strings(sample[0] for sample in samples),
+                          np.array([sample[1] for sample in samples], dtype=np.int64),
+                          StringColumn.from_strings(sample[2] for sample in samples) if labeled else None,
+                          labeled=labeled,
+                          reverse=reverse)
+
+    def _set_columns(self, filenames, sizes, transcripts, labeled=True, reverse=False):
         self.labeled = labeled
-        self.samples = list(samples)
-        self.samples.sort(key=lambda r: r[1], reverse=reverse)
+        self.filenames = filenames
+        self.sizes = sizes
+        self.transcripts = transcripts
+        # Stable sorting (keeps original order of samples with equal sizes - also in reverse)
+        self.order = np.argsort(-sizes if reverse else sizes, kind='stable')
+
+    def _get_filename(self, index):
+        return self.filenames[index]
 
     def __getitem__(self, i):
-        sample_spec = self.samples[i]
-        return load_sample(sample_spec[0], label=sample_spec[2] if self.labeled else None)
+        index = self.order[i]
+        return load_sample(self._get_filename(index), label=self.transcripts[index] if self.labeled else None)
 
     def __len__(self):
-        return len(self.samples)
+        return len(self.order)
 
 
 class CSV(SampleList):
     """Sample collection reader for reading a DeepSpeech CSV file
-    Automatically orders samples by CSV column wav_filesize (if available)."""
+    Automatically orders samples by CSV column wav_filesize (if available).
+    The parsed columns of local CSV files are cached in a binary sidecar file (<csv_filename>.index.npz)
+    that gets rebuilt whenever size or modification time of the CSV file change."""
     def __init__(self, csv_filename, labeled=None, reverse=False):
         """
         Parameters
@@ -530,31 +673,201 @@ class CSV(SampleList):
         reverse : bool
             If the order of the samples should be reversed
         """
-        rows = []
+        self.csv_dir = Path(csv_filename).parent
+        columns = None
+        index_filename = csv_filename + CSV_INDEX_SUFFIX
+        if not is_remote_path(csv_filename):
+            columns = self._read_index(csv_filename, index_filename)
+        if columns is None:
+            columns = self._parse(csv_filename)
+            if not is_remote_path(csv_filename):
+                self._write_index(csv_filename, index_filename, columns)
+        filenames, sizes, transcripts = columns
+        if transcripts is not None:
+            if labeled is None:
+                labeled = True
+        elif labeled:
+            raise RuntimeError('No transcript data (missing CSV column)')
+        self._set_columns(filenames, sizes, transcripts, labeled=labeled, reverse=reverse)
+
+    @staticmethod
+    def _parse(csv_filename):
+        filenames, sizes, transcripts = [], [], []
         with open_remote(csv_filename, 'r', encoding='utf8') as csv_file:
-            reader = csv.DictReader(csv_file)
-            if 'transcript' in reader.fieldnames:
-                if labeled is None:
-                    labeled = True
-            elif labeled:
-                raise RuntimeError('No transcript data (missing CSV column)')
+            reader = csv.reader(csv_file)
+            fieldnames = next(reader, [])
+            filename_column = fieldnames.index('wav_filename')
+            size_column = fieldnames.index('wav_filesize') if 'wav_filesize' in fieldnames else None
+            transcript_column = fieldnames.index('transcript') if 'transcript' in fieldnames else None
             for row in reader:
-                wav_filename = Path(row['wav_filename'])
-                if not wav_filename.is_absolute() and not is_remote_path(row['wav_filename']):
-                    wav_filename = Path(csv_filename).parent / wav_filename
-                    wav_filename = str(wav_filename)
-                else:
-                    # Pathlib otherwise removes a / from filenames like hdfs://
-                    wav_filename = row['wav_filename']
-                wav_filesize = int(row['wav_filesize']) if 'wav_filesize' in row else 0
-                if labeled:
-                    rows.append((wav_filename, wav_filesize, row['transcript']))
-                else:
-                    rows.append((wav_filename, wav_filesize))
-        super(CSV, self).__init__(rows, labeled=labeled, reverse=reverse)
-
-
-def samples_from_source(sample_source, buffering=BUFFER_SIZE, labeled=None, reverse=False):
+                filenames.append(row[filename_column])
+                sizes.append(int(row[size_column]) if size_column is not None else 0)
+                if transcript_column is not None:
+                    transcripts.append(row[transcript_column])
+        return (StringColumn.from_strings(filenames),
+                np.array(sizes, dtype=np.int64),
+                StringColumn.from_strings(transcripts) if transcript_column is not None else None)
+
+    @staticmethod
+    def _get_csv_stat(csv_filename):
+        stat = os.stat(csv_filename)
+        return np.array([CSV_INDEX_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    @staticmethod
+    def _read_index(csv_filename, index_filename):
+        try:
+            with np.load(index_filename) as index:
+                if not np.array_equal(index['stat'], CSV._get_csv_stat(csv_filename)):
+                    return None
+                transcripts = None
+                if 'transcripts_blob' in index:
+                    transcripts = StringColumn(index['transcripts_blob'].tobytes(), index['transcripts_offsets'])
+                return (StringColumn(index['filenames_blob'].tobytes(), index['filenames_offsets']),
+                        index['sizes'],
+                        transcripts)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @staticmethod
+    def _write_index(csv_filename, index_filename, columns):
+        filenames, sizes, transcripts = columns
+        arrays = {
+            'stat': CSV._get_csv_stat(csv_filename),
+            'filenames_blob': np.frombuffer(filenames.blob, dtype=np.uint8),
+            'filenames_offsets': filenames.offsets,
+            'sizes': sizes
+        }
+        if transcripts is not None:
+            arrays['transcripts_blob'] = np.frombuffer(transcripts.blob, dtype=np.uint8)
+            arrays['transcripts_offsets'] = transcripts.offsets
+        tmp_filename = '{}.{}.tmp'.format(index_filename, os.getpid())
+        try:
+            with open(tmp_filename, 'wb') as index_file:
+                np.savez(index_file, **arrays)
+            os.replace(tmp_filename, index_filename)
+        except OSError:
+            # Index caching is optional (e.g. read-only data directories)
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+    def _get_filename(self, index):
+        filename = self.filenames[index]
+        if not is_remote_path(filename) and not Path(filename).is_absolute():
+            return str(self.csv_dir / filename)
+        # Pathlib otherwise removes a / from filenames like hdfs://
+        return filename
+
+
+def get_shard_indices(num_samples, num_shards, shard_index, drop_remainder=False):
+    """
+    Computes the sample indices of one shard of a collection that is ordered by sample length.
+    Shards take turns in snake order (0, 1, ..., n-1, n-1, ..., 1, 0, 0, 1, ...), so that all shards get
+    samples of about the same total length.
+
+    Parameters
+    ----------
+    num_samples : int
+        Number of samples in the collection
+    num_shards : int
+        Number of shards (e.g. the number of Horovod ranks)
+    shard_index : int
+        Index of the shard to compute the sample indices for
+    drop_remainder : bool
+        If trailing samples should be dropped, so that all shards have the same number of samples
+
+    Returns
+    -------
+    numpy.ndarray of int64 sample indices
+    """
+    if drop_remainder:
+        num_samples -= num_samples % num_shards
+    positions = np.arange(num_samples, dtype=np.int64)
+    offsets = positions % num_shards
+    odd_blocks = (positions // num_shards) % 2 == 1
+    offsets[odd_blocks] = num_shards - 1 - offsets[odd_blocks]
+    return positions[offsets == shard_index]
+
+
+class Shard:
+    """Indexed view on a subset of a sample collection - see get_shard_indices"""
+    def __init__(self, collection, num_shards, shard_index, drop_remainder=False):
+        self.collection = collection
+        self.indices = get_shard_indices(len(collection), num_shards, shard_index, drop_remainder=drop_remainder)
+
+    def __getitem__(self, i):
+        return self.collection[int(self.indices[i])]
+
+    def __iter__(self):
+        for index in self.indices:
+            yield self.collection[int(index)]
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def get_mix_counts(sizes, weights=None, temperature=1.0):
+    """
+    Computes how many samples to draw from each source of a mix, keeping the total number of samples.
+    Source i is drawn with probability proportional to (weights[i] * sizes[i]) ** (1 / temperature).
+    Weights are relative: a source gets over-sampled if its weight is above the size-weighted mean weight
+    (e.g. weights 2.0 and 1.0 for two sources of equal size draw 4/3 and 2/3 of their samples).
+    Temperatures > 1 flatten the distribution towards small sources.
+    """
+    sizes = np.asarray(sizes, dtype=np.float64)
+    weights = np.ones(len(sizes)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if len(weights) != len(sizes):
+        raise ValueError('Number of weights ({}) does not match number of sources ({})'.format(len(weights), len(sizes)))
+    if temperature <= 0 or np.any(weights < 0):
+        raise ValueError('Mixing weights have to be non-negative and temperature has to be positive')
+    probabilities = (weights * sizes) ** (1.0 / temperature)
+    probabilities /= probabilities.sum()
+    return np.round(probabilities * sizes.sum()).astype(np.int64)
+
+
+class WeightedMix:
+    """
+    Indexed collection that mixes sorted sample collections with per source sampling rates (see get_mix_counts).
+    Over- and sub-sampling picks evenly spaced samples from each source. As all sources are ordered by length,
+    the mix gets approximately ordered by length by merging on the relative positions of the picked samples -
+    without reading any sample or its duration. Samples are only read on access.
+    """
+    def __init__(self, collections, weights=None, temperature=1.0, epoch=0):
+        self.collections = collections
+        counts = get_mix_counts([len(c) for c in collections], weights=weights, temperature=temperature)
+        # Shifting picks per epoch, so that sub-sampled sources get fully covered over several epochs
+        shift = (epoch * 0.6180339887498949) % 1.0
+        positions, sources, indices = [], [], []
+        for source_index, (collection, count) in enumerate(zip(collections, counts)):
+            if count == 0:
+                continue
+            position = (np.arange(count) + shift) / count
+            positions.append(position)
+            sources.append(np.full(count, source_index, dtype=np.int32))
+            indices.append(np.floor(position * len(collection)).astype(np.int64))
+        if not positions:
+            raise ValueError('All mixing weights are zero')
+        order = np.argsort(np.concatenate(positions), kind='stable')
+        self.sources = np.concatenate(sources)[order]
+        self.indices = np.concatenate(indices)[order]
+
+    def __getitem__(self, i):
+        return self.collections[self.sources[i]][int(self.indices[i])]
+
+    def __iter__(self):
+        for source_index, index in zip(self.sources, self.indices):
+            yield self.collections[source_index][int(index)]
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def samples_from_source(sample_source,
+                        buffering=BUFFER_SIZE,
+                        labeled=None,
+                        reverse=False,
+                        num_shards=1,
+                        shard_index=0,
+                        drop_remainder=False):
     """
     Loads samples from a sample source file.
 
@@ -571,6 +884,12 @@ def samples_from_source(sample_source, buffering=BUFFER_SIZE, labeled=None, reve
         (reading util.sample_collections.LabeledSample instances) or not (reading util.audio.Sample instances).
     reverse : bool
         If the order of the samples should be reversed
+    num_shards : int
+        Number of shards to split the samples into (e.g. one per Horovod rank)
+    shard_index : int
+        Index of the shard to load - only its samples will ever be read
+    drop_remainder : bool
+        If trailing samples should be dropped, so that all shards have the same number of samples
 
     Returns
     -------
@@ -578,16 +897,31 @@ def samples_from_source(sample_source, buffering=BUFFER_SIZE, labeled=None, reve
     """
     ext = os.path.splitext(sample_source)[1].lower()
     if ext == '.sdb':
-        return SDB(sample_source, buffering=buffering, labeled=labeled, reverse=reverse)
-    if ext == '.csv':
-        return CSV(sample_source, labeled=labeled, reverse=reverse)
-    raise ValueError('Unknown file type: "{}"'.format(ext))
-
-
-def samples_from_sources(sample_sources, buffering=BUFFER_SIZE, labeled=None, reverse=False):
+        samples = SDB(sample_source, buffering=buffering, labeled=labeled, reverse=reverse)
+    elif ext == '.csv':
+        samples = CSV(sample_source, labeled=labeled, reverse=reverse)
+    else:
+        raise ValueError('Unknown file type: "{}"'.format(ext))
+    if num_shards > 1:
+        samples = Shard(samples, num_shards, shard_index, drop_remainder=drop_remainder)
+    return samples
+
+
+def samples_from_sources(sample_sources,
+                         buffering=BUFFER_SIZE,
+                         labeled=None,
+                         reverse=False,
+                         num_shards=1,
+                         shard_index=0,
+                         drop_remainder=False,
+                         weights=None,
+                         temperature=1.0,
+                         epoch=0):
     """
     Loads and combines samples from a list of source files. Sources are combined in an interleaving way to
     keep default sample order from shortest to longest.
+    If weights or a temperature are provided, sources get mixed with the according sampling rates instead
+    (see WeightedMix) - keeping an approximate order by length.
 
     Note that when using distributed training, it is much faster to call this function with single pre-
     sorted sample source, because this allows for parallelization of the file I/O. (If this function is
@@ -607,6 +941,20 @@ def samples_from_sources(sample_sources, buffering=BUFFER_SIZE, labeled=None, re
         util.audio.Sample instances from sources with no transcripts.
     reverse : bool
         If the order of the samples should be reversed
+    num_shards : int
+        Number of shards to split the samples into (e.g. one per Horovod rank).
+        Every source is split separately, so that each shard gets its share of all sources.
+    shard_index : int
+        Index of the shard to load - only its samples will ever be read
+    drop_remainder : bool
+        If trailing samples of each source should be dropped, so that all shards have the same number of samples
+    weights : list of float
+        Relative per source mixing weights (0.0 for not using a source) - the number of samples per epoch stays the
+        total size of all sources, so weights only shift shares between sources (see get_mix_counts)
+    temperature : float
+        Temperature for flattening (> 1.0) or sharpening (< 1.0) the distribution of samples among sources
+    epoch : int
+        Epoch number - varies the samples that are picked from over- or sub-sampled sources
 
     Returns
     -------
@@ -617,13 +965,23 @@ def samples_from_sources(sample_sources, buffering=BUFFER_SIZE, labeled=None, re
     sample_sources = list(sample_sources)
     if len(sample_sources) == 0:
         raise ValueError('No files')
+    shard_args = dict(num_shards=num_shards, shard_index=shard_index, drop_remainder=drop_remainder)
     if len(sample_sources) == 1:
-        return samples_from_source(sample_sources[0], buffering=buffering, labeled=labeled, reverse=reverse)
+        return samples_from_source(sample_sources[0], buffering=buffering, labeled=labeled, reverse=reverse,
+                                   **shard_args)
+
+    if weights is not None or temperature != 1.0:
+        return WeightedMix([samples_from_source(source, buffering=buffering, labeled=labeled, reverse=reverse,
+                                                **shard_args) for source in sample_sources],
+                           weights=weights,
+                           temperature=temperature,
+                           epoch=epoch)
 
     # If we wish to interleave based on duration, we have to unpack the audio. Note that this unpacking should
     # be done lazily onn the fly so that it respects the LimitingPool logic used in the feeding code.
     cols = [LenMap(
-        unpack_maybe, samples_from_source(source, buffering=buffering, labeled=labeled, reverse=reverse))
+        unpack_maybe, samples_from_source(source, buffering=buffering, labeled=labeled, reverse=reverse,
+                                          **shard_args))
         for source in sample_sources]
 
     return Interleaved(*cols, key=lambda s: s.duration, reverse=reverse)